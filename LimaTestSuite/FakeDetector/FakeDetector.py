@@ -0,0 +1,27 @@
+from LimaTestSuite.LimaDetector import SpecificDetector
+from LimaTestSuite import LimaFakeCore
+
+
+class FakeDetector(SpecificDetector):
+    """
+    In-process simulated detector, which does not need Lima nor any
+    hardware. The simulation is configured from the extra options of the
+    Detector section:
+
+    * width, height, depth: frame size (pixels and bytes per pixel)
+    * maxFrameRate: maximum frame rate in Hz
+    * savingLatency: time to save one frame in seconds
+    * writeFiles: write dummy files in the saving directory
+    * bufferMemory: memory in MB the buffer maxMemory is a percentage of
+    """
+    def __init__(self, host, port, width=1024, height=1024, depth=2,
+                 maxFrameRate=None, savingLatency=0.0, writeFiles=True,
+                 bufferMemory=1024):
+        super(FakeDetector, self).__init__()
+        self.hwint = LimaFakeCore.FakeInterface(width, height, depth,
+                                                maxFrameRate, savingLatency,
+                                                writeFiles, bufferMemory)
+        self.ct = LimaFakeCore.CtControl(self.hwint)
+
+    def get_control(self):
+        return self.ct
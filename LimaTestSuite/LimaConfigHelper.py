@@ -1,7 +1,68 @@
 import os
+import re
+import ast
+import math
+import json
+import hashlib
+import itertools
 import ConfigParser
 import logging
-from LimaTestSuite import create_test_folder, debug
+from LimaTestSuite import create_test_folder, debug, _str2bool, \
+    _str2intlist, _str2boollist, _str2list
+
+
+SWEEP_RE = re.compile(r'^sweep\((.*)\)$')
+LIST_RE = re.compile(r'^\[(.*)\]$')
+
+
+def parse_sweep(value):
+    """
+    Parse the values of a swept parameter. Two syntaxes are supported:
+
+    * sweep(start, stop, n[, lin|log]): n values from start to stop, linearly
+      (default) or logarithmically spaced.
+    * [a, b, c]: list of values.
+
+    :param value: raw value from the configuration file
+    :return: list of values or None if the value is not a sweep
+    """
+    value = value.strip()
+    match = SWEEP_RE.match(value)
+    if match:
+        args = [a.strip() for a in match.group(1).split(',')]
+        if len(args) not in (3, 4):
+            raise ValueError('Invalid sweep definition: %s' % value)
+        start, stop, n = float(args[0]), float(args[1]), int(args[2])
+        scale = args[3].lower() if len(args) == 4 else 'lin'
+        if n < 2:
+            return [start]
+        if scale == 'log':
+            if start <= 0 or stop <= 0:
+                raise ValueError('Log sweep needs positive limits: %s' % value)
+            step = (math.log10(stop) - math.log10(start)) / (n - 1)
+            return [10 ** (math.log10(start) + i * step) for i in range(n)]
+        elif scale == 'lin':
+            step = (stop - start) / (n - 1)
+            return [start + i * step for i in range(n)]
+        raise ValueError('Invalid sweep scale %s: %s' % (scale, value))
+    match = LIST_RE.match(value)
+    if match:
+        return [v.strip() for v in match.group(1).split(',') if v.strip()]
+    return None
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return '%g' % value
+    if isinstance(value, (list, tuple)):
+        return 'x'.join(_format_value(v) for v in value)
+    return str(value)
+
+
+def _convert(t, value):
+    if t is int and isinstance(value, float):
+        return int(round(value))
+    return t(value)
 
 
 class LimaTestConfiguration(object):
@@ -26,23 +87,148 @@ class LimaTestConfiguration(object):
                    'nbframes': int
                    }
 
+    # Optional saving parameters, the detector keeps its own value when they
+    # are not given: maximum number of concurrent writing tasks
+    SAVING_TASK_KEYS = {'maxConcurrentWritingTask': int,
+                        }
+
+    # Optional CtBuffer parameters: number of buffers and maximum memory
+    # used by the buffers (percent of the host memory)
+    BUFFER_KEYS = {'nbBuffers': int,
+                   'maxMemory': int,
+                   }
+
+    # Optional CtImage parameters: binning (x, y), ROI (x, y, width, height)
+    # in the binned and rotated image, flip (x, y) and rotation in degrees
+    IMAGE_KEYS = {'bin': _str2intlist,
+                  'roi': _str2intlist,
+                  'flip': _str2boollist,
+                  'rotation': int,
+                  }
+
+    # Options of the test itself, not sent to the detector
+    TEST_KEYS = {'verify': _str2bool,
+                 'sampleRate': float,
+                 'stallTimeout': float,
+                 'checkFrames': _str2bool,
+                 'readBatch': int,
+                 'minMean': float,
+                 'maxMean': float,
+                 'maxSaturated': int,
+                 'maxDead': int,
+                 'saturation': int,
+                 'readBatchSizes': _str2intlist,
+                 'readFrames': int,
+                 'iterations': int,
+                 'abortAfterFrames': int,
+                 'abortAfterTime': float,
+                 'soakCycles': int,
+                 'soakDuration': float,
+                 'maxRssGrowth': float,
+                 'maxDegradation': float,
+                 'resourceRate': float,
+                 'targetFps': float,
+                 'bufferSweep': str,
+                 'bufferValues': _str2intlist,
+                 'modeFactor': int,
+                 'formats': _str2list,
+                 'framesPerFileValues': _str2intlist,
+                 'sortBy': str,
+                 'keepFiles': _str2bool,
+                 'writerTasks': _str2intlist,
+                 }
+
+    # Default file suffix of each format, used when the format is swept
+    FILE_SUFFIXES = {'CBF': '.cbf',
+                     'CBF_MINI_HEADER': '.cbf',
+                     'EDF': '.edf',
+                     'EDF_CONCAT': '.edf',
+                     'EDF_GZ': '.edf.gz',
+                     'EDF_LZ4': '.edf.lz4',
+                     'HDF5': '.h5',
+                     'NXS': '.nxs',
+                     'RAW': '.raw',
+                     'TIFF': '.tiff',
+                     'FITZ': '.fits',
+                     }
+
     def __init__(self, name, ttype, repeat, det_type, host, port, acq, saving,
-                 device_name):
+                 device_name, test_params=None, base_dir=None, sweep=None,
+                 det_params=None, buffer=None, image=None):
         self.name = name
         self.type = ttype
         self.repeat = repeat
+        # Runs done before the measured ones and precision wanted for the
+        # repeated runs (see LimaRepeatSuite)
+        self.warmup = 0
+        self.ci_target = None
+        self.ci_metric = None
+        self.max_repeat = None
         self.det_type = det_type
         self.host = host
         self.port = port
         self.device_name = device_name
+        # Extra arguments of the detector plugin
+        self.det_params = det_params or {}
+        # Test section in the configuration file the test comes from
+        self.section = name
+        self.base_dir = base_dir
+        # Values of the swept parameters of the test, if any
+        self.sweep = sweep or {}
         self.acq_params = {}
         self.saving_params = {}
+        self.test_params = {}
+        # Only the buffer and image parameters given in the configuration
+        # file
+        self.buffer_params = {}
+        self.image_params = {}
 
         # Update detector configuration defaults
         self.acq_params.update(acq)
         self.saving_params.update(saving)
+        if buffer:
+            self.buffer_params.update(buffer)
+        if image:
+            self.image_params.update(image)
+        if test_params:
+            self.test_params.update(test_params)
+
+    def create_folder(self):
+        """
+        Create the test folder, if not done yet, and set it as saving
+        directory. It is called when the test runs so no folder is created
+        while the configuration is parsed.
 
-    def get_copy(self, name, type, repeat, acq, saving):
+        :return: test folder
+        """
+        if 'directory' not in self.saving_params:
+            path = create_test_folder(self.name, base_dir=self.base_dir)
+            self.saving_params['directory'] = path
+        return self.saving_params['directory']
+
+    def get_hash(self):
+        """
+        Hash identifying the test configuration, regardless of its name and
+        test folder, used to compare runs of the same configuration.
+
+        :return: hexadecimal string
+        """
+        saving = dict(self.saving_params)
+        saving.pop('directory', None)
+        config = {'type': self.type,
+                  'det_type': self.det_type,
+                  'acq': self.acq_params,
+                  'saving': saving,
+                  'test': self.test_params,
+                  }
+        if self.buffer_params:
+            config['buffer'] = self.buffer_params
+        if self.image_params:
+            config['image'] = self.image_params
+        return hashlib.sha1(json.dumps(config, sort_keys=True)).hexdigest()
+
+    def get_copy(self, name, type, repeat, acq, saving, test_params=None,
+                 base_dir=None, sweep=None, buffer=None, image=None):
         """
         Copy default configuration overwriting specific config
 
@@ -51,16 +237,28 @@ class LimaTestConfiguration(object):
         :param repeat:
         :param acq:
         :param saving:
+        :param test_params:
+        :param base_dir: folder where the test folder is created
+        :param sweep: values of the swept parameters
+        :param buffer: buffer parameters
+        :param image: image parameters
         :return:
         """
 
         acq_params = self.acq_params.copy()
         saving_params = self.saving_params.copy()
+        buffer_params = self.buffer_params.copy()
+        image_params = self.image_params.copy()
         acq_params.update(acq)
         saving_params.update(saving)
+        buffer_params.update(buffer or {})
+        image_params.update(image or {})
         return LimaTestConfiguration(name, type, repeat, self.det_type,
                                      self.host, self.port, acq_params,
-                                     saving_params, self.device_name)
+                                     saving_params, self.device_name,
+                                     test_params, base_dir, sweep,
+                                     self.det_params, buffer_params,
+                                     image_params)
 
 
 class LimaTestParser(object):
@@ -70,6 +268,15 @@ class LimaTestParser(object):
 
     :param filename: name of the configuration file
     """
+
+    # Options of the repeated runs of a test: configuration attribute and
+    # type of each key
+    REPEAT_KEYS = {'warmup': ('warmup', int),
+                   'ciTarget': ('ci_target', float),
+                   'ciMetric': ('ci_metric', str),
+                   'maxRepeat': ('max_repeat', int),
+                   }
+
     def __init__(self, filename):
         self.logger = logging.getLogger('LimaTestSuite')
         self.config = ConfigParser.RawConfigParser()
@@ -84,20 +291,18 @@ class LimaTestParser(object):
                                  'Acq': 'AcqDefaults',
                                  'Saving': 'SavingDefaults',
                                  'Tango': 'Tango',
+                                 'Buffer': 'Buffer',
+                                 'Image': 'Image',
                                  }
 
         self.default_test = None
-        self.tests = []
-
-        self.load_default_test()
-        self.load_tests()
 
-    @debug
-    def load_default_test(self):
+    def get_detector(self):
         """
-        Load info about detector and default test configuration.
+        Read the detector identification from the Detector and Tango sections.
+
+        :return: (det_type, host, port, device_name)
         """
-        self.logger.debug("Loading default configuration")
         det_type = self.config.get(self.default_sections['Detector'], 'type')
         det_type += 'Detector'
         host = eval(self.config.get(self.default_sections['Detector'], 'host'))
@@ -107,6 +312,84 @@ class LimaTestParser(object):
                                           'LimaCCD')
         else:
             device_name = None
+        return det_type, host, port, device_name
+
+    def get_detector_key(self, tango_mode=False):
+        """
+        Identify the detector the tests run against: the LimaCCD device in
+        Tango mode, the plugin and its host and port in Core mode.
+
+        :param tango_mode: True if the tests access the detector through
+                           its Tango device
+        :return: tuple
+        """
+        det_type, host, port, device_name = self.get_detector()
+        if tango_mode:
+            return (device_name,)
+        return det_type, host, port
+
+    def get_detector_params(self):
+        """
+        Read the extra options of the Detector section, passed as keyword
+        arguments to the detector plugin.
+
+        :return: dictionary
+        """
+        params = {}
+        section = self.default_sections['Detector']
+        for key, value in self.config.items(section):
+            if key in ('type', 'host', 'port'):
+                continue
+            try:
+                params[key] = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                params[key] = value
+        return params
+
+    def _get_optional_params(self, name, keys):
+        """
+        Read an optional defaults section.
+
+        :param name: section name in default_sections
+        :param keys: dictionary with the valid keys and their type
+        :return: dictionary with the parameters given
+        """
+        params = {}
+        section = self.default_sections[name]
+        if not self.config.has_section(section):
+            return params
+        for key, value in self.config.items(section):
+            if key not in keys:
+                msg = 'Non valid key <%s> found in %s' % (key, section)
+                raise Exception(msg)
+            params[key] = keys[key](value)
+        return params
+
+    def get_buffer_params(self):
+        """
+        Read the optional Buffer section.
+
+        :return: dictionary with the buffer parameters given
+        """
+        return self._get_optional_params('Buffer',
+                                         LimaTestConfiguration.BUFFER_KEYS)
+
+    def get_image_params(self):
+        """
+        Read the optional Image section.
+
+        :return: dictionary with the image parameters given
+        """
+        return self._get_optional_params('Image',
+                                         LimaTestConfiguration.IMAGE_KEYS)
+
+    @debug
+    def load_default_test(self):
+        """
+        Load info about detector and default test configuration.
+        """
+        self.logger.debug("Loading default configuration")
+        det_type, host, port, device_name = self.get_detector()
 
         acq = {}
         saving = {}
@@ -124,6 +407,11 @@ class LimaTestParser(object):
                 value = t(self.config.get(saving_section, param))
                 saving.update({param: value})
 
+            for param, t in LimaTestConfiguration.SAVING_TASK_KEYS.iteritems():
+                if self.config.has_option(saving_section, param):
+                    value = t(self.config.get(saving_section, param))
+                    saving.update({param: value})
+
         except Exception as e:
             msg = 'Parameter not supplied in default configuration'
             self.logger.warning('%s\n%s' % (e, msg))
@@ -135,9 +423,11 @@ class LimaTestParser(object):
             self.logger.warning("The default values set is not complete")
             return None
 
-        self.default_test = LimaTestConfiguration('', None, 1, det_type, host,
-                                                  port, acq, saving,
-                                                  device_name)
+        self.default_test = LimaTestConfiguration(
+            '', None, 1, det_type, host, port, acq, saving, device_name,
+            det_params=self.get_detector_params(),
+            buffer=self.get_buffer_params(),
+            image=self.get_image_params())
         if self.default_test is not None:
             self.logger.debug("Default configuration loaded successfully")
         else:
@@ -152,61 +442,121 @@ class LimaTestParser(object):
     def load_tests(self):
         """
         Load each test configuration create a test by updating default test.
-        :return: None
+        The configurations are generated lazily.
+        :return: generator of LimaTestConfiguration
         """
+        self.load_default_test()
         for test in self._get_tests_list():
-            t = self.load_test(test)
-            self.tests.append(t)
+            for t in self.load_test(test):
+                yield t
+
+    def _parse_key(self, key, value, name):
+        """
+        Convert a test value according to its key.
+
+        :return: (group, value) where group is 'acq', 'saving', 'buffer',
+                 'image' or 'test'
+        """
+        if key in LimaTestConfiguration.ACQ_KEYS:
+            return 'acq', _convert(LimaTestConfiguration.ACQ_KEYS[key], value)
+        elif key in LimaTestConfiguration.SAVING_KEYS:
+            return 'saving', _convert(LimaTestConfiguration.SAVING_KEYS[key],
+                                      value)
+        elif key in LimaTestConfiguration.SAVING_TASK_KEYS:
+            return 'saving', _convert(
+                LimaTestConfiguration.SAVING_TASK_KEYS[key], value)
+        elif key in LimaTestConfiguration.BUFFER_KEYS:
+            return 'buffer', _convert(LimaTestConfiguration.BUFFER_KEYS[key],
+                                      value)
+        elif key in LimaTestConfiguration.IMAGE_KEYS:
+            return 'image', _convert(LimaTestConfiguration.IMAGE_KEYS[key],
+                                     value)
+        elif key in LimaTestConfiguration.TEST_KEYS:
+            return 'test', _convert(LimaTestConfiguration.TEST_KEYS[key],
+                                    value)
+        msg = 'Non valid test key <%s> found in test %s' % (key, name)
+        raise Exception(msg)
 
     def load_test(self, name):
         """
-        Load a test from configuration file.
-        :param config:
-        :return:
+        Load a test from configuration file. The parameters declared as a
+        sweep (see parse_sweep) are expanded into the Cartesian product of
+        their values, one configuration per combination.
+        :param name: test section name
+        :return: generator of LimaTestConfiguration
         """
-        acq = {}
-        saving = {}
+        values = {'acq': {}, 'saving': {}, 'buffer': {}, 'image': {},
+                  'test': {}}
+        swept = []
         t_type = None
         t_repeat = 1
+        repeat_params = {}
         base_dir = None
 
-        acq_keys = LimaTestConfiguration.ACQ_KEYS.keys()
-        saving_keys = LimaTestConfiguration.SAVING_KEYS.keys()
-
         t_dict = dict(self.config.items(name))
         self.logger.debug('Loading test %s values...' % name)
         for key, value in t_dict.iteritems():
             self.logger.debug('Updating value: %s = %s' % (key, value))
-            if key in acq_keys:
-                _value = LimaTestConfiguration.ACQ_KEYS[key](value)
-                acq.update({key: _value})
-            elif key in saving_keys:
-                _value = LimaTestConfiguration.SAVING_KEYS[key](value)
-                saving.update({key: _value})
-                if key.lower() == 'directory':
-                    base_dir = saving['directory']
-            elif key == "type":
+            if key == "type":
                 t_type = value
             elif key == "repeat":
                 t_repeat = int(value)
+            elif key in self.REPEAT_KEYS:
+                attr, t = self.REPEAT_KEYS[key]
+                repeat_params[attr] = t(value)
+            elif key.lower() == 'directory':
+                base_dir = value
             else:
-                msg = 'Non valid test key <%s> found in test %s' % (key, name)
-                raise Exception(msg)
-        path = create_test_folder(name, base_dir=base_dir)
-        saving.update({'directory': path})
-        self.logger.debug("Test directory is %s" % path)
-
-        if self.default_test and t_type:
-            test = self.default_test.get_copy(name, t_type, t_repeat, acq,
-                                              saving)
-        else:
+                sweep_values = parse_sweep(value)
+                if sweep_values is None:
+                    group, _value = self._parse_key(key, value, name)
+                    values[group].update({key: _value})
+                else:
+                    parsed = [self._parse_key(key, v, name)
+                              for v in sweep_values]
+                    # Integer parameters may repeat values after rounding
+                    unique = []
+                    for group, v in parsed:
+                        if v not in unique:
+                            unique.append(v)
+                    swept.append((key, group, unique))
+
+        if not (self.default_test and t_type):
             msg = 'Non valid test found, please review config file [%s, %s]' % \
                 (str(self.default_test), str(t_type))
             raise Exception(msg)
 
-        return test
+        swept_keys = [key for key, _, _ in swept]
+        for combination in itertools.product(*[v for _, _, v in swept]):
+            acq = values['acq'].copy()
+            saving = values['saving'].copy()
+            test_params = values['test'].copy()
+            buffer_params = values['buffer'].copy()
+            image_params = values['image'].copy()
+            groups = {'acq': acq, 'saving': saving, 'buffer': buffer_params,
+                      'image': image_params, 'test': test_params}
+            sweep = {}
+            for (key, group, _), value in zip(swept, combination):
+                groups[group].update({key: value})
+                sweep[key] = value
+            if 'fileFormat' in sweep and 'suffix' not in saving:
+                fmt = sweep['fileFormat'].upper()
+                suffix = LimaTestConfiguration.FILE_SUFFIXES.get(fmt)
+                if suffix is not None:
+                    saving.update({'suffix': suffix})
+
+            t_name = name
+            if swept:
+                t_name += ''.join('_%s=%s' % (key, _format_value(sweep[key]))
+                                  for key in swept_keys)
+            test = self.default_test.get_copy(t_name, t_type, t_repeat, acq,
+                                              saving, test_params, base_dir,
+                                              sweep, buffer_params,
+                                              image_params)
+            test.section = name
+            for attr, value in repeat_params.iteritems():
+                setattr(test, attr, value)
+            yield test
 
     def get_tests(self):
-        return self.tests
-
-
+        return self.load_tests()
@@ -0,0 +1,9 @@
+"""
+Lima Core module used by the test suite. When Lima is not installed the
+pure-Python stand-in LimaFakeCore is used instead, which only supports the
+Fake detector.
+"""
+try:
+    from Lima import Core
+except ImportError:
+    from LimaTestSuite import LimaFakeCore as Core
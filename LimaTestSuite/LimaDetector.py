@@ -2,8 +2,20 @@ import time
 import os
 import sys
 import logging
-from Lima import Core
+import threading
+from collections import namedtuple
+from LimaTestSuite.LimaCore import Core
 from LimaTestSuite import get_dict
+from LimaTestSuite.LimaTracer import traced
+
+
+# Acquisition status and image counters read at the same time
+LimaStatus = namedtuple('LimaStatus', ['acq_status',
+                                       'last_image',
+                                       'last_base_image_ready',
+                                       'last_image_ready',
+                                       'last_image_saved',
+                                       'last_counter_ready'])
 
 class SpecificDetector(object):
     def __init__(self):
@@ -28,6 +40,14 @@ class SpecificDetector(object):
         """
         return self.hwint
 
+    def get_control(self):
+        """
+        Optional method for Detector class, to provide the control object
+        instead of building a Lima CtControl on the hardware interface.
+        :return: control object or None
+        """
+        return None
+
     def get_acq_defaults(self):
         return self._AcqDefaults
 
@@ -37,6 +57,18 @@ class SpecificDetector(object):
 
 class LimaDetector(object):
 
+    # Configuration values written to the detectors and writes skipped
+    # because the value did not change
+    write_stats = {'sent': 0, 'saved': 0}
+
+    # Image parameters used when a test does not set them: full frame
+    # without any processing
+    IMAGE_DEFAULTS = {'bin': [1, 1],
+                      'roi': [0, 0, 0, 0],
+                      'flip': [False, False],
+                      'rotation': 0,
+                      }
+
     def __init__(self, config,):
         # A dictionary is defined for each Lima Core constants that has
         # a discrete set of possible values. The naming convention is:
@@ -60,7 +92,9 @@ class LimaDetector(object):
                             'TIFF': Core.CtSaving.TIFFFormat,
                             'FITZ': Core.CtSaving.FITS
                             }
-        self._acqMode = {'SINGLE': Core.Single
+        self._acqMode = {'SINGLE': Core.Single,
+                         'ACCUMULATION': Core.Accumulation,
+                         'CONCATENATION': Core.Concatenation
                          }
 
         self._savingMode = {'AUTO_FRAME': Core.CtSaving.AutoFrame,
@@ -69,41 +103,95 @@ class LimaDetector(object):
 
         self._overwritePolicy = {'OVERWRITE': Core.CtSaving.Overwrite
                                  }
+
+        self._rotation = {0: Core.Rotation_0,
+                          90: Core.Rotation_90,
+                          180: Core.Rotation_180,
+                          270: Core.Rotation_270
+                          }
         # Configuration test
         self._config = config
 
         # Configuration dictionaries for the Detector class
         self._AcqConfig = config.acq_params
         self._SavingConfig = config.saving_params
+        self._BufferConfig = config.buffer_params
+        self._ImageConfig = config.image_params
 
         # Just for statistics
         self.start_time = 0.0
         self.end_time = 0.0
 
+        # Set by the detector notifications when the events are enabled
+        self._event = threading.Event()
+
         self.logger = logging.getLogger('LimaTestSuite')
 
         # Initialize the HW
         self.init_hw()
         self.write_config_hw()
 
+    def configure(self, config):
+        """
+        Apply a new test configuration to an already initialized detector.
+
+        :param config: LimaTestConfiguration
+        :return: None
+        """
+        self._config = config
+        self._AcqConfig = config.acq_params
+        self._SavingConfig = config.saving_params
+        self._BufferConfig = config.buffer_params
+        self._ImageConfig = config.image_params
+        self.write_config_hw()
 
-    def _update_config_from_dict(self, config, params):
+    def _update_config_from_dict(self, config, params, force=False):
         """
         Update the parameters configuration with values from a configuration
-        dictionary.
+        dictionary. Only the parameters whose value differs from the current
+        one are set.
 
         :param config: configuration dictionary
         :param params: parameter structure to be filled
-        :return: None
+        :param force: set all the parameters even if they did not change
+        :return: number of parameters changed
         """
+        changed = 0
         for key, value in config.iteritems():
             par = key
-            msg = "Setting parameter %s = %s" % (par, value)
-            self.logger.debug(msg)
             value_dict = get_dict(self, key)
             if value_dict:
                 value = value_dict[value.upper()]
+            if not force and getattr(params, par, None) == value:
+                continue
+            self.logger.debug("Setting parameter %s = %s", par, value)
             setattr(params, par, value)
+            changed += 1
+        return changed
+
+    def get_image_config(self):
+        """
+        Image parameters of the test, completed with the defaults.
+
+        :return: dictionary
+        """
+        config = dict(self.IMAGE_DEFAULTS)
+        config.update(self._ImageConfig)
+        return config
+
+    def _count_writes(self, sent, saved):
+        """
+        Account the configuration values sent to the detector and the ones
+        skipped because they did not change.
+
+        :param sent: number of values written
+        :param saved: number of writes skipped
+        :return: None
+        """
+        LimaDetector.write_stats['sent'] += sent
+        LimaDetector.write_stats['saved'] += saved
+        self.logger.debug("Configuration writes: %d sent, %d saved", sent,
+                          saved)
 
     def set_acq_parameters(self, exp_time, frames, latency=0,
                            trigger='Internal', acq_mode='single'):
@@ -129,12 +217,31 @@ class LimaDetector(object):
         self._SavingConfig.update(d)
         self.write_config_hw()
 
+    def _notify(self):
+        """
+        Called from the detector notifications to wake up wait_event.
+        """
+        self._event.set()
+
+    @traced
+    def wait_event(self, timeout):
+        """
+        Wait until the detector notifies a change of its status or the
+        timeout expires.
+
+        :param timeout: maximum time to wait in seconds
+        :return: True if a notification was received, False otherwise
+        """
+        notified = self._event.wait(timeout)
+        self._event.clear()
+        return notified
+
     def print_config(self):
         for k, v in self._AcqConfig.iteritems():
-            self.logger.debug("Acquisition param: %s = %s" % (k, v))
+            self.logger.debug("Acquisition param: %s = %s", k, v)
 
         for k, v in self._AcqConfig.iteritems():
-            self.logger.debug("Saving param: %s = %s" % (k, v))
+            self.logger.debug("Saving param: %s = %s", k, v)
 
     @property
     def acq_status(self):
@@ -160,10 +267,58 @@ class LimaDetector(object):
     def status(self):
         raise NotImplemented('You should implement it')
 
+    @property
+    def frame_size(self):
+        raise NotImplemented('You should implement it')
+
+    @property
+    def lima_version(self):
+        raise NotImplemented('You should implement it')
+
+    @property
+    def buffer_memory(self):
+        """
+        Memory the maxMemory buffer parameter is a percentage of: the
+        physical memory of the host running the test, in bytes. In Tango
+        mode it is only right when the device server runs on the same host.
+        """
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+
+    def snapshot(self):
+        """
+        Read the acquisition status and all the image counters with a single
+        request to the detector, so the values are consistent with each other.
+
+        :return: LimaStatus
+        """
+        raise NotImplemented('You should implement it')
+
+    def get_cpu_time(self):
+        """
+        CPU time (user + system) used so far by the process which runs the
+        acquisition and the saving.
+
+        :return: time in seconds, None if it cannot be read
+        """
+        return None
+
+    def read_images(self, first, count, out=None):
+        """
+        Read back acquired frames from the detector buffer.
+
+        :param first: number of the first frame
+        :param count: number of consecutive frames
+        :param out: NumPy array (at least count frames) where the frames are
+                    copied, instead of returning the array read. The read
+                    itself still allocates the frames.
+        :return: NumPy array (count, height, width)
+        """
+        raise NotImplemented('You should implement it')
+
     def init_hw(self):
         raise NotImplemented('You should implement it')
 
-    def write_config_hw(self):
+    def write_config_hw(self, force=False):
         raise NotImplemented('You should implement it')
 
     def start(self):
@@ -172,6 +327,36 @@ class LimaDetector(object):
     def stop(self):
         raise NotImplemented('You should implement it')
 
+    def invalidate_cache(self):
+        """
+        Forget the configuration values written to the detector, so all of
+        them are written again by the next write_config_hw. To be called
+        when the detector state is unknown (e.g. an acquisition was left
+        running or the device was changed by another client).
+
+        :return: None
+        """
+        pass
+
+    def enable_events(self):
+        raise NotImplemented('You should implement it')
+
+    def disable_events(self):
+        raise NotImplemented('You should implement it')
+
+
+class _ImageStatusCallback(Core.CtControl.ImageStatusCallback):
+    """
+    Lima image status callback which forwards the notifications to the
+    detector.
+    """
+    def __init__(self, notify):
+        Core.CtControl.ImageStatusCallback.__init__(self)
+        self._notify = notify
+
+    def imageStatusChanged(self, img_status):
+        self._notify()
+
 
 class LimaCoreDetector(LimaDetector):
 
@@ -186,6 +371,11 @@ class LimaCoreDetector(LimaDetector):
         self.ct = None
         self.ct_save = None
         self.ct_acq = None
+        self.ct_buffer = None
+        self.ct_image = None
+        self._img_status_cb = None
+        # Image parameters set on the detector
+        self._image_written = {}
 
         try:
             det_type = self._config.det_type
@@ -201,7 +391,8 @@ class LimaCoreDetector(LimaDetector):
             module = __import__(det_type)
             class_name = '{0}'.format(det_type)
             # Create an instance of the detector class
-            det = getattr(module, class_name)(host, port)
+            det = getattr(module, class_name)(host, port,
+                                              **self._config.det_params)
         except Exception as e:
             msg = "ERROR: Cannot find plugin %s, %s " % (det_type, str(e))
             raise ImportError(msg)
@@ -211,47 +402,150 @@ class LimaCoreDetector(LimaDetector):
             self.hwi = det.get_hwinterface()
             # Common API from Lima
             # TODO Needs protection in case of problem constructing the detector
-            self.ct = Core.CtControl(self.hwi)
+            self.ct = det.get_control()
+            if self.ct is None:
+                self.ct = Core.CtControl(self.hwi)
             self.ct_acq = self.ct.acquisition()
             self.ct_save = self.ct.saving()
+            self.ct_buffer = self.ct.buffer()
+            self.ct_image = self.ct.image()
+            # Buffer parameters of the detector, restored when a test does
+            # not set them
+            buffer_pars = self.ct_buffer.getPars()
+            self._buffer_defaults = {'nbBuffers': buffer_pars.nbBuffers,
+                                     'maxMemory': buffer_pars.maxMemory}
+            # Number of writing tasks of the detector, restored when a test
+            # does not set it. Older Lima versions can not set it.
+            self._max_tasks_default = None
+            if hasattr(self.ct_save, 'getMaxConcurrentWritingTask'):
+                self._max_tasks_default = \
+                    self.ct_save.getMaxConcurrentWritingTask()
         except Exception as e:
             msg = "Cannot create Lima Control objects for detector, %s" % str(e)
             raise ValueError(msg)
 
     def __del__(self):
         self.logger.debug("Deleting")
+        self.disable_events()
         del self.ct_save
         del self.ct_acq
+        del self.ct_buffer
+        del self.ct_image
         del self.ct
         del self.hwi
         del self.cam
         # Wait for server to disconnect before any other re-connection
         time.sleep(0.1)
 
-    def write_config_hw(self):
+    @traced
+    def write_config_hw(self, force=False):
         """
-        Set the acquisition configuration from dictionary.
+        Set the acquisition configuration from dictionary. The Lima
+        parameters are only set when some value changed.
 
-        :param config: acquisition configuration dictionary.
+        :param force: set all the parameters even if they did not change
         :return: None
         """
+        sent = 0
+        saving_config = dict(self._SavingConfig)
+        # Not part of the CtSaving parameters
+        max_tasks = saving_config.pop('maxConcurrentWritingTask',
+                                      self._max_tasks_default)
+        buffer_config = dict(self._buffer_defaults)
+        buffer_config.update(self._BufferConfig)
+        total = len(self._AcqConfig) + len(saving_config) + \
+            len(buffer_config)
+
         acq_parms = self.ct_acq.getPars()
-        self._update_config_from_dict(self._AcqConfig, acq_parms)
-        self.ct_acq.setPars(acq_parms)
+        changed = self._update_config_from_dict(self._AcqConfig, acq_parms,
+                                                force)
+        if changed:
+            self.ct_acq.setPars(acq_parms)
+            sent += changed
 
         saving_params = self.ct_save.getParameters()
-        self._update_config_from_dict(self._SavingConfig, saving_params)
-        self.ct_save.setParameters(saving_params)
+        changed = self._update_config_from_dict(saving_config,
+                                                saving_params, force)
+        if changed:
+            self.ct_save.setParameters(saving_params)
+            sent += changed
+
+        if max_tasks is not None:
+            total += 1
+            if force or \
+                    self.ct_save.getMaxConcurrentWritingTask() != max_tasks:
+                self.logger.debug("Setting parameter "
+                                  "maxConcurrentWritingTask = %d", max_tasks)
+                self.ct_save.setMaxConcurrentWritingTask(max_tasks)
+                sent += 1
+
+        buffer_pars = self.ct_buffer.getPars()
+        changed = self._update_config_from_dict(buffer_config, buffer_pars,
+                                                force)
+        if changed:
+            self.ct_buffer.setPars(buffer_pars)
+            sent += changed
+
+        image_config = self.get_image_config()
+        total += len(image_config)
+        sent += self._write_image_config(image_config, force)
+
+        self._count_writes(sent, total - sent)
+
+    def _write_image_config(self, config, force=False):
+        """
+        Set the CtImage parameters which changed. The ROI is given in the
+        binned and rotated image, so it is set again after any other change.
+
+        :param config: image parameters
+        :param force: set all the parameters even if they did not change
+        :return: number of parameters set
+        """
+        changed = [key for key in sorted(config) if force or
+                   self._image_written.get(key) != config[key]]
+        if not changed:
+            return 0
+        self._image_written = {}
+        if 'bin' in changed:
+            self.ct_image.setBin(Core.Bin(*config['bin']))
+        if 'flip' in changed:
+            self.ct_image.setFlip(Core.Flip(*config['flip']))
+        if 'rotation' in changed:
+            self.ct_image.setRotation(self._rotation[config['rotation']])
+        if any(config['roi'][2:]):
+            self.ct_image.setRoi(Core.Roi(*config['roi']))
+        else:
+            self.ct_image.resetRoi()
+        self._image_written = dict(config)
+        self.logger.debug("Image parameters set: %r", config)
+        return len(changed)
 
+    def invalidate_cache(self):
+        # The other parameters are compared with the values read back
+        self._image_written = {}
+
+    @traced
     def prepare_acq(self):
         self.ct.prepareAcq()
 
+    @traced
     def start(self):
         self.ct.startAcq()
 
+    @traced
     def stop(self):
         self.ct.stopAcq()
 
+    def enable_events(self):
+        if self._img_status_cb is None:
+            self._img_status_cb = _ImageStatusCallback(self._notify)
+            self.ct.registerImageStatusCallback(self._img_status_cb)
+
+    def disable_events(self):
+        if self._img_status_cb is not None:
+            self.ct.unregisterImageStatusCallback(self._img_status_cb)
+            self._img_status_cb = None
+
     @LimaDetector.acq_time.getter
     def acq_time(self):
         return self.ct_acq.getAcqExpoTime() + self.ct_acq.getLatencyTime()
@@ -261,21 +555,71 @@ class LimaCoreDetector(LimaDetector):
         return self.ct_acq.getAcqNbFrames()
 
     @LimaDetector.last_image.getter
+    @traced
     def last_image(self):
         return self.ct.getStatus().ImageCounters.LastImageAcquired
 
     @LimaDetector.last_image_saved.getter
+    @traced
     def last_image_saved(self):
         return self.ct.getStatus().ImageCounters.LastImageSaved
 
     @LimaDetector.acq_status.getter
+    @traced
     def acq_status(self):
         return self.ct.getStatus().AcquisitionStatus
 
     @LimaDetector.status.getter
+    @traced
     def status(self):
         return self.ct.Status()
 
+    @LimaDetector.frame_size.getter
+    def frame_size(self):
+        return self.ct.image().getImageDim().getMemSize()
+
+    @LimaDetector.buffer_memory.getter
+    def buffer_memory(self):
+        # The simulated interface has its own memory size (MB)
+        memory = getattr(self.hwi, 'buffer_memory', None)
+        if memory is not None:
+            return memory * 1024 ** 2
+        return super(LimaCoreDetector, self).buffer_memory
+
+    @LimaDetector.lima_version.getter
+    def lima_version(self):
+        for module in (Core, sys.modules.get('Lima')):
+            version = getattr(module, '__version__', None)
+            if version is not None:
+                return str(version)
+        return None
+
+    def get_cpu_time(self):
+        # Lima runs in the test process
+        return sum(os.times()[:2])
+
+    @traced
+    def snapshot(self):
+        status = self.ct.getStatus()
+        counters = status.ImageCounters
+        return LimaStatus(status.AcquisitionStatus,
+                          counters.LastImageAcquired,
+                          counters.LastBaseImageReady,
+                          counters.LastImageReady,
+                          counters.LastImageSaved,
+                          counters.LastCounterReady)
+
+    @traced
+    def read_images(self, first, count, out=None):
+        data = self.ct.ReadImage(first, count).buffer
+        if data.ndim == 2:
+            data = data.reshape((1,) + data.shape)
+        if out is not None:
+            out = out[:count]
+            out[...] = data
+            return out
+        return data
+
     @staticmethod
     def set_debug(debug=True):
         if debug:
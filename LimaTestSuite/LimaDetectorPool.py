@@ -0,0 +1,79 @@
+import logging
+from LimaTestSuite.LimaCore import Core
+from LimaTestSuite.LimaDetector import LimaCoreDetector
+
+
+class LimaDetectorPool(object):
+    """
+    Keeps the detectors opened during the whole test suite, so the tests
+    using the same detector only have to apply their configuration instead
+    of creating the Lima control objects (or the device proxy) again.
+
+    :param tango_mode: create LimaTangoDetector instead of LimaCoreDetector
+    :param fresh: create a new detector for every test (cold start)
+    """
+    def __init__(self, tango_mode=False, fresh=False):
+        self.logger = logging.getLogger('LimaTestSuite')
+        self.tango_mode = tango_mode
+        self.fresh = fresh
+        self._detectors = {}
+
+    @staticmethod
+    def get_key(config):
+        return (config.det_type, config.host, config.port, config.device_name)
+
+    def create(self, config):
+        """
+        Create a new detector for the test configuration.
+
+        :param config: LimaTestConfiguration
+        :return: LimaDetector
+        """
+        if self.tango_mode:
+            from LimaTestSuite.LimaTangoDetector import LimaTangoDetector
+            return LimaTangoDetector(config)
+        return LimaCoreDetector(config)
+
+    def get(self, config):
+        """
+        Get a detector configured for the test. An opened detector is reused
+        unless the pool was created with fresh=True.
+
+        :param config: LimaTestConfiguration
+        :return: LimaDetector
+        """
+        if self.fresh:
+            return self.create(config)
+        key = self.get_key(config)
+        detector = self._detectors.get(key)
+        if detector is None:
+            self.logger.debug("Opening detector %r" % (key,))
+            detector = self.create(config)
+            self._detectors[key] = detector
+        else:
+            self.logger.debug("Reusing detector %r" % (key,))
+            detector.configure(config)
+        return detector
+
+    def release(self, detector):
+        """
+        Give back a detector at the end of a test. A pooled detector is left
+        ready for the next test. When the test left the acquisition running
+        its configuration cache is dropped, so the next test writes all its
+        parameters.
+
+        :param detector: LimaDetector
+        :return: None
+        """
+        if self.fresh:
+            return
+        if detector.acq_status == Core.AcqRunning:
+            self.logger.debug("Stopping the acquisition left running")
+            detector.stop()
+            detector.invalidate_cache()
+
+    def close(self):
+        """
+        Drop all the pooled detectors.
+        """
+        self._detectors.clear()
@@ -0,0 +1,175 @@
+import math
+
+# Default parameters of the test types used by the estimates. The test cases
+# of LimaTestCase use the same values.
+
+# Cycles of a soak test without soakCycles nor soakDuration
+SOAK_CYCLES = 100
+# Iterations of a latency test
+LATENCY_ITERATIONS = 100
+# Values of each swept buffer parameter
+BUFFER_VALUES = {'nbBuffers': [1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024],
+                 'maxMemory': [1, 2, 5, 10, 20, 30, 50, 70, 90],
+                 }
+# Acquisition modes compared and ratio between the frames and the
+# accumulated or concatenated images
+ACQ_MODES = ['SINGLE', 'ACCUMULATION', 'CONCATENATION']
+MODE_FACTOR = 10
+# Numbers of writing tasks compared
+WRITER_TASKS = [1, 2, 4, 8]
+
+
+def get_frame_time(config):
+    """
+    Expected time to acquire one frame: the exposure and latency time,
+    limited by the maxFrameRate of the Detector section if given.
+
+    :param config: LimaTestConfiguration
+    :return: time in seconds
+    """
+    acq = config.acq_params
+    frame_time = acq['acqExpoTime'] + acq['latencyTime']
+    max_rate = config.det_params.get('maxFrameRate')
+    if max_rate:
+        frame_time = max(frame_time, 1.0 / max_rate)
+    return frame_time
+
+
+def get_frame_bytes(config):
+    """
+    Expected size of one image, after the binning and the ROI of the test.
+    It is only known when the Detector section gives the frame size (width,
+    height and depth).
+
+    :param config: LimaTestConfiguration
+    :return: number of bytes or None
+    """
+    det = config.det_params
+    if not all(k in det for k in ('width', 'height', 'depth')):
+        return None
+    bin_x, bin_y = config.image_params.get('bin') or (1, 1)
+    width, height = det['width'] // bin_x, det['height'] // bin_y
+    roi = config.image_params.get('roi')
+    if roi and roi[2] and roi[3]:
+        width, height = roi[2], roi[3]
+    return width * height * det['depth']
+
+
+def estimate_frames(config, frames, acquisitions=1):
+    """
+    Estimate the time and the data volume of acquisitions of a number of
+    frames.
+
+    :param config: LimaTestConfiguration
+    :param frames: frames of each acquisition
+    :param acquisitions: number of acquisitions
+    :return: (seconds, bytes or None)
+    """
+    frames *= acquisitions
+    seconds = frames * get_frame_time(config)
+    frame_bytes = get_frame_bytes(config)
+    if frame_bytes is None:
+        return seconds, None
+    return seconds, frames * frame_bytes
+
+
+def estimate_acquisition(config):
+    return estimate_frames(config, config.acq_params['acqNbFrames'])
+
+
+def estimate_abort(config):
+    # Each iteration acquires until the abort point
+    params = config.test_params
+    frames = config.acq_params['acqNbFrames']
+    if params.get('abortAfterFrames'):
+        frames = min(frames, params['abortAfterFrames'])
+    elif params.get('abortAfterTime'):
+        frames = min(frames, int(params['abortAfterTime'] /
+                                 get_frame_time(config)))
+    else:
+        frames = 0
+    return estimate_frames(config, frames, params.get('iterations', 1))
+
+
+def estimate_latency(config):
+    # Each iteration is stopped after the first image
+    iterations = config.test_params.get('iterations', LATENCY_ITERATIONS)
+    return estimate_frames(config, 1, iterations)
+
+
+def estimate_soak(config):
+    params = config.test_params
+    cycles = params.get('soakCycles')
+    duration = params.get('soakDuration')
+    if not cycles and not duration:
+        cycles = SOAK_CYCLES
+    frames = config.acq_params['acqNbFrames']
+    cycle_time = frames * get_frame_time(config)
+    if duration and cycle_time:
+        # The cycle running when the duration is reached is finished
+        timed = int(math.ceil(duration / cycle_time))
+        cycles = min(cycles, timed) if cycles else timed
+    return estimate_frames(config, frames, cycles or 1)
+
+
+def estimate_buffer(config):
+    # At most one acquisition per buffer value
+    params = config.test_params
+    param = params.get('bufferSweep', 'nbBuffers')
+    values = params.get('bufferValues') or BUFFER_VALUES.get(param, [])
+    return estimate_frames(config, config.acq_params['acqNbFrames'],
+                           len(values))
+
+
+def estimate_modes(config):
+    # Every mode takes the time of the Single mode acquisition, the
+    # Accumulation mode only saves acqNbFrames / modeFactor images
+    factor = config.test_params.get('modeFactor', MODE_FACTOR)
+    frames = config.acq_params['acqNbFrames']
+    seconds, nbytes = estimate_frames(config, frames, len(ACQ_MODES))
+    if nbytes is not None and factor >= 1:
+        nbytes -= (frames - frames // factor) * get_frame_bytes(config)
+    return seconds, nbytes
+
+
+def estimate_formats(config):
+    # All the formats known are compared when none is given. The data volume
+    # is the uncompressed one.
+    params = config.test_params
+    formats = params.get('formats') or config.FILE_SUFFIXES
+    frames_per_file = params.get('framesPerFileValues') or [None]
+    return estimate_frames(config, config.acq_params['acqNbFrames'],
+                           len(formats) * len(frames_per_file))
+
+
+def estimate_writers(config):
+    tasks = config.test_params.get('writerTasks') or WRITER_TASKS
+    return estimate_frames(config, config.acq_params['acqNbFrames'],
+                           len(tasks))
+
+
+# Estimate of one run of each test type
+ESTIMATES = {'acquisition': estimate_acquisition,
+             'abort': estimate_abort,
+             'performance': estimate_acquisition,
+             'readout': estimate_acquisition,
+             'latency': estimate_latency,
+             'soak': estimate_soak,
+             'buffer': estimate_buffer,
+             'modes': estimate_modes,
+             'formats': estimate_formats,
+             'writers': estimate_writers,
+             }
+
+
+def estimate_test(config):
+    """
+    Estimate the acquisition time and the data volume of one run of a test,
+    without accessing the detector nor importing Lima. The data volume is
+    only known when the Detector section gives the frame size (width,
+    height and depth).
+
+    :param config: LimaTestConfiguration
+    :return: (seconds, bytes or None)
+    """
+    return ESTIMATES[config.type.lower()](config)
@@ -0,0 +1,595 @@
+"""
+Pure-Python stand-in for the part of the Lima.Core API used by the test
+suite. It allows to run and profile the suite without a Lima installation,
+through the Fake detector (see FakeDetector/FakeDetector.py).
+
+The simulation objects always compare with the constants of the Core
+module in use (LimaTestSuite.LimaCore), so they also work when Lima is
+installed.
+"""
+import os
+import math
+import time
+import zlib
+import struct
+import logging
+import threading
+from collections import deque
+
+
+# Trigger modes
+IntTrig, IntTrigMult, ExtTrigSingle, ExtTrigMult, ExtGate, ExtStartStop, \
+    ExtTrigReadout = range(7)
+
+# Acquisition modes
+Single, Accumulation, Concatenation = range(3)
+
+# Acquisition status
+AcqReady, AcqRunning, AcqFault, AcqConfig = range(4)
+
+# Image rotations
+Rotation_0, Rotation_90, Rotation_180, Rotation_270 = range(4)
+
+
+def _core():
+    # Core module used by the test suite (Lima.Core or this module)
+    from LimaTestSuite.LimaCore import Core
+    return Core
+
+
+class DebParams(object):
+    @staticmethod
+    def setTypeFlags(flags):
+        pass
+
+    @staticmethod
+    def setModuleFlags(flags):
+        pass
+
+
+class _Struct(object):
+    """
+    Parameters structure, copied by the get methods like the Lima ones.
+    """
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+    def copy(self):
+        return _Struct(**self.__dict__)
+
+
+class FrameDim(object):
+    def __init__(self, width, height, depth):
+        self.width = width
+        self.height = height
+        self.depth = depth
+
+    def getSize(self):
+        return self.width, self.height
+
+    def getDepth(self):
+        return self.depth
+
+    def getMemSize(self):
+        return self.width * self.height * self.depth
+
+
+class Bin(object):
+    def __init__(self, x=1, y=1):
+        self.x = x
+        self.y = y
+
+    def getX(self):
+        return self.x
+
+    def getY(self):
+        return self.y
+
+
+class Flip(object):
+    def __init__(self, x=False, y=False):
+        self.x = x
+        self.y = y
+
+
+class Roi(object):
+    def __init__(self, x=0, y=0, width=0, height=0):
+        self.x = x
+        self.y = y
+        self.width = width
+        self.height = height
+
+    def isEmpty(self):
+        return not (self.width and self.height)
+
+
+class FakeInterface(object):
+    """
+    Simulated hardware interface.
+
+    :param width: frame width in pixels
+    :param height: frame height in pixels
+    :param depth: bytes per pixel
+    :param max_frame_rate: maximum frame rate of the detector in Hz, None for
+                           no limit other than the exposure time
+    :param saving_latency: time to save one frame in seconds
+    :param write_files: write dummy files in the saving directory
+    :param buffer_memory: memory in MB which maxMemory of the buffer is a
+                          percentage of
+    """
+    def __init__(self, width=1024, height=1024, depth=2, max_frame_rate=None,
+                 saving_latency=0.0, write_files=True, buffer_memory=1024):
+        self.frame_dim = FrameDim(width, height, depth)
+        self.max_frame_rate = max_frame_rate
+        self.saving_latency = saving_latency
+        self.write_files = write_files
+        self.buffer_memory = buffer_memory
+        self._pattern = None
+
+    def read_frames(self, first, count, out=None):
+        """
+        Content of the simulated frames: a ramp shifted by the frame number,
+        so consecutive frames are different.
+
+        :param out: preallocated NumPy array where the frames are written
+        :return: NumPy array (count, height, width)
+        """
+        import numpy
+
+        dtype = {1: numpy.uint8, 2: numpy.uint16, 4: numpy.uint32}[
+            self.frame_dim.depth]
+        width, height = self.frame_dim.getSize()
+        if self._pattern is None:
+            pattern = numpy.arange(width * height) % 128 + 1
+            self._pattern = pattern.astype(dtype).reshape(height, width)
+        if out is None:
+            out = numpy.empty((count, height, width), dtype)
+        for i in range(count):
+            numpy.add(self._pattern, (first + i) % 127, out=out[i])
+        return out[:count]
+
+
+class Data(object):
+    def __init__(self, frame, buffer):
+        self.frameNumber = frame
+        self.buffer = buffer
+
+
+class CtAcquisition(object):
+    def __init__(self):
+        self._pars = _Struct(acqMode=Single,
+                             acqNbFrames=1,
+                             acqExpoTime=1.0,
+                             accMaxExpoTime=1.0,
+                             concatNbFrames=1,
+                             latencyTime=0.0,
+                             triggerMode=IntTrig)
+
+    def getPars(self):
+        return self._pars.copy()
+
+    def setPars(self, pars):
+        self._pars = pars.copy()
+
+    def getAcqExpoTime(self):
+        return self._pars.acqExpoTime
+
+    def getLatencyTime(self):
+        return self._pars.latencyTime
+
+    def getAcqNbFrames(self):
+        return self._pars.acqNbFrames
+
+    def getAcqMode(self):
+        return self._pars.acqMode
+
+
+class CtSaving(object):
+    # File formats
+    RAW, EDF, CBFFormat, NXS, FITS, EDFGZ, TIFFFormat, HDF5, EDFConcat, \
+        EDFLZ4, CBFMiniHeader = range(11)
+
+    # Saving modes
+    Manual, AutoFrame, AutoHeader = range(3)
+
+    # Overwrite policies
+    Abort, Overwrite, Append, MultiSet = range(4)
+
+    def __init__(self):
+        self._pars = _Struct(directory='',
+                             prefix='',
+                             suffix='',
+                             nextNumber=0,
+                             fileFormat=self.RAW,
+                             savingMode=self.Manual,
+                             overwritePolicy=self.Abort,
+                             framesPerFile=1,
+                             nbframes=0)
+        self._max_tasks = 1
+
+    def getParameters(self):
+        return self._pars.copy()
+
+    def setParameters(self, pars):
+        self._pars = pars.copy()
+
+    def getMaxConcurrentWritingTask(self):
+        return self._max_tasks
+
+    def setMaxConcurrentWritingTask(self, nb_tasks):
+        if nb_tasks < 1:
+            raise ValueError('Invalid number of writing tasks: %d' % nb_tasks)
+        self._max_tasks = nb_tasks
+
+
+class CtBuffer(object):
+    def __init__(self):
+        # nbBuffers 0 means as many buffers as fit in maxMemory
+        self._pars = _Struct(nbBuffers=0, maxMemory=70)
+
+    def getPars(self):
+        return self._pars.copy()
+
+    def setPars(self, pars):
+        self._pars = pars.copy()
+
+    def get_capacity(self, hwi, frame_dim):
+        """
+        Number of images the buffer holds.
+        """
+        memory = hwi.buffer_memory * 1024 ** 2 * self._pars.maxMemory / 100
+        capacity = max(memory // frame_dim.getMemSize(), 1)
+        if self._pars.nbBuffers > 0:
+            capacity = min(capacity, self._pars.nbBuffers)
+        return capacity
+
+
+class CtImage(object):
+    def __init__(self, hwi, acq):
+        self._hwi = hwi
+        self._acq = acq
+        self._bin = Bin()
+        self._flip = Flip()
+        self._rotation = Rotation_0
+        self._roi = Roi()
+
+    def setBin(self, bin):
+        self._bin = bin
+
+    def getBin(self):
+        return self._bin
+
+    def resetBin(self):
+        self._bin = Bin()
+
+    def setFlip(self, flip):
+        self._flip = flip
+
+    def getFlip(self):
+        return self._flip
+
+    def resetFlip(self):
+        self._flip = Flip()
+
+    def setRotation(self, rotation):
+        self._rotation = rotation
+
+    def getRotation(self):
+        return self._rotation
+
+    def setRoi(self, roi):
+        # Like Lima, the ROI must fit in the binned and rotated image
+        width, height = self._get_max_size()
+        if roi.x < 0 or roi.y < 0 or roi.x + roi.width > width or \
+                roi.y + roi.height > height:
+            raise ValueError('Roi <%d,%d>-<%dx%d> out of the %dx%d image' %
+                             (roi.x, roi.y, roi.width, roi.height, width,
+                              height))
+        self._roi = roi
+
+    def getRoi(self):
+        return self._roi
+
+    def resetRoi(self):
+        self._roi = Roi()
+
+    def _get_max_size(self):
+        """
+        Size of the image after the binning and the rotation, before the
+        ROI.
+        """
+        core = _core()
+        width, height = self._hwi.frame_dim.getSize()
+        pars = self._acq.getPars()
+        # The concatenated frames are stacked vertically
+        if pars.acqMode == core.Concatenation:
+            height *= max(pars.concatNbFrames, 1)
+        width //= self._bin.getX()
+        height //= self._bin.getY()
+        if self._rotation in (core.Rotation_90, core.Rotation_270):
+            width, height = height, width
+        return width, height
+
+    def getImageDim(self):
+        width, height = self._get_max_size()
+        if not self._roi.isEmpty():
+            width, height = self._roi.width, self._roi.height
+        return FrameDim(width, height, self._hwi.frame_dim.getDepth())
+
+
+class CtControl(object):
+    """
+    Simulated CtControl. An acquisition thread generates the frames at the
+    exposure time (or the maximum frame rate of the interface) and the
+    saving threads (maxConcurrentWritingTask of them, each one writing whole
+    files) save them with the saving latency of the interface. When the
+    frames waiting to be saved fill the buffer the acquisition stops in
+    Fault (overrun).
+    """
+
+    class ImageStatusCallback(object):
+        def __init__(self):
+            pass
+
+        def imageStatusChanged(self, img_status):
+            pass
+
+    def __init__(self, hwi):
+        self.logger = logging.getLogger('LimaTestSuite')
+        self._hwi = hwi
+        self._acq = CtAcquisition()
+        self._saving = CtSaving()
+        self._buffer = CtBuffer()
+        self._image = CtImage(hwi, self._acq)
+        self._callbacks = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self._status = _core().AcqReady
+        self._acq_done = True
+        self._fault = False
+        self._reset_counters()
+
+    def _reset_counters(self):
+        self._last_acquired = -1
+        self._last_saved = -1
+        # Frames waiting to be saved by each writing task
+        self._pending = [deque()]
+        # Frames saved after a frame not saved yet
+        self._saved = set()
+
+    def acquisition(self):
+        return self._acq
+
+    def saving(self):
+        return self._saving
+
+    def image(self):
+        return self._image
+
+    def buffer(self):
+        return self._buffer
+
+    def registerImageStatusCallback(self, cb):
+        self._callbacks.append(cb)
+
+    def unregisterImageStatusCallback(self, cb):
+        self._callbacks.remove(cb)
+
+    def prepareAcq(self):
+        self._join()
+        with self._lock:
+            self._reset_counters()
+        self._stop_event.clear()
+        self._status = _core().AcqReady
+
+    def startAcq(self):
+        self._status = _core().AcqRunning
+        self._acq_done = False
+        self._fault = False
+        nb_tasks = self._saving.getMaxConcurrentWritingTask()
+        self._pending = [deque() for _ in range(nb_tasks)]
+        self._running_tasks = nb_tasks
+        acq_thread = threading.Thread(target=self._acquire)
+        self._threads = [acq_thread] + \
+            [threading.Thread(target=self._save, args=(task,))
+             for task in range(nb_tasks)]
+        for thread in self._threads:
+            thread.daemon = True
+            thread.start()
+
+    def stopAcq(self):
+        self._stop_event.set()
+
+    def _join(self):
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def getStatus(self):
+        with self._lock:
+            counters = _Struct(LastImageAcquired=self._last_acquired,
+                               LastBaseImageReady=self._last_acquired,
+                               LastImageReady=self._last_acquired,
+                               LastImageSaved=self._last_saved,
+                               LastCounterReady=self._last_acquired)
+        return _Struct(AcquisitionStatus=self._status,
+                       ImageCounters=counters)
+
+    def Status(self):
+        return self.getStatus()
+
+    def ReadImage(self, frame=-1, count=1):
+        with self._lock:
+            last = self._last_acquired
+        if frame < 0:
+            frame = last
+        if frame < 0 or frame + count - 1 > last:
+            raise RuntimeError('Frame(s) %d-%d not available, last image '
+                               'acquired %d' % (frame, frame + count - 1,
+                                                last))
+        data = self._hwi.read_frames(frame, count)
+        if count == 1:
+            data = data[0]
+        return Data(frame, data)
+
+    def _notify(self):
+        if not self._callbacks:
+            return
+        status = self.getStatus().ImageCounters
+        for cb in list(self._callbacks):
+            cb.imageStatusChanged(status)
+
+    def _saving_enabled(self):
+        return self._saving._pars.savingMode == _core().CtSaving.AutoFrame
+
+    def get_image_period(self, pars):
+        """
+        Time to acquire one image: the frames of an image are accumulated
+        (sub-exposures of at most accMaxExpoTime) or concatenated
+        (concatNbFrames frames) according to the acquisition mode.
+        """
+        core = _core()
+        frame_period = pars.acqExpoTime + pars.latencyTime
+        min_period = 0.0
+        if self._hwi.max_frame_rate:
+            min_period = 1.0 / self._hwi.max_frame_rate
+        if pars.acqMode == core.Accumulation and pars.accMaxExpoTime > 0:
+            nb_sub = int(math.ceil(pars.acqExpoTime / pars.accMaxExpoTime))
+            return max(frame_period, nb_sub * min_period)
+        elif pars.acqMode == core.Concatenation:
+            return max(pars.concatNbFrames, 1) * max(frame_period, min_period)
+        return max(frame_period, min_period)
+
+    def _acquire(self):
+        pars = self._acq.getPars()
+        period = self.get_image_period(pars)
+        capacity = self._buffer.get_capacity(self._hwi,
+                                             self._image.getImageDim())
+        # Each file is written by one task, in turn
+        frames_per_file = max(self._saving._pars.framesPerFile, 1)
+        nb_tasks = len(self._pending)
+        t0 = time.time()
+        for frame in range(pars.acqNbFrames):
+            # Wait until the end of the frame, without drifting
+            delay = t0 + (frame + 1) * period - time.time()
+            if self._stop_event.wait(max(delay, 0)):
+                break
+            with self._lock:
+                overrun = self._saving_enabled() and \
+                    frame - self._last_saved > capacity
+                if not overrun:
+                    self._last_acquired = frame
+                    task = (frame // frames_per_file) % nb_tasks
+                    self._pending[task].append(frame)
+            if overrun:
+                self.logger.debug('Buffer overrun at frame %d (%d buffers)' %
+                                  (frame, capacity))
+                self._fault = True
+                break
+            self._notify()
+        with self._lock:
+            self._acq_done = True
+
+    def _save(self, task):
+        saving = self._saving.getParameters()
+        enabled = self._saving_enabled()
+        writer = _FileWriter(saving, self._image.getImageDim()) \
+            if enabled and self._hwi.write_files else None
+        pending = self._pending[task]
+        while True:
+            # The end of the acquisition is read with the queue, so the
+            # last frame queued can not be missed
+            with self._lock:
+                frame = pending.popleft() if pending else None
+                acq_done = self._acq_done
+            if frame is None:
+                if acq_done:
+                    break
+                time.sleep(0.001)
+                continue
+            if not enabled:
+                continue
+            if self._hwi.saving_latency:
+                time.sleep(self._hwi.saving_latency)
+            if writer is not None:
+                writer.write(frame)
+            with self._lock:
+                # Last image saved: all the previous frames are saved too
+                self._saved.add(frame)
+                while self._last_saved + 1 in self._saved:
+                    self._last_saved += 1
+                    self._saved.remove(self._last_saved)
+            self._notify()
+        if writer is not None:
+            writer.close()
+        with self._lock:
+            self._running_tasks -= 1
+            if self._running_tasks:
+                return
+            if enabled:
+                # Like Lima, the next acquisition continues the numbering
+                frames_per_file = max(saving.framesPerFile, 1)
+                nb_files = (self._last_saved + frames_per_file) // \
+                    frames_per_file
+                self._saving._pars.nextNumber += nb_files
+        if self._fault:
+            self._status = _core().AcqFault
+        else:
+            self._status = _core().AcqReady
+
+
+class _FileWriter(object):
+    """
+    Writes dummy files with a valid header for the saving format. The data
+    of the compressed formats is compressed with zlib, to have a realistic
+    CPU cost.
+    """
+    def __init__(self, saving, frame_dim):
+        self.saving = saving
+        self.frame_size = frame_dim.getMemSize()
+        self.data = '\x01' * self.frame_size
+        self.frames_per_file = max(saving.framesPerFile, 1)
+        self.file = None
+        self.format = None
+        formats = _core().CtSaving
+        for name in ('EDF', 'EDFConcat', 'EDFGZ', 'EDFLZ4', 'CBFFormat',
+                     'CBFMiniHeader', 'HDF5', 'NXS', 'TIFFFormat', 'FITS'):
+            if getattr(formats, name, None) == saving.fileFormat:
+                self.format = name
+
+    def _open(self, index):
+        number = self.saving.nextNumber + index
+        filename = '%s%04d%s' % (self.saving.prefix, number,
+                                 self.saving.suffix)
+        self.file = open(os.path.join(self.saving.directory, filename), 'wb')
+        headers = {'EDFGZ': '\x1f\x8b\x08\x00',
+                   'EDFLZ4': '\x04\x22\x4d\x18',
+                   'HDF5': '\x89HDF\r\n\x1a\n',
+                   'NXS': '\x89HDF\r\n\x1a\n',
+                   'TIFFFormat': 'II*\x00',
+                   'FITS': 'SIMPLE  ='}
+        self.file.write(headers.get(self.format, ''))
+
+    def write(self, frame):
+        if frame % self.frames_per_file == 0:
+            self.close()
+            self._open(frame // self.frames_per_file)
+        if self.format in ('EDFGZ', 'EDFLZ4'):
+            level = 1 if self.format == 'EDFLZ4' else 6
+            self.file.write(zlib.compress(self.data, level))
+            return
+        if self.format in ('EDF', 'EDFConcat'):
+            header = '{\nImage = %d ;\nSize = %d ;\n' % (frame,
+                                                          self.frame_size)
+            header = header.ljust(510) + '}\n'
+            self.file.write(header)
+        elif self.format in ('CBFFormat', 'CBFMiniHeader'):
+            self.file.write('###CBF: VERSION 1.5\n')
+            self.file.write(struct.pack('<I', self.frame_size))
+        self.file.write(self.data)
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
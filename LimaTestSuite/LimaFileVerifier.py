@@ -0,0 +1,193 @@
+import os
+import re
+import mmap
+import logging
+from multiprocessing.pool import ThreadPool
+
+
+HDF5_SIGNATURE = '\x89HDF\r\n\x1a\n'
+EDF_SIZE = re.compile(r'\bSize\s*=\s*(\d+)\s*;')
+
+
+class LimaFileVerifier(object):
+    """
+    Checks the files saved by an acquisition: the expected files exist, their
+    size is coherent and their header matches the saving format.
+
+    :param saving_params: saving parameters of the test
+    :param frames: number of frames acquired
+    :param frame_size: size in bytes of one frame, used to check RAW files
+    :param workers: number of threads used to verify the files
+    """
+
+    # Lima default index format of the file names
+    INDEX_FORMAT = '%04d'
+
+    def __init__(self, saving_params, frames, frame_size=None, workers=4):
+        self.logger = logging.getLogger('LimaTestSuite')
+        self.directory = saving_params['directory']
+        self.prefix = saving_params['prefix']
+        self.suffix = saving_params['suffix']
+        self.next_number = saving_params['nextNumber']
+        self.frames_per_file = max(saving_params['framesPerFile'], 1)
+        self.file_format = saving_params['fileFormat'].upper()
+        self.frames = frames
+        self.frame_size = frame_size
+        self.workers = workers
+
+        # Header check of each Lima file format
+        self._checks = {'CBF': self._check_cbf,
+                        'CBF_MINI_HEADER': self._check_cbf,
+                        'EDF': self._check_edf,
+                        'EDF_CONCAT': self._check_edf,
+                        'EDF_GZ': self._check_gzip,
+                        'EDF_LZ4': self._check_lz4,
+                        'HDF5': self._check_hdf5,
+                        'NXS': self._check_hdf5,
+                        'RAW': self._check_raw,
+                        'TIFF': self._check_tiff,
+                        'FITZ': self._check_fits,
+                        }
+
+    def expected_files(self):
+        """
+        Names of the files the acquisition should have written, with the
+        number of frames of each one.
+
+        :return: list of (filename, frames)
+        """
+        files = []
+        remaining = self.frames
+        index = self.next_number
+        while remaining > 0:
+            nframes = min(remaining, self.frames_per_file)
+            filename = self.prefix + self.INDEX_FORMAT % index + self.suffix
+            files.append((filename, nframes))
+            remaining -= nframes
+            index += 1
+        return files
+
+    def verify(self):
+        """
+        Verify all the saved files.
+
+        :return: list of error messages, empty if the files are correct
+        """
+        expected = self.expected_files()
+        names = set(f for f, _ in expected)
+        errors = []
+        for filename in sorted(os.listdir(self.directory)):
+            if filename.startswith(self.prefix) and \
+                    filename.endswith(self.suffix) and filename not in names:
+                errors.append('%s: unexpected file' % filename)
+
+        pool = ThreadPool(self.workers)
+        try:
+            results = pool.map(self._verify_file, expected)
+        finally:
+            pool.close()
+            pool.join()
+        for error in results:
+            if error is not None:
+                errors.append(error)
+        self.logger.debug('Verified %d file(s) in %s, %d error(s)' %
+                          (len(expected), self.directory, len(errors)))
+        return errors
+
+    def _verify_file(self, item):
+        filename, nframes = item
+        path = os.path.join(self.directory, filename)
+        if not os.path.isfile(path):
+            return '%s: file not found' % filename
+        check = self._checks.get(self.file_format)
+        try:
+            size = os.path.getsize(path)
+            if size == 0:
+                return '%s: empty file' % filename
+            if check is None:
+                return None
+            error = check(path, size, nframes)
+        except (EnvironmentError, ValueError) as e:
+            error = str(e)
+        if error is not None:
+            return '%s: %s' % (filename, error)
+        return None
+
+    @staticmethod
+    def _read_head(path, nbytes):
+        with open(path, 'rb') as f:
+            return f.read(nbytes)
+
+    def _check_magic(self, path, magics, name):
+        head = self._read_head(path, max(len(m) for m in magics))
+        if not any(head.startswith(m) for m in magics):
+            return 'not a valid %s file' % name
+        return None
+
+    def _check_cbf(self, path, size, nframes):
+        return self._check_magic(path, ['###CBF'], 'CBF')
+
+    def _check_gzip(self, path, size, nframes):
+        return self._check_magic(path, ['\x1f\x8b'], 'gzip')
+
+    def _check_lz4(self, path, size, nframes):
+        return self._check_magic(path, ['\x04\x22\x4d\x18'], 'LZ4')
+
+    def _check_tiff(self, path, size, nframes):
+        return self._check_magic(path, ['II*\x00', 'MM\x00*'], 'TIFF')
+
+    def _check_fits(self, path, size, nframes):
+        return self._check_magic(path, ['SIMPLE  ='], 'FITS')
+
+    def _check_hdf5(self, path, size, nframes):
+        # The superblock may be at offset 0, 512, 1024, 2048...
+        with open(path, 'rb') as f:
+            offset = 0
+            while offset + len(HDF5_SIGNATURE) <= size:
+                f.seek(offset)
+                if f.read(len(HDF5_SIGNATURE)) == HDF5_SIGNATURE:
+                    return None
+                offset = 512 if offset == 0 else offset * 2
+        return 'HDF5 signature not found'
+
+    def _check_raw(self, path, size, nframes):
+        # A RAW file has no header, only its size can be checked
+        if self.frame_size:
+            expected = self.frame_size * nframes
+            if size != expected:
+                return 'size %d, expected %d' % (size, expected)
+        elif size % nframes:
+            return 'size %d is not a multiple of %d frames' % (size, nframes)
+        return None
+
+    def _check_edf(self, path, size, nframes):
+        """
+        Walk the EDF headers through a memory map, so only the headers are
+        read from the disk and not the frames data.
+        """
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offset = 0
+                found = 0
+                while offset < size:
+                    if mm[offset:offset + 1] != '{':
+                        return 'EDF header %d not found at offset %d' % \
+                            (found, offset)
+                    end = mm.find('}', offset)
+                    if end < 0:
+                        return 'EDF header %d not terminated' % found
+                    header = mm[offset:end]
+                    match = EDF_SIZE.search(header)
+                    if match is None:
+                        return 'EDF header %d without Size' % found
+                    # The header is closed by '}\n'
+                    offset = end + 2 + int(match.group(1))
+                    found += 1
+            finally:
+                mm.close()
+        if offset != size:
+            return 'EDF frame %d is truncated' % (found - 1)
+        if found != nframes:
+            return '%d EDF frame(s), expected %d' % (found, nframes)
+        return None
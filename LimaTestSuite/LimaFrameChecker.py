@@ -0,0 +1,169 @@
+import zlib
+import logging
+import numpy
+
+
+class LimaFrameChecker(object):
+    """
+    Reads back the acquired frames in batches and checks their content. The
+    statistics of each frame (mean, min, max, saturated and dead pixels and a
+    checksum) are computed at once for the whole batch with NumPy. Only one
+    batch is held in memory and only running totals of the statistics are
+    kept, so the memory used does not depend on the number of frames of the
+    acquisition.
+
+    :param detector: LimaDetector
+    :param batch: number of frames read with each request
+    :param min_mean: lowest allowed mean of a frame, None for no limit
+    :param max_mean: highest allowed mean of a frame, None for no limit
+    :param max_saturated: maximum number of saturated pixels of a frame,
+                          None for no limit
+    :param max_dead: maximum number of dead (zero) pixels of a frame, None
+                     for no limit
+    :param saturation: value of a saturated pixel, by default the maximum
+                       value of the pixel type
+    """
+
+    # Maximum number of errors reported, the following ones are only counted
+    MAX_ERRORS = 20
+
+    def __init__(self, detector, batch=16, min_mean=None, max_mean=None,
+                 max_saturated=None, max_dead=None, saturation=None):
+        self.logger = logging.getLogger('LimaTestSuite')
+        self.detector = detector
+        self.batch = max(batch, 1)
+        self.min_mean = min_mean
+        self.max_mean = max_mean
+        self.max_saturated = max_saturated
+        self.max_dead = max_dead
+        self.saturation = saturation
+        # Next frame to read
+        self.next_frame = 0
+        # Running totals of the checked frames
+        self.frames_checked = 0
+        self.sum_mean = 0.0
+        self.min_value = None
+        self.max_value = None
+        self.saturated_pixels = 0
+        self.dead_pixels = 0
+        self.errors = []
+        self.nb_errors = 0
+        self._last_checksum = None
+        self._read_failed = False
+
+    def _error(self, msg):
+        self.nb_errors += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(msg)
+
+    def update(self, last_image):
+        """
+        Read and check the frames acquired since the previous call.
+
+        :param last_image: last image acquired
+        :return: None
+        """
+        while not self._read_failed and self.next_frame <= last_image:
+            first = self.next_frame
+            count = min(self.batch, last_image - first + 1)
+            try:
+                data = self.detector.read_images(first, count)
+            except Exception as e:
+                self._error('frames %d-%d could not be read: %s' %
+                            (first, first + count - 1, e))
+                self._read_failed = True
+                break
+            self.check_batch(first, data)
+            self.next_frame = first + count
+
+    def check_batch(self, first, data):
+        """
+        Compute the statistics of a batch of frames and check them.
+
+        :param first: number of the first frame of the batch
+        :param data: NumPy array (frames, height, width)
+        :return: None
+        """
+        n = data.shape[0]
+        flat = data.reshape(n, -1)
+        saturation = self.saturation
+        if saturation is None:
+            if numpy.issubdtype(flat.dtype, numpy.integer):
+                saturation = numpy.iinfo(flat.dtype).max
+            else:
+                saturation = numpy.inf
+        means = flat.mean(axis=1)
+        mins = flat.min(axis=1)
+        maxs = flat.max(axis=1)
+        saturated = (flat >= saturation).sum(axis=1)
+        dead = (flat == 0).sum(axis=1)
+        checksums = [zlib.crc32(numpy.ascontiguousarray(frame)) & 0xffffffff
+                     for frame in flat]
+
+        self.frames_checked += n
+        self.sum_mean += float(means.sum())
+        batch_min, batch_max = mins.min().item(), maxs.max().item()
+        if self.min_value is None or batch_min < self.min_value:
+            self.min_value = batch_min
+        if self.max_value is None or batch_max > self.max_value:
+            self.max_value = batch_max
+        self.saturated_pixels += int(saturated.sum())
+        self.dead_pixels += int(dead.sum())
+
+        for i in range(n):
+            frame = first + i
+            if maxs[i] == 0:
+                self._error('frame %d: all the pixels are zero' % frame)
+            if checksums[i] == self._last_checksum:
+                self._error('frame %d: same content as frame %d' %
+                            (frame, frame - 1))
+            self._last_checksum = checksums[i]
+            if self.min_mean is not None and means[i] < self.min_mean:
+                self._error('frame %d: mean %g lower than %g' %
+                            (frame, means[i], self.min_mean))
+            if self.max_mean is not None and means[i] > self.max_mean:
+                self._error('frame %d: mean %g higher than %g' %
+                            (frame, means[i], self.max_mean))
+            if self.max_saturated is not None and \
+                    saturated[i] > self.max_saturated:
+                self._error('frame %d: %d saturated pixels (max %d)' %
+                            (frame, saturated[i], self.max_saturated))
+            if self.max_dead is not None and dead[i] > self.max_dead:
+                self._error('frame %d: %d dead pixels (max %d)' %
+                            (frame, dead[i], self.max_dead))
+
+    def check(self, frames):
+        """
+        Read and check the frames not checked yet, at the end of the
+        acquisition.
+
+        :param frames: number of frames acquired
+        :return: list of error messages, empty if all the frames are correct
+        """
+        self.update(frames - 1)
+        if not self._read_failed and self.frames_checked != frames:
+            self._error('%d frame(s) checked, expected %d' %
+                        (self.frames_checked, frames))
+        errors = list(self.errors)
+        if self.nb_errors > len(errors):
+            errors.append('... %d more error(s)' %
+                          (self.nb_errors - len(errors)))
+        self.logger.debug('Checked %d frame(s), %d error(s)' %
+                          (self.frames_checked, self.nb_errors))
+        return errors
+
+    def get_stats(self):
+        """
+        Summary of the checked frames.
+
+        :return: dictionary
+        """
+        if not self.frames_checked:
+            return {}
+        return {'frames_checked': self.frames_checked,
+                'avg_mean': self.sum_mean / self.frames_checked,
+                'min_value': self.min_value,
+                'max_value': self.max_value,
+                'saturated_pixels': self.saturated_pixels,
+                'dead_pixels': self.dead_pixels,
+                }
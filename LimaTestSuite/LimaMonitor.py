@@ -0,0 +1,333 @@
+import os
+import csv
+import time
+import logging
+import threading
+
+
+def get_process_usage():
+    """
+    Resident memory, open file descriptors and threads of the current
+    process, read from /proc/self.
+
+    :return: dictionary with rss (bytes), fds and threads, empty if /proc is
+             not available
+    """
+    usage = {}
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'VmRSS':
+                    usage['rss'] = int(value.split()[0]) * 1024
+                elif key == 'Threads':
+                    usage['threads'] = int(value)
+        usage['fds'] = len(os.listdir('/proc/self/fd'))
+    except (IOError, OSError):
+        return {}
+    return usage
+
+
+def get_cpu_times(pid='self'):
+    """
+    User and system CPU time used so far by a process, read from
+    /proc/<pid>/stat.
+
+    :param pid: process id, by default the current process
+    :return: (user, system) in seconds, (None, None) if /proc is not
+             available
+    """
+    ticks = float(LimaResourceSampler.CLOCK_TICKS)
+    try:
+        with open('/proc/%s/stat' % pid) as f:
+            # The fields after the command name, which may have spaces
+            fields = f.read().rsplit(')', 1)[1].split()
+        return int(fields[11]) / ticks, int(fields[12]) / ticks
+    except (IOError, OSError, IndexError, ValueError):
+        return None, None
+
+
+def _read_proc_file(path):
+    """
+    Read a /proc file of "key: value" lines.
+
+    :return: dictionary with the first field of each value, empty if the
+             file is not available
+    """
+    values = {}
+    try:
+        with open(path) as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                fields = value.split()
+                if fields:
+                    values[key] = fields[0]
+    except (IOError, OSError):
+        pass
+    return values
+
+
+def get_disk_device(directory):
+    """
+    Name of the block device in /proc/diskstats holding a directory.
+
+    :return: device name or None if it is not a block device (tmpfs, NFS...)
+    """
+    try:
+        dev = os.stat(directory).st_dev
+        major, minor = os.major(dev), os.minor(dev)
+        with open('/proc/diskstats') as f:
+            for line in f:
+                fields = line.split()
+                if int(fields[0]) == major and int(fields[1]) == minor:
+                    return fields[2]
+    except (IOError, OSError):
+        pass
+    return None
+
+
+class LimaResourceSampler(threading.Thread):
+    """
+    Background thread which samples the resources used by the process during
+    a test: CPU time from /proc/self/stat, memory from /proc/self/status,
+    I/O from /proc/self/io and the activity of the disk holding the saving
+    directory from /proc/diskstats. Only a few small files are read on each
+    sample.
+
+    :param directory: saving directory of the test
+    :param rate: sampling rate in Hz
+    """
+
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+
+    def __init__(self, directory, rate=2.0):
+        super(LimaResourceSampler, self).__init__()
+        self.daemon = True
+        self.period = 1.0 / rate
+        self.device = get_disk_device(directory)
+        # (t, user, system, rss, sectors written, io ticks) of each sample
+        self.samples = []
+        self._start_io = {}
+        self._end_io = {}
+        self._status = {}
+        self._hwm_reset = False
+        self._stop_event = threading.Event()
+
+    def _sample(self):
+        t = time.time()
+        user, system = get_cpu_times()
+        self._status = _read_proc_file('/proc/self/status')
+        rss = self._status.get('VmRSS')
+        sectors = ticks = None
+        if self.device is not None:
+            try:
+                with open('/proc/diskstats') as f:
+                    for line in f:
+                        fields = line.split()
+                        if fields[2] == self.device:
+                            sectors, ticks = int(fields[9]), int(fields[12])
+                            break
+            except (IOError, OSError):
+                pass
+        self.samples.append((t, user, system,
+                             int(rss) * 1024 if rss else None,
+                             sectors, ticks))
+
+    def run(self):
+        while not self._stop_event.wait(self.period):
+            self._sample()
+
+    def start(self):
+        # Reset the peak RSS of the process (VmHWM), so it is the peak of
+        # the test. Otherwise only the sampled RSS is used.
+        try:
+            with open('/proc/self/clear_refs', 'w') as f:
+                f.write('5')
+            self._hwm_reset = True
+        except (IOError, OSError):
+            self._hwm_reset = False
+        self._start_io = _read_proc_file('/proc/self/io')
+        self._sample()
+        super(LimaResourceSampler, self).start()
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self._sample()
+        self._end_io = _read_proc_file('/proc/self/io')
+
+    def _io_delta(self, key):
+        if key not in self._start_io or key not in self._end_io:
+            return None
+        return int(self._end_io[key]) - int(self._start_io[key])
+
+    def get_stats(self):
+        """
+        Summary of the resources used between start and stop.
+
+        :return: dictionary with the average and peak CPU percent of the
+                 process (user + system), the peak RSS in MB, the MB written
+                 by the process and to the disk, and the average and peak
+                 utilisation percent of the disk
+        """
+        if len(self.samples) < 2:
+            return {}
+        mb = float(1024 ** 2)
+        stats = {}
+        first, last = self.samples[0], self.samples[-1]
+        elapsed = last[0] - first[0]
+
+        cpu = []
+        util = []
+        for prev, sample in zip(self.samples, self.samples[1:]):
+            dt = sample[0] - prev[0]
+            if not dt:
+                continue
+            if sample[1] is not None and prev[1] is not None:
+                busy = sample[1] + sample[2] - prev[1] - prev[2]
+                cpu.append(100 * busy / dt)
+            if sample[5] is not None and prev[5] is not None:
+                util.append(min(100.0, 0.1 * (sample[5] - prev[5]) / dt))
+        if cpu and elapsed:
+            busy = last[1] + last[2] - first[1] - first[2]
+            stats['cpu_percent'] = 100 * busy / elapsed
+            stats['cpu_user'] = 100 * (last[1] - first[1]) / elapsed
+            stats['cpu_system'] = 100 * (last[2] - first[2]) / elapsed
+            stats['peak_cpu_percent'] = max(cpu)
+        rss = [s[3] for s in self.samples if s[3] is not None]
+        hwm = self._status.get('VmHWM')
+        if hwm and self._hwm_reset:
+            rss.append(int(hwm) * 1024)
+        if rss:
+            stats['peak_rss_mb'] = max(rss) / mb
+        written = self._io_delta('write_bytes')
+        if written is not None:
+            stats['io_write_mb'] = written / mb
+        if util and elapsed:
+            stats['disk_write_mb'] = (last[4] - first[4]) * 512 / mb
+            stats['disk_util'] = min(100.0,
+                                     0.1 * (last[5] - first[5]) / elapsed)
+            stats['peak_disk_util'] = max(util)
+        return stats
+
+
+class LimaBacklogSampler(threading.Thread):
+    """
+    Background thread which samples the image counters of the detector
+    during an acquisition to follow the saving backlog (images acquired but
+    not saved yet) and detect when the saving stalls.
+
+    :param detector: LimaDetector
+    :param rate: sampling rate in Hz
+    :param stall_timeout: time in seconds the saved counter can stay still
+                          while images are pending before the saving is
+                          considered stalled, None to disable the detection
+
+    The detector wait_event is woken up when the saving stalls or the
+    sampling fails, so the test does not wait for its next poll to stop.
+    """
+    def __init__(self, detector, rate=10.0, stall_timeout=None):
+        super(LimaBacklogSampler, self).__init__()
+        self.daemon = True
+        self.logger = logging.getLogger('LimaTestSuite')
+        self.detector = detector
+        self.period = 1.0 / rate
+        self.stall_timeout = stall_timeout
+        # (t, last image acquired, last image saved, acquisition status)
+        self.samples = []
+        self.stalled = False
+        # Error which stopped the sampling, None while it works
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def run(self):
+        try:
+            self.sample()
+        except Exception as e:
+            self.logger.exception('Saving backlog sampling failed')
+            self.error = '%s: %s' % (e.__class__.__name__, e)
+            self.detector._notify()
+
+    def sample(self):
+        """
+        Sample the image counters until the sampler is stopped.
+
+        :return: None
+        """
+        t0 = time.time()
+        last_saved = None
+        last_change = 0.0
+        while not self._stop_event.is_set():
+            snapshot = self.detector.snapshot()
+            t = time.time() - t0
+            self.samples.append((t, snapshot.last_image,
+                                 snapshot.last_image_saved,
+                                 snapshot.acq_status))
+            if snapshot.last_image_saved != last_saved:
+                last_saved = snapshot.last_image_saved
+                last_change = t
+            elif self.stall_timeout is not None and not self.stalled and \
+                    snapshot.last_image > snapshot.last_image_saved and \
+                    t - last_change > self.stall_timeout:
+                self.logger.debug('Saving stalled at image %d (acquired %d)'
+                                  % (snapshot.last_image_saved,
+                                     snapshot.last_image))
+                self.stalled = True
+                self.detector._notify()
+            self._stop_event.wait(self.period)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def get_series(self):
+        """
+        Backlog and saving rate of each sample. The saving rate is computed
+        between consecutive samples.
+
+        :return: list of (t, acquired, saved, status, backlog, saving rate)
+        """
+        series = []
+        prev = None
+        for t, acquired, saved, status in self.samples:
+            rate = None
+            if prev is not None and t > prev[0]:
+                rate = (saved - prev[2]) / (t - prev[0])
+            series.append((t, acquired, saved, status, acquired - saved, rate))
+            prev = (t, acquired, saved)
+        return series
+
+    def get_stats(self):
+        """
+        Summary of the saving backlog.
+
+        :return: dictionary with the peak and average backlog, the average
+                 saving rate and the lowest saving rate between two samples
+                 while images were pending.
+        """
+        series = self.get_series()
+        if not series:
+            return {}
+        backlogs = [s[4] for s in series]
+        rates = [s[5] for s in series[1:] if s[4] > 0 and s[5] is not None]
+        duration = series[-1][0] - series[0][0]
+        saved = series[-1][2] - series[0][2]
+        return {'peak_backlog': max(backlogs),
+                'avg_backlog': sum(backlogs) / float(len(backlogs)),
+                'avg_saving_rate': saved / duration if duration else None,
+                'min_saving_rate': min(rates) if rates else None,
+                }
+
+    def write_csv(self, filename):
+        """
+        Write the sampled series to a CSV file.
+
+        :param filename: output file
+        :return: None
+        """
+        with open(filename, 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(['t', 'last_image_acquired', 'last_image_saved',
+                             'acq_status', 'backlog', 'saving_rate'])
+            for row in self.get_series():
+                writer.writerow(row)
@@ -0,0 +1,182 @@
+import numbers
+import logging
+import unittest
+from LimaTestSuite.LimaStats import repeat_stats
+
+
+class LimaRepeatSuite(unittest.TestSuite):
+    """
+    Runs a test case several times and reports the statistics of its
+    figures. The warm-up runs are not added to the report nor to the
+    statistics. With a CI target the test is run again, up to max_repeat
+    runs, until the 95% confidence interval of the mean of ci_metric is
+    narrower than ci_target times the mean. The failed runs are left out of
+    the statistics. It requires NumPy when more than one run is measured.
+
+    :param case: test case
+    :param repeat: minimum number of measured runs
+    :param warmup: number of runs done before the measured ones
+    :param ci_target: relative half width of the 95% confidence interval to
+                      reach, None to run the test repeat times
+    :param ci_metric: figure checked against ci_target, by default the saved
+                      or acquired frame rate
+    :param max_repeat: maximum number of measured runs with a CI target
+    """
+
+    # Figures checked against the CI target when ci_metric is not given
+    CI_METRICS = ['saved_fps', 'acq_fps']
+
+    # Default maximum number of measured runs with a CI target
+    MAX_REPEAT = 20
+
+    COLUMNS = [('metric', 'Metric', '%s'),
+               ('n', 'N', '%d'),
+               ('mean', 'Mean', '%.4g'),
+               ('std', 'Std', '%.4g'),
+               ('ci95', '95% CI +/-', '%.4g'),
+               ('rel_ci', 'CI %', '%.2f'),
+               ('min', 'Min', '%.4g'),
+               ('max', 'Max', '%.4g'),
+               ('nb_outliers', 'Outliers', '%d'),
+               ]
+
+    # The case is run several times, it must not be released after a run
+    _cleanup = False
+
+    def __init__(self, case, repeat=1, warmup=0, ci_target=None,
+                 ci_metric=None, max_repeat=None):
+        super(LimaRepeatSuite, self).__init__([case])
+        self.logger = logging.getLogger('LimaTestSuite')
+        self.case = case
+        self.repeat = repeat
+        self.warmup = warmup
+        self.ci_target = ci_target
+        self.ci_metric = ci_metric
+        if max_repeat is None:
+            max_repeat = max(self.MAX_REPEAT, repeat)
+        self.max_repeat = max_repeat
+        # (run number, figures) of each measured run which passed
+        self.samples = []
+
+    def _run_once(self, result):
+        """
+        Run the case once.
+
+        :return: True if the run passed
+        """
+        problems = len(result.errors) + len(result.failures)
+        super(LimaRepeatSuite, self).run(result)
+        return len(result.errors) + len(result.failures) == problems
+
+    def run(self, result, debug=False):
+        name = self.case.name
+        report = self.case.report
+        self.case.report = None
+        try:
+            for i in range(self.warmup):
+                if result.shouldStop:
+                    return result
+                self.logger.debug('Warm-up run %d of %s' % (i + 1, name))
+                self._run_once(result)
+        finally:
+            self.case.report = report
+
+        self.samples = []
+        runs = 0
+        reason = None
+        while not result.shouldStop:
+            runs += 1
+            if self._run_once(result):
+                self.samples.append((runs, dict(self.case.metrics)))
+            if runs < self.repeat:
+                continue
+            if not self.ci_target:
+                break
+            reason = self.check_precision()
+            if reason is not None:
+                break
+            if runs >= self.max_repeat:
+                reason = 'CI target not reached after %d runs' % runs
+                break
+        self.log_stats(runs, reason)
+        return result
+
+    def get_ci_metric(self):
+        if self.ci_metric:
+            return self.ci_metric
+        for metric in self.CI_METRICS:
+            if any(metric in s for _, s in self.samples):
+                return metric
+        return None
+
+    def check_precision(self):
+        """
+        Check the confidence interval of ci_metric against the target. It
+        is computed over all the passed runs, the outliers are not left out
+        so that they cannot narrow it and stop the runs too early.
+
+        :return: reason to stop the runs, None to keep running
+        """
+        metric = self.get_ci_metric()
+        values = [s.get(metric) for _, s in self.samples]
+        values = [v for v in values if self._is_number(v)]
+        if metric is None or (self.samples and not values):
+            return 'no %s figure to check the CI target' % \
+                (metric or 'saved_fps/acq_fps')
+        if len(values) < 2:
+            return None
+        stats = repeat_stats(values, threshold=None)
+        self.logger.debug('%s: %s CI %s after %d run(s)' %
+                          (self.case.name, metric, stats['rel_ci'],
+                           len(values)))
+        if stats['rel_ci'] is not None and stats['rel_ci'] <= self.ci_target:
+            return 'CI target of %s reached after %d runs' % (metric,
+                                                               len(values))
+        return None
+
+    @staticmethod
+    def _is_number(value):
+        return isinstance(value, numbers.Real) and \
+            not isinstance(value, bool)
+
+    def get_stats(self):
+        """
+        Statistics of each numeric figure measured by at least two runs.
+
+        :return: list of dictionaries, one per figure
+        """
+        metrics = set()
+        for _, sample in self.samples:
+            metrics.update(k for k, v in sample.items() if self._is_number(v))
+        rows = []
+        for metric in sorted(metrics):
+            samples = [(run, s[metric]) for run, s in self.samples
+                       if self._is_number(s.get(metric))]
+            if len(samples) < 2:
+                continue
+            stats = repeat_stats([v for _, v in samples])
+            if stats['rel_ci'] is not None:
+                stats['rel_ci'] *= 100
+            # Run numbers of the outliers
+            stats.update({'metric': metric,
+                          'outliers': [samples[i][0]
+                                       for i in stats['outliers']],
+                          'nb_outliers': len(stats['outliers'])})
+            rows.append(stats)
+        return rows
+
+    def log_stats(self, runs, reason=None):
+        rows = self.get_stats()
+        if not rows or self.case.report is None:
+            return
+        notes = ['Warm-up runs: %d, measured runs: %d, passed: %d' %
+                 (self.warmup, runs, len(self.samples))]
+        if reason:
+            notes.append(reason)
+        for row in rows:
+            if row['outliers']:
+                notes.append('%s: run(s) %s rejected as outlier(s)' %
+                             (row['metric'],
+                              ', '.join(str(r) for r in row['outliers'])))
+        self.case.report.add_table('Repeats %s' % self.case.name,
+                                   self.COLUMNS, rows, notes)
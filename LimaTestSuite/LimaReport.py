@@ -0,0 +1,186 @@
+import logging
+
+
+class LimaPerformanceReport(object):
+    """
+    Collects the figures measured by the performance tests and formats them
+    as a summary table to be shown at the end of the test suite.
+    """
+
+    # (key, header, format) of each column of the summary table
+    COLUMNS = [('name', 'Test', '%s'),
+               ('frames', 'Frames', '%d'),
+               ('acq_fps', 'Acq fps', '%.2f'),
+               ('saved_fps', 'Saved fps', '%.2f'),
+               ('mb_written', 'MB', '%.2f'),
+               ('mb_per_sec', 'MB/s', '%.2f'),
+               ('first_frame', 'First (s)', '%.3f'),
+               ('last_frame', 'Last (s)', '%.3f'),
+               ('peak_backlog', 'Max backlog', '%d'),
+               ('cpu_percent', 'CPU %', '%.1f'),
+               ('peak_rss_mb', 'Peak RSS (MB)', '%.1f'),
+               ('disk_util', 'Disk util %', '%.1f'),
+               ]
+
+    # Figures shown in the grid of the swept tests, averaged over the repeats
+    GRID_COLUMNS = [('acq_fps', 'Acq fps', '%.2f'),
+                    ('saved_fps', 'Saved fps', '%.2f'),
+                    ('mb_per_sec', 'MB/s', '%.2f'),
+                    ('cpu_percent', 'CPU %', '%.1f'),
+                    ]
+
+    def __init__(self):
+        self.logger = logging.getLogger('LimaTestSuite')
+        self.records = []
+        # Records of every test run, stored in the results history
+        self.runs = []
+        # Extra tables of the specific test types:
+        # (title, columns, rows, notes)
+        self.tables = []
+
+    def add(self, name, metrics, section=None, sweep=None):
+        """
+        Add the figures of a test run to the report.
+
+        :param name: test name
+        :param metrics: dictionary with the measured figures
+        :param section: configuration section of the test, by default its name
+        :param sweep: values of the swept parameters of the test
+        :return: None
+        """
+        record = {'name': name,
+                  'section': section or name,
+                  'sweep': dict(sweep or {}),
+                  }
+        record.update(metrics)
+        self.records.append(record)
+
+    def add_run(self, record):
+        """
+        Add the record of a test run (timings, figures...) to the report.
+
+        :param record: dictionary
+        :return: None
+        """
+        self.runs.append(record)
+
+    def add_table(self, title, columns, rows, notes=None):
+        """
+        Add a table with the results of a test to the report.
+
+        :param title: title shown above the table
+        :param columns: list of (key, header, format) of each column
+        :param rows: list of dictionaries
+        :param notes: list of lines shown below the table
+        :return: None
+        """
+        self.tables.append((title, columns, rows, notes or []))
+
+    @staticmethod
+    def _format_value(fmt, value):
+        if value is None:
+            return '-'
+        return fmt % value
+
+    @staticmethod
+    def _format_rows(rows):
+        """
+        Align the rows in columns, the first row is the header.
+
+        :param rows: list of lists of strings
+        :return: list of lines
+        """
+        widths = [max(len(row[i]) for row in rows)
+                  for i in range(len(rows[0]))]
+        lines = []
+        for row in rows:
+            cells = [cell.rjust(w) for cell, w in zip(row, widths)]
+            lines.append(' | '.join(cells))
+        lines.insert(1, '-+-'.join('-' * w for w in widths))
+        return lines
+
+    def format_table(self, columns=None, records=None):
+        """
+        Format the collected records as a text table.
+
+        :param columns: list of (key, header, format), by default COLUMNS
+        :param records: list of dictionaries, by default the collected records
+        :return: list of lines
+        """
+        if columns is None:
+            columns = self.COLUMNS
+        if records is None:
+            records = self.records
+        rows = [[h for _, h, _ in columns]]
+        for record in records:
+            rows.append([self._format_value(fmt, record.get(key))
+                         for key, _, fmt in columns])
+        return self._format_rows(rows)
+
+    @staticmethod
+    def _sweep_value(value):
+        # List values (binning, ROI...) are used as tuples in the grid
+        if isinstance(value, list):
+            return tuple(value)
+        return value
+
+    @staticmethod
+    def _format_sweep_value(value):
+        if isinstance(value, tuple):
+            return 'x'.join(str(v) for v in value)
+        return str(value)
+
+    @staticmethod
+    def _mean(values):
+        values = [v for v in values if v is not None]
+        if not values:
+            return None
+        return sum(values) / float(len(values))
+
+    def format_grid(self, section):
+        """
+        Format the records of a swept test as a grid with one row per
+        combination of the swept parameters.
+
+        :param section: configuration section of the swept test
+        :return: list of lines
+        """
+        records = [r for r in self.records
+                   if r['section'] == section and r['sweep']]
+        keys = sorted(records[0]['sweep'].keys())
+        combinations = {}
+        for record in records:
+            combination = tuple(self._sweep_value(record['sweep'].get(k))
+                                for k in keys)
+            combinations.setdefault(combination, []).append(record)
+
+        rows = [keys + [h for _, h, _ in self.GRID_COLUMNS]]
+        for combination in sorted(combinations):
+            runs = combinations[combination]
+            row = [self._format_sweep_value(v) for v in combination]
+            for key, _, fmt in self.GRID_COLUMNS:
+                value = self._mean([r.get(key) for r in runs])
+                row.append(self._format_value(fmt, value))
+            rows.append(row)
+        return self._format_rows(rows)
+
+    def log_summary(self):
+        for title, columns, rows, notes in self.tables:
+            self.logger.info('%s:' % title)
+            for line in self.format_table(columns, rows) + notes:
+                self.logger.info(line)
+
+        if not self.records:
+            return
+        self.logger.info('Performance summary:')
+        for line in self.format_table():
+            self.logger.info(line)
+
+        sections = []
+        for record in self.records:
+            if record['sweep'] and record['section'] not in sections:
+                sections.append(record['section'])
+        for section in sections:
+            self.logger.info('Sweep %s:' % section)
+            for line in self.format_grid(section):
+                self.logger.info(line)
@@ -0,0 +1,132 @@
+import os
+import json
+import logging
+
+
+class LimaResultsStore(object):
+    """
+    History of the test runs stored as JSON lines, one record per test run.
+    It is used to compare a run with the previous ones and detect
+    performance regressions.
+
+    :param filename: JSON lines file
+    """
+
+    # Metrics compared with the baseline and their direction: 1 when higher
+    # is better, -1 when lower is better
+    METRICS = {'acq_fps': 1,
+               'saved_fps': 1,
+               'mb_per_sec': 1,
+               'avg_saving_rate': 1,
+               'first_frame': -1,
+               'last_frame': -1,
+               'write_config_p50': -1,
+               'prepare_acq_p50': -1,
+               'start_p50': -1,
+               'first_frame_p50': -1,
+               'stop_to_ready_p50': -1,
+               'ready_for_new_p50': -1,
+               }
+
+    # Number of previous runs used to compute the baseline
+    HISTORY_SIZE = 10
+
+    def __init__(self, filename):
+        self.logger = logging.getLogger('LimaTestSuite')
+        self.filename = filename
+
+    def load(self):
+        """
+        Read the stored records.
+
+        :return: list of dictionaries
+        """
+        records = []
+        if not os.path.isfile(self.filename):
+            return records
+        with open(self.filename) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    self.logger.warning('Invalid record in %s: %s' %
+                                        (self.filename, line))
+        return records
+
+    def append(self, records):
+        """
+        Store new records.
+
+        :param records: list of dictionaries
+        :return: None
+        """
+        with open(self.filename, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, sort_keys=True) + '\n')
+
+    @staticmethod
+    def _key(record):
+        return (record['name'], record['config_hash'], record['det_type'],
+                record.get('tango'))
+
+    @staticmethod
+    def _median(values):
+        values = sorted(values)
+        n = len(values)
+        if n % 2:
+            return values[n // 2]
+        return (values[n // 2 - 1] + values[n // 2]) / 2.0
+
+    def get_baselines(self, history):
+        """
+        Compute the baseline of each metric as the median of the last passed
+        runs of the same test and configuration.
+
+        :param history: list of stored records
+        :return: dictionary {key: {metric: baseline}}
+        """
+        runs = {}
+        for record in history:
+            if record.get('passed'):
+                runs.setdefault(self._key(record), []).append(record)
+        baselines = {}
+        for key, records in runs.items():
+            records = records[-self.HISTORY_SIZE:]
+            baseline = {}
+            for metric in self.METRICS:
+                values = [r['metrics'][metric] for r in records
+                          if r.get('metrics', {}).get(metric) is not None]
+                if values:
+                    baseline[metric] = self._median(values)
+            baselines[key] = baseline
+        return baselines
+
+    def compare(self, records, tolerance):
+        """
+        Compare the records of the current run with the stored history.
+
+        :param records: records of the current run
+        :param tolerance: allowed relative degradation (0.1 = 10%)
+        :return: list of regression messages
+        """
+        baselines = self.get_baselines(self.load())
+        regressions = []
+        for record in records:
+            baseline = baselines.get(self._key(record))
+            if not baseline:
+                continue
+            for metric, direction in sorted(self.METRICS.items()):
+                value = record.get('metrics', {}).get(metric)
+                reference = baseline.get(metric)
+                if value is None or not reference:
+                    continue
+                change = direction * (value - reference) / float(reference)
+                if change < -tolerance:
+                    regressions.append(
+                        '%s: %s = %.4g, baseline %.4g (%+.1f%%)' %
+                        (record['name'], metric, value, reference,
+                         100 * (value - reference) / float(reference)))
+        return regressions
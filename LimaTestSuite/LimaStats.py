@@ -0,0 +1,141 @@
+import math
+
+
+def percentile(values, p):
+    """
+    Percentile of the values, interpolated linearly between the closest
+    ranks.
+
+    :param values: list of numbers
+    :param p: percentile between 0 and 100
+    :return: number or None if there are no values
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * p / 100.0
+    lower = int(math.floor(k))
+    upper = int(math.ceil(k))
+    if lower == upper:
+        return values[lower]
+    return values[lower] + (values[upper] - values[lower]) * (k - lower)
+
+
+def linear_fit(xs, ys):
+    """
+    Least squares fit of a straight line.
+
+    :param xs: list of numbers
+    :param ys: list of numbers
+    :return: (slope, intercept)
+    """
+    n = float(len(xs))
+    mean_x = sum(xs) / n
+    mean_y = sum(ys) / n
+    sxx = sum((x - mean_x) ** 2 for x in xs)
+    if not sxx:
+        return 0.0, mean_y
+    sxy = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys))
+    slope = sxy / sxx
+    return slope, mean_y - slope * mean_x
+
+
+def format_histogram(values, bins=10, width=40, fmt='%.3f'):
+    """
+    Format the distribution of the values as an ASCII histogram, one line
+    per bin.
+
+    :param values: list of numbers
+    :param bins: number of bins
+    :param width: length of the longest bar
+    :param fmt: format of the bin limits
+    :return: list of lines
+    """
+    if not values:
+        return []
+    low, high = min(values), max(values)
+    step = (high - low) / float(bins) or 1.0
+    counts = [0] * bins
+    for value in values:
+        counts[min(int((value - low) / step), bins - 1)] += 1
+    top = max(counts)
+    labels = ['[%s, %s)' % (fmt % (low + i * step),
+                            fmt % (low + (i + 1) * step))
+              for i in range(bins)]
+    label_width = max(len(label) for label in labels)
+    lines = []
+    for label, count in zip(labels, counts):
+        bar = '#' * int(round(width * count / float(top)))
+        lines.append('%s %s %d' % (label.rjust(label_width), bar, count))
+    return lines
+
+
+# Two-sided 95% quantile of the Student t distribution for the degrees of
+# freedom tabulated, the value of the closest lower ones is used otherwise
+_T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447,
+        7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228, 11: 2.201, 12: 2.179,
+        13: 2.160, 14: 2.145, 15: 2.131, 16: 2.120, 17: 2.110, 18: 2.101,
+        19: 2.093, 20: 2.086, 21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064,
+        25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042,
+        40: 2.021, 60: 2.000, 120: 1.980}
+
+
+def t_quantile_95(df):
+    """
+    Two-sided 95% quantile of the Student t distribution.
+
+    :param df: degrees of freedom
+    :return: number
+    """
+    lower = [k for k in _T95 if k <= df]
+    if not lower:
+        return None
+    if df > 120:
+        return 1.960
+    return _T95[max(lower)]
+
+
+def repeat_stats(values, threshold=3.5, min_mad=0.01):
+    """
+    Statistics of a figure measured by several runs of a test. The outliers
+    are detected with the modified z-score based on the median absolute
+    deviation (MAD) and left out of the mean, standard deviation and 95%
+    confidence interval of the mean. The MAD is at least min_mad times the
+    median, so that runs a few per cent apart are not rejected when the
+    others are almost equal, and less than half of the values are rejected,
+    the furthest from the median. It requires NumPy.
+
+    :param values: list of numbers, one per run
+    :param threshold: modified z-score above which a value is an outlier,
+                      None to keep all the values
+    :param min_mad: minimum MAD relative to the median
+    :return: dictionary (n, mean, std, ci95, rel_ci, min, max, outliers), the
+             outliers are the indexes of the rejected values
+    """
+    import numpy
+    data = numpy.asarray(values, dtype=float)
+    median = numpy.median(data)
+    mad = max(numpy.median(numpy.abs(data - median)),
+              min_mad * abs(median))
+    outliers = numpy.zeros(data.shape, dtype=bool)
+    if threshold is not None and mad > 0:
+        score = numpy.abs(0.6745 * (data - median) / mad)
+        # The furthest values first, less than half of the sample
+        order = numpy.argsort(-score, kind='mergesort')
+        rejected = order[:(data.size - 1) // 2]
+        outliers[rejected[score[rejected] > threshold]] = True
+    kept = data[~outliers]
+    n = kept.size
+    mean = float(kept.mean())
+    std = float(kept.std(ddof=1)) if n > 1 else None
+    ci95 = t_quantile_95(n - 1) * std / math.sqrt(n) if n > 1 else None
+    rel_ci = ci95 / abs(mean) if ci95 is not None and mean else None
+    return {'n': n,
+            'mean': mean,
+            'std': std,
+            'ci95': ci95,
+            'rel_ci': rel_ci,
+            'min': float(kept.min()),
+            'max': float(kept.max()),
+            'outliers': [int(i) for i in numpy.nonzero(outliers)[0]],
+            }
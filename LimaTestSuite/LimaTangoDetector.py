@@ -1,7 +1,56 @@
+import os
 import time
+import socket
+import struct
 import PyTango
-from Lima import Core
-from LimaTestSuite.LimaDetector import LimaDetector
+from LimaTestSuite.LimaCore import Core
+from LimaTestSuite.LimaDetector import LimaDetector, LimaStatus
+from LimaTestSuite.LimaMonitor import get_cpu_times
+from LimaTestSuite.LimaTracer import traced
+
+
+# Header of the DATA_ARRAY encoded images of the LimaCCDs image commands:
+# magic, version, header size, category, data type, endianness, number of
+# dimensions, dimensions and steps
+DATA_ARRAY_HEADER = '<IHHIIHH6H6I'
+DATA_ARRAY_MAGIC = struct.unpack('>I', 'DTAY')[0]
+
+# NumPy type of each DATA_ARRAY data type
+DATA_ARRAY_TYPES = ['uint8', 'int8', 'uint16', 'int16', 'uint32', 'int32',
+                    'uint64', 'int64', 'float32', 'float64']
+
+
+def decode_data_array(encoded, out=None):
+    """
+    Decode a DATA_ARRAY image returned by readImage or readImageSeq. The
+    returned array is a view of the received data, unless out is given.
+
+    :param encoded: DevEncoded value (format, data)
+    :param out: preallocated NumPy array where the frames are copied
+    :return: NumPy array (frames, height, width)
+    """
+    import numpy
+
+    fmt, data = encoded
+    header = struct.unpack_from(DATA_ARRAY_HEADER, data)
+    magic, header_size, data_type, big_endian, nb_dim = \
+        header[0], header[2], header[4], header[5], header[6]
+    if fmt != 'DATA_ARRAY' or magic != DATA_ARRAY_MAGIC:
+        raise ValueError('Invalid image encoding: %s' % fmt)
+    dims = header[7:7 + nb_dim]
+    dtype = numpy.dtype(DATA_ARRAY_TYPES[data_type])
+    dtype = dtype.newbyteorder('>' if big_endian else '<')
+    image = numpy.frombuffer(data, dtype, offset=header_size)
+    # The dimensions are width, height[, frames]
+    shape = tuple(reversed(dims))
+    if nb_dim == 2:
+        shape = (1,) + shape
+    image = image.reshape(shape)
+    if out is not None:
+        out = out[:shape[0]]
+        out[...] = image
+        return out
+    return image
 
 
 class LimaTangoDetector(LimaDetector):
@@ -12,40 +61,96 @@ class LimaTangoDetector(LimaDetector):
                     'EXTERNAL_GATE': 'EXTERNAL_GATE',
                     }
 
+    _tango_status = {'Ready': Core.AcqReady,
+                     'Running': Core.AcqRunning,
+                     'Fault': Core.AcqFault,
+                     }
+
+    # Attributes read by snapshot, in the LimaStatus order
+    _snapshot_attrs = ['acq_status',
+                       'last_image_acquired',
+                       'last_base_image_ready',
+                       'last_image_ready',
+                       'last_image_saved',
+                       'last_counter_ready',
+                       ]
+
+    # Attributes whose change events wake up wait_event
+    _event_attrs = ['last_image_saved', 'acq_status']
+
+    # Attributes changed by the device itself (the next file number advances
+    # after each saving acquisition), always written
+    _volatile_attrs = ['saving_next_number']
+
     def init_hw(self):
         self.device = PyTango.DeviceProxy(self._config.device_name)
+        self._event_ids = []
+        # Last value written to each attribute
+        self._written = {}
+        self._lima_version = None
+        # Buffer parameters of the device, restored when a test does not
+        # set them
+        self._buffer_defaults = {}
+        try:
+            self._buffer_defaults['maxMemory'] = \
+                self.device.read_attribute('buffer_max_memory').value
+        except PyTango.DevFailed:
+            pass
+        # Number of writing tasks of the device, restored when a test does
+        # not set it
+        self._max_tasks_default = None
+        try:
+            self._max_tasks_default = \
+                self.device.read_attribute('saving_max_writing_task').value
+        except PyTango.DevFailed:
+            pass
+        self._server_pid = self.get_server_pid()
+
+    def get_server_pid(self):
+        """
+        Process id of the device server, when it runs on the same host as
+        the test, so its resources can be read from /proc.
 
+        :return: pid or None if the server is remote or unknown
+        """
+        try:
+            info = self.device.get_device_db().get_device_info(
+                self.device.dev_name())
+        except PyTango.DevFailed:
+            return None
+        host = info.host.split('.')[0]
+        if host not in (socket.gethostname().split('.')[0], 'localhost') or \
+                not os.path.isdir('/proc/%d' % info.pid):
+            self.logger.debug('Device server %s is not local, its CPU time '
+                              'is not measured', info.host)
+            return None
+        return info.pid
 
     def __del__(self):
         self.logger.debug("Deleting")
+        self.disable_events()
         # Wait for server to disconnect before any other re-connection
         time.sleep(0.1)
 
-    def write_config_hw(self):
+    @traced
+    def write_config_hw(self, force=False):
         """
-        Set the acquisition configuration from dictionary.
+        Set the acquisition configuration from dictionary. The attributes
+        are written with a single request and only the ones whose value
+        changed since the last write are sent.
 
-        :param config: acquisition configuration dictionary.
+        :param force: write all the attributes even if they did not change
         :return: None
         """
         # Acquisition parameters
         exp_time = self._AcqConfig['acqExpoTime']
         frames = self._AcqConfig['acqNbFrames']
-        acq_mode = self._AcqConfig['acqMode']
+        acq_mode = self._AcqConfig['acqMode'].upper()
         trigger_mode = self._tango_tmode[self._AcqConfig['triggerMode'].upper()]
         latency_time = self._AcqConfig['latencyTime']
         acc_expo_time = self._AcqConfig['accMaxExpoTime']
         concat_frames = self._AcqConfig['concatNbFrames']
 
-        
-        self.device.write_attribute('acq_nb_frames', frames)
-        self.device.write_attribute('acq_expo_time', exp_time)
-        self.device.write_attribute('latency_time', latency_time)
-        self.device.write_attribute('acq_trigger_mode', trigger_mode)
-        self.device.write_attribute('acq_mode', acq_mode)
-        self.device.write_attribute('acc_max_expo_time', acc_expo_time)
-        self.device.write_attribute('concat_nb_frames', concat_frames)
-
         # Saving parameters
         directory = self._SavingConfig['directory']
         prefix = self._SavingConfig['prefix']
@@ -59,24 +164,128 @@ class LimaTangoDetector(LimaDetector):
         # TODO ask to the mailing list how to set this value
         nb_frames = self._SavingConfig['nbframes']
 
-        self.device.write_attribute('saving_directory', directory)
-        self.device.write_attribute('saving_prefix', prefix)
-        self.device.write_attribute('saving_suffix', suffix)
-        self.device.write_attribute('saving_format', file_format)
-        self.device.write_attribute('saving_frame_per_file', frames_file)
-        self.device.write_attribute('saving_mode', saving_mode)
-        self.device.write_attribute('saving_overwrite_policy', overwrite)
-        self.device.write_attribute('saving_next_number', next_nb)
+        values = [('acq_nb_frames', frames),
+                  ('acq_expo_time', exp_time),
+                  ('latency_time', latency_time),
+                  ('acq_trigger_mode', trigger_mode),
+                  ('acq_mode', acq_mode),
+                  ('acc_max_expo_time', acc_expo_time),
+                  ('concat_nb_frames', concat_frames),
+                  ('saving_directory', directory),
+                  ('saving_prefix', prefix),
+                  ('saving_suffix', suffix),
+                  ('saving_format', file_format),
+                  ('saving_frame_per_file', frames_file),
+                  ('saving_mode', saving_mode),
+                  ('saving_overwrite_policy', overwrite),
+                  ('saving_next_number', next_nb),
+                  ]
+        max_tasks = self._SavingConfig.get('maxConcurrentWritingTask',
+                                           self._max_tasks_default)
+        if max_tasks is not None:
+            values.append(('saving_max_writing_task', max_tasks))
+
+        # Buffer parameters. LimaCCDs only exposes the maximum memory, the
+        # number of buffers follows from it.
+        buffer_config = dict(self._buffer_defaults)
+        buffer_config.update(self._BufferConfig)
+        if 'maxMemory' in buffer_config:
+            values.append(('buffer_max_memory', buffer_config['maxMemory']))
+        if 'nbBuffers' in self._BufferConfig:
+            self.logger.warning('nbBuffers cannot be set through Tango, '
+                                'use maxMemory')
+
+        # Image parameters, the ROI is relative to the binned and rotated
+        # image so it is written last
+        image = self.get_image_config()
+        rotation = image['rotation']
+        image_values = [('image_bin', image['bin']),
+                        ('image_flip', image['flip']),
+                        ('image_rotation',
+                         str(rotation) if rotation else 'NONE'),
+                        ]
+        if any(self._written.get(attr) != value
+               for attr, value in image_values):
+            self._written.pop('image_roi', None)
+        values += image_values + [('image_roi', image['roi'])]
+        self._write_attributes(values, force)
 
+    def _write_attributes(self, values, force=False):
+        """
+        Write the attributes which changed since the last write with a single
+        write_attributes request. The attributes the device changes by
+        itself are always written.
+
+        :param values: list of (attribute, value)
+        :param force: write all the attributes even if they did not change
+        :return: None
+        """
+        if force:
+            changed = list(values)
+        else:
+            changed = [(attr, value) for attr, value in values
+                       if attr in self._volatile_attrs or
+                       attr not in self._written or
+                       self._written[attr] != value]
+        if changed:
+            try:
+                self.device.write_attributes(changed)
+            except Exception:
+                # The device state is unknown, write everything next time
+                self._written.clear()
+                raise
+            self._written.update(changed)
+        self._count_writes(len(changed), len(values) - len(changed))
+
+    def invalidate_cache(self):
+        self._written.clear()
+
+    @traced
     def prepare_acq(self):
         self.device.prepareAcq()
 
+    @traced
     def start(self):
         self.device.startAcq()
 
+    @traced
     def stop(self):
         self.device.stopAcq()
 
+    def _on_event(self, event):
+        if event.err:
+            self.logger.debug("Event error on %s: %s", event.attr_name,
+                              event.errors)
+        self._notify()
+
+    def enable_events(self):
+        """
+        Subscribe to the change events of the device. When the device does
+        not push them the events already subscribed are released and
+        wait_event falls back to waiting the whole poll time.
+
+        :return: True if the events are enabled
+        """
+        if self._event_ids:
+            return True
+        for attr in self._event_attrs:
+            try:
+                event_id = self.device.subscribe_event(
+                    attr, PyTango.EventType.CHANGE_EVENT, self._on_event)
+            except PyTango.DevFailed as e:
+                self.logger.warning('Cannot subscribe to the change events '
+                                    'of %s, polling the device instead: %s',
+                                    attr, e)
+                self.disable_events()
+                return False
+            self._event_ids.append(event_id)
+        return True
+
+    def disable_events(self):
+        for event_id in self._event_ids:
+            self.device.unsubscribe_event(event_id)
+        self._event_ids = []
+
     @LimaDetector.acq_time.getter
     def acq_time(self):
         exp_time = self.device.read_attribute('acq_expo_time').value
@@ -89,26 +298,65 @@ class LimaTangoDetector(LimaDetector):
         return self.device.read_attribute('acq_nb_frames').value
 
     @LimaDetector.last_image.getter
+    @traced
     def last_image(self):
         return self.device.read_attribute('last_image_acquired').value
 
     @LimaDetector.last_image_saved.getter
+    @traced
     def last_image_saved(self):
         return self.device.read_attribute('last_image_saved').value
 
     @LimaDetector.acq_status.getter
+    @traced
     def acq_status(self):
         tango_status = self.device.read_attribute('acq_status').value
-        status = Core.AcqReady
-        if tango_status == 'Ready':
-            status = Core.AcqReady
-        elif tango_status == 'Running':
-            status = Core.AcqRunning
-        elif tango_status == 'Fault':
-            status = Core.AcqFault
-        return status
+        return self._tango_status.get(tango_status, Core.AcqReady)
 
     @LimaDetector.status.getter
+    @traced
     def status(self):
         return self.device.read_attribute('acq_status_fault_error').value
 
+    @LimaDetector.frame_size.getter
+    def frame_size(self):
+        attrs = ['image_width', 'image_height', 'image_type']
+        width, height, image_type = [attr.value for attr in
+                                     self.device.read_attributes(attrs)]
+        # image_type is Bpp<bits>[S|F]
+        bits = int(image_type[3:].rstrip('SF'))
+        return width * height * ((bits + 7) // 8)
+
+    @LimaDetector.lima_version.getter
+    def lima_version(self):
+        if self._lima_version is None:
+            try:
+                self._lima_version = \
+                    self.device.read_attribute('lima_version').value
+            except PyTango.DevFailed:
+                self._lima_version = ''
+        return self._lima_version or None
+
+    @traced
+    def read_images(self, first, count, out=None):
+        if count == 1:
+            encoded = self.device.readImage(first)
+        else:
+            encoded = self.device.readImageSeq([first, first + count])
+        return decode_data_array(encoded, out)
+
+    def get_cpu_time(self):
+        if self._server_pid is None:
+            return None
+        user, system = get_cpu_times(self._server_pid)
+        if user is None:
+            return None
+        return user + system
+
+    @traced
+    def snapshot(self):
+        values = [attr.value for attr in
+                  self.device.read_attributes(self._snapshot_attrs)]
+        values[0] = self._tango_status.get(values[0], Core.AcqReady)
+        return LimaStatus(*values)
+
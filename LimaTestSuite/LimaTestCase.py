@@ -1,106 +1,1546 @@
+import os
+import csv
 import time
 import logging
+from contextlib import contextmanager
 from unittest import TestCase
-from Lima import Core
+from LimaTestSuite.LimaCore import Core
 from LimaTestSuite.LimaDetector import LimaCoreDetector
+from LimaTestSuite.LimaDetectorPool import LimaDetectorPool
+from LimaTestSuite import LimaEstimate
+from LimaTestSuite.LimaFileVerifier import LimaFileVerifier
+from LimaTestSuite.LimaMonitor import LimaBacklogSampler, \
+    LimaResourceSampler, get_process_usage
+from LimaTestSuite.LimaStats import percentile, format_histogram, linear_fit
+from LimaTestSuite.LimaTracer import tracer
 
 
 class LimaCCDBaseTestCase(TestCase):
-    def __init__(self, config, debug=False, tango_mode=False):
+    def __init__(self, config, debug=False, tango_mode=False, report=None,
+                 events=False, pool=None):
         super(LimaCCDBaseTestCase, self).__init__()
         self.tango_mode = tango_mode
         self.test_config = config
         self.name = config.name
+        self.report = report
+        self.events = events
+        if pool is None:
+            pool = LimaDetectorPool(tango_mode, fresh=True)
+        self.pool = pool
         if debug and not tango_mode:
             LimaCoreDetector.set_debug()
         self.logger = logging.getLogger('LimaTestSuite')
 
+        # Duration of each phase and figures measured by the last run
+        self.timings = {}
+        self.metrics = {}
+        self.lima_version = None
+        # Number of trace files written
+        self.trace_runs = 0
+
     def fail(self, msg=None):
         TestCase.fail(self, "%s FAILED with msg = %s" % (self.name, msg))
 
+    @contextmanager
+    def phase(self, name):
+        """
+        Measure the wall-clock duration of a phase of the test. The phase is
+        traced as phase:<name>, not to be mistaken for the detector call of
+        the same name it wraps.
+
+        :param name: phase name
+        """
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.time() - t0
+            tracer.complete('phase:%s' % name, t0, {'test': self.name})
+
+    def run(self, result=None):
+        self.timings = {}
+        self.metrics = {}
+        tracer.clear()
+        try:
+            if result is None:
+                return super(LimaCCDBaseTestCase, self).run(result)
+            problems = len(result.errors) + len(result.failures)
+            super(LimaCCDBaseTestCase, self).run(result)
+            passed = len(result.errors) + len(result.failures) == problems
+            if self.report is not None:
+                self.report.add_run(self.get_run_record(passed))
+        finally:
+            if tracer.enabled:
+                self.export_trace()
+
+    def export_trace(self):
+        """
+        Write the events traced during the last run to a Chrome trace file
+        next to the test folder, <test folder>_trace.json. The file of each
+        repeated run is numbered, <test folder>_trace_<n>.json.
+
+        :return: None
+        """
+        directory = self.test_config.saving_params.get('directory')
+        if not directory or not len(tracer):
+            return
+        self.trace_runs += 1
+        suffix = '_trace.json' if self.trace_runs == 1 else \
+            '_trace_%d.json' % self.trace_runs
+        filename = directory.rstrip(os.sep) + suffix
+        try:
+            nb_events = tracer.export(filename)
+        except (IOError, OSError) as e:
+            self.logger.warning('Cannot write the trace of %s: %s' %
+                                (self.name, e))
+            return
+        self.logger.debug('Trace of %s: %d event(s) in %s' %
+                          (self.name, nb_events, filename))
+
+    def get_run_record(self, passed):
+        """
+        Build the record of the last run stored in the results history.
+
+        :param passed: True if the test passed
+        :return: dictionary
+        """
+        config = self.test_config
+        return {'timestamp': time.time(),
+                'name': self.name,
+                'section': config.section,
+                'type': config.type,
+                'det_type': config.det_type,
+                'tango': self.tango_mode,
+                'config_hash': config.get_hash(),
+                'lima_version': self.lima_version,
+                'passed': passed,
+                'sweep': config.sweep,
+                'timings': self.timings,
+                'metrics': self.metrics,
+                }
+
     def setUp(self):
         """
         Sets the configuration passed to the detector.
 
         :return: None
         """
-        self.logger.debug('*** Starting test %s ***' % self.name)
-        self.logger.debug('Test folder = %s' %
-                          self.test_config.saving_params['directory'])
-        if self.tango_mode:
-            from LimaTestSuite.LimaTangoDetector import LimaTangoDetector
-            self.detector = LimaTangoDetector(self.test_config)
-        else:
-            self.detector = LimaCoreDetector(self.test_config)
-        self.detector.print_config()
+        with self.phase('setup'):
+            self.logger.debug('*** Starting test %s ***' % self.name)
+            self.logger.debug('Test folder = %s' %
+                              self.test_config.create_folder())
+            self.detector = self.pool.get(self.test_config)
+            self.detector.print_config()
+            self.lima_version = self.detector.lima_version
 
     def runTest(self):
         raise NotImplementedError('You must implement it.')
 
     def tearDown(self):
-        raise NotImplementedError('You must implement it.')
+        """
+        Gives the detector back to the pool.
+
+        :return: None
+        """
+        with self.phase('teardown'):
+            self.logger.debug('*** Teardown for test %s ***' % self.name)
+            self.pool.release(self.detector)
+            del self.detector
 
 
 class LimaCCDAcquisitionTest(LimaCCDBaseTestCase):
-    def __init__(self, config, abort=False, debug=False, tango_mode=False):
-        super(LimaCCDAcquisitionTest, self).__init__(config, debug, tango_mode)
+
+    # Maximum time between two readings of the acquisition status while
+    # waiting for the end of the acquisition
+    READY_POLL_TIME = 1
+    EVENT_READY_POLL_TIME = 0.01
+
+    # Default time the saving can stay still before failing the test, when
+    # the backlog sampling is enabled
+    STALL_TIMEOUT = 10.0
+
+    # Default sampling rate of the resources used by the test
+    RESOURCE_RATE = 2.0
+
+    # Time between two status readings of the abort test and minimum time
+    # to wait for a state change before failing
+    ABORT_POLL_TIME = 0.0005
+    ABORT_TIMEOUT = 10.0
+
+    # Measures of the abort test and the scale used in the report
+    ABORT_MEASURES = [('stop_to_ready', 1000),
+                      ('ready_for_new', 1000),
+                      ('acquired_after_stop', 1),
+                      ('saved_after_stop', 1),
+                      ]
+
+    ABORT_COLUMNS = [('measure', 'Measure (ms or images)', '%s'),
+                     ('n', 'N', '%d'),
+                     ('p50', 'p50', '%.3f'),
+                     ('p90', 'p90', '%.3f'),
+                     ('p99', 'p99', '%.3f'),
+                     ('max', 'Max', '%.3f'),
+                     ]
+
+    def __init__(self, config, abort=False, debug=False, tango_mode=False,
+                 report=None, events=False, pool=None):
+        super(LimaCCDAcquisitionTest, self).__init__(config, debug, tango_mode,
+                                                     report, events, pool)
         self.abort = abort
+        self.start_time = 0.0
+        self.img_idx = -1
+        self.sampler = None
+        self.backlog_stats = {}
+        self.frame_checker = None
+        self.frame_stats = {}
+        self.resource_sampler = None
+        self.resource_stats = {}
+
+    def wait(self, timeout):
+        """
+        Wait for the next iteration of the acquisition monitor loop. In events
+        mode it returns as soon as the detector notifies a change, and with
+        the backlog sampler as soon as it detects a stall.
+
+        :param timeout: maximum time to wait in seconds
+        :return: None
+        """
+        with tracer.span('wait'):
+            if self.events or self.sampler is not None:
+                self.detector.wait_event(timeout)
+            else:
+                time.sleep(timeout)
+
+    def get_poll_time(self, acq_time):
+        """
+        Time to wait between two iterations of the acquisition monitor loop.
+
+        :param acq_time: acquisition time (exposure + latency) of one frame
+        :return: time in seconds
+        """
+        return acq_time
+
+    def on_poll(self, now, last_acq, last_saved):
+        """
+        Hook called on each iteration of the acquisition monitor loop.
+
+        :param now: time of the status reading
+        :param last_acq: last image acquired
+        :param last_saved: last image saved
+        :return: None
+        """
+        pass
+
+    def create_sampler(self):
+        """
+        Create the saving backlog sampler if the test sets sampleRate.
+
+        :return: LimaBacklogSampler or None
+        """
+        params = self.test_config.test_params
+        rate = params.get('sampleRate')
+        if not rate:
+            return None
+        stall_timeout = params.get('stallTimeout', self.STALL_TIMEOUT)
+        return LimaBacklogSampler(self.detector, rate, stall_timeout)
+
+    def create_frame_checker(self):
+        """
+        Create the frame content checker if the test sets checkFrames. NumPy
+        is only needed by the tests which check the frames.
+
+        :return: LimaFrameChecker or None
+        """
+        params = self.test_config.test_params
+        if self.abort or not params.get('checkFrames'):
+            return None
+        from LimaTestSuite.LimaFrameChecker import LimaFrameChecker
+        return LimaFrameChecker(self.detector,
+                                params.get('readBatch', 16),
+                                params.get('minMean'),
+                                params.get('maxMean'),
+                                params.get('maxSaturated'),
+                                params.get('maxDead'),
+                                params.get('saturation'))
+
+    def create_resource_sampler(self):
+        """
+        Create the sampler of the CPU, memory and disk used by the test,
+        unless the test sets resourceRate to 0.
+
+        :return: LimaResourceSampler or None
+        """
+        rate = self.test_config.test_params.get('resourceRate',
+                                                self.RESOURCE_RATE)
+        if not rate:
+            return None
+        return LimaResourceSampler(
+            self.test_config.saving_params['directory'], rate)
 
     def runTest(self):
+        if self.events:
+            self.detector.enable_events()
+        self.backlog_stats = {}
+        self.frame_stats = {}
+        self.resource_stats = {}
+        self.frame_checker = self.create_frame_checker()
+        self.sampler = self.create_sampler()
+        self.resource_sampler = self.create_resource_sampler()
+        if self.sampler is not None:
+            self.sampler.start()
+        if self.resource_sampler is not None:
+            self.resource_sampler.start()
+        try:
+            self.run_acquisition()
+        finally:
+            if self.resource_sampler is not None:
+                self.resource_sampler.stop()
+                self.resource_stats = self.resource_sampler.get_stats()
+                self.metrics.update(self.resource_stats)
+                self.logger.debug('Resources used by %s: %r' %
+                                  (self.name, self.resource_stats))
+            if self.sampler is not None:
+                self.sampler.stop()
+                self.save_backlog()
+            if self.events:
+                self.detector.disable_events()
+
+    def save_backlog(self):
+        """
+        Write the sampled saving backlog to a CSV file next to the test
+        folder.
+
+        :return: None
+        """
+        directory = self.test_config.saving_params['directory']
+        filename = directory.rstrip(os.sep) + '_backlog.csv'
+        self.sampler.write_csv(filename)
+        self.backlog_stats = self.sampler.get_stats()
+        self.logger.debug('Saving backlog of %s: %r (%s)' %
+                          (self.name, self.backlog_stats, filename))
+
+    def wait_abort_point(self, timeout):
+        """
+        Wait for the configured abort point: abortAfterFrames images
+        acquired or abortAfterTime seconds since the start. Without any of
+        them the acquisition is aborted right after the start.
+
+        :param timeout: maximum time to wait in seconds
+        :return: LimaStatus of the last status reading
+        """
+        params = self.test_config.test_params
+        frames = params.get('abortAfterFrames')
+        delay = params.get('abortAfterTime')
+        t0 = time.time()
+        if delay:
+            time.sleep(delay)
+        while True:
+            snapshot = self.detector.snapshot()
+            if not frames or snapshot.last_image >= frames - 1 or \
+                    snapshot.acq_status != Core.AcqRunning:
+                return snapshot
+            if time.time() - t0 > timeout:
+                self.detector.stop()
+                self.fail('Abort point not reached after %s s (%d image(s) '
+                          'acquired)' % (timeout, snapshot.last_image + 1))
+            time.sleep(self.ABORT_POLL_TIME)
+
+    def run_abort(self, timeout):
+        """
+        Start an acquisition, abort it and measure how the detector stops.
+
+        :param timeout: maximum time to wait for each state change
+        :return: dictionary with the stop to Ready time, the time until the
+                 detector is prepared for a new acquisition and the images
+                 acquired and saved after the stop was issued, None if the
+                 acquisition finished before the abort point
+        """
         self.detector.prepare_acq()
         self.detector.start()
+        snapshot = self.wait_abort_point(timeout)
+        if snapshot.acq_status != Core.AcqRunning:
+            self.logger.debug('Acquisition finished before the abort point')
+            return None
+        t_stop = time.time()
+        self.detector.stop()
+        while True:
+            status = self.detector.snapshot()
+            t_ready = time.time()
+            if status.acq_status != Core.AcqRunning:
+                break
+            if t_ready - t_stop > timeout:
+                self.fail('Detector still running %s s after stop' % timeout)
+            time.sleep(self.ABORT_POLL_TIME)
+        if status.acq_status == Core.AcqFault:
+            self.fail('Acquisition aborted in FAULT state: %s' %
+                      self.detector.status)
+        self.detector.prepare_acq()
+        t_prepared = time.time()
+        return {'stop_to_ready': t_ready - t_stop,
+                'ready_for_new': t_prepared - t_stop,
+                'acquired_after_stop': status.last_image - snapshot.last_image,
+                'saved_after_stop': (status.last_image_saved -
+                                     snapshot.last_image_saved),
+                }
+
+    def run_aborts(self):
+        """
+        Repeat the abort scenario the configured number of iterations and
+        add the distribution of the measurements to the report.
+
+        :return: None
+        """
+        params = self.test_config.test_params
+        iterations = params.get('iterations', 1)
+        frames = params.get('abortAfterFrames')
+        if frames and frames >= self.detector.frames:
+            self.fail('abortAfterFrames (%d) must be lower than acqNbFrames '
+                      '(%d)' % (frames, self.detector.frames))
+        timeout = max(self.ABORT_TIMEOUT, 10 * self.detector.acq_time)
+        results = []
+        missed = 0
+        with self.phase('acquisition'):
+            for _ in range(iterations):
+                result = self.run_abort(timeout)
+                if result is None:
+                    missed += 1
+                else:
+                    results.append(result)
+        self.metrics['aborts_missed'] = missed
+        if missed == iterations:
+            self.fail('The acquisition finished before the abort point in '
+                      'all the %d iteration(s)' % iterations)
+
+        rows = []
+        for key, scale in self.ABORT_MEASURES:
+            values = [r[key] * scale for r in results]
+            rows.append({'measure': key,
+                         'n': len(values),
+                         'p50': percentile(values, 50),
+                         'p90': percentile(values, 90),
+                         'p99': percentile(values, 99),
+                         'max': max(values),
+                         })
+            self.metrics['%s_p50' % key] = percentile(
+                [r[key] for r in results], 50)
+        self.logger.debug('Abort of %s: %r' % (self.name, rows))
+        notes = []
+        if missed:
+            notes.append('%d of %d iteration(s) finished before the abort '
+                         'point, left out' % (missed, iterations))
+        if self.report is not None:
+            self.report.add_table('Abort %s' % self.name, self.ABORT_COLUMNS,
+                                  rows, notes)
+
+    def run_acquisition(self):
+        if self.abort:
+            self.run_aborts()
+            return
+
+        with self.phase('prepare_acq'):
+            self.detector.prepare_acq()
+        self.start_time = time.time()
+        with self.phase('start'):
+            self.detector.start()
         self.logger.debug('Starting acquisition')
+        acq_start = time.time()
         acq_time = self.detector.acq_time
+        poll_time = self.get_poll_time(acq_time)
         img_idx = self.detector.frames - 1
-        counter = 0
-        last_saved = 0
+        self.img_idx = img_idx
+        if self.events:
+            ready_poll_time = self.EVENT_READY_POLL_TIME
+        else:
+            ready_poll_time = self.READY_POLL_TIME
         while True:
-            prev_acq = self.detector.last_image
-            prev_saved = self.detector.last_image_saved
-            acq_status = self.detector.acq_status
-            self.logger.debug('Last acq %d saved %d' % (prev_acq,
-                                                        prev_saved))
-            self.logger.debug('Acq Status %d' % acq_status)
+            if self.sampler is not None and self.sampler.stalled:
+                self.detector.stop()
+                self.fail('Saving stalled: no image saved for more than %s s '
+                          'with images pending.' % self.sampler.stall_timeout)
+            if self.sampler is not None and self.sampler.error:
+                self.detector.stop()
+                self.fail('Saving backlog sampling failed: %s' %
+                          self.sampler.error)
+
+            t_poll = time.time()
+            snapshot = self.detector.snapshot()
+            prev_acq = snapshot.last_image
+            prev_saved = snapshot.last_image_saved
+            acq_status = snapshot.acq_status
+            self.on_poll(time.time(), prev_acq, prev_saved)
+            if self.frame_checker is not None:
+                # Read the frames while they are still in the buffer
+                self.frame_checker.update(prev_acq)
+            if tracer.enabled:
+                tracer.counter('images', {'acquired': prev_acq + 1,
+                                          'saved': prev_saved + 1})
+                tracer.complete('poll', t_poll)
+            self.logger.debug('Last acq %d saved %d', prev_acq, prev_saved)
+            self.logger.debug('Acq Status %d', acq_status)
             if prev_saved == img_idx:
                 while Core.AcqRunning == self.detector.acq_status:
-                    time.sleep(1)
+                    self.wait(ready_poll_time)
                     self.logger.debug("Waiting for the detector state change.")
                 break
 
-            if self.abort:
-                self.detector.stop()
-                time.sleep(2)
-                self.detector.prepare_acq()
-                time.sleep(2)
-                self.logger.debug("%s" % repr(self.detector.acq_status))
-                break
+            if acq_status == Core.AcqFault:
+                self.fail('Acquisition failed after %d image(s): %s' %
+                          (prev_acq + 1, self.detector.status))
 
             # Check acq finished with status Ready
             if acq_status == Core.AcqReady and prev_saved != img_idx:
                 self.fail('Acquisition finished with state=READY but images '
                           'were not generated properly.')
 
-            time.sleep(acq_time)
+            self.wait(poll_time)
 
             # last_acq = self.ct.getStatus().ImageCounters.LastImageAcquired
             # if not (last_acq - prev_acq) and last_acq != img_idx:
             #     raise RuntimeError("Acquisition time has been exceeded.")
 
-            # TODO review criteria to check if saving has hung
-            # if counter > 5:
-            #if False:
-            #    if last_saved - prev_saved < 1:
-            #        self.fail('Images cannot be saved.')
-            #    counter = 0
-            #    last_saved = self.detector.last_image_saved
-            #else:
-            #    counter += 1
-                  
-        if not Core.AcqReady == self.detector.acq_status:
+        self.timings['acquisition'] = time.time() - acq_start
+        tracer.complete('phase:acquisition', acq_start, {'test': self.name})
+        acq_status = self.detector.acq_status
+        if not Core.AcqReady == acq_status:
             self.fail('Acquisition did not finished in READY state. [S%d]' %
-                      self.detector.acq_status)
-      
-    def tearDown(self):
-        self.logger.debug('*** Teardown for test %s ***' % self.name)
-  
-        del self.detector
+                      acq_status)
+
+        if self.frame_checker is not None:
+            self.check_frames()
+
+        if not self.abort and self.test_config.test_params.get('verify'):
+            self.verify_files()
+
+    def check_frames(self):
+        """
+        Check the content of the frames not read during the acquisition.
+
+        :return: None
+        """
+        errors = self.frame_checker.check(self.detector.frames)
+        self.frame_stats = self.frame_checker.get_stats()
+        self.logger.debug('Frame statistics of %s: %r' % (self.name,
+                                                          self.frame_stats))
+        if errors:
+            self.fail('Frame content check failed:\n%s' % '\n'.join(errors))
+
+    def verify_files(self):
+        """
+        Check the files written by the acquisition in the test folder.
+
+        :return: None
+        """
+        verifier = LimaFileVerifier(self.test_config.saving_params,
+                                    self.detector.frames,
+                                    self.detector.frame_size)
+        errors = verifier.verify()
+        if errors:
+            self.fail('Saved files verification failed:\n%s' %
+                      '\n'.join(errors))
+
+
+class LimaCCDPerformanceTest(LimaCCDAcquisitionTest):
+    """
+    Acquisition test which measures the sustained acquisition and saving
+    throughput. The figures of each run are added to the performance report.
+    """
+
+    # Maximum time between two status readings
+    POLL_TIME = 0.01
+
+    def __init__(self, config, debug=False, tango_mode=False, report=None,
+                 events=False, pool=None):
+        super(LimaCCDPerformanceTest, self).__init__(config, False, debug,
+                                                     tango_mode, report,
+                                                     events, pool)
+        self.first_frame_time = None
+        self.last_frame_time = None
+        self.last_saved_time = None
+
+    def get_poll_time(self, acq_time):
+        return min(acq_time, self.POLL_TIME)
+
+    def on_poll(self, now, last_acq, last_saved):
+        img_idx = self.img_idx
+        if self.first_frame_time is None and last_acq >= 0:
+            self.first_frame_time = now
+        if self.last_frame_time is None and last_acq == img_idx:
+            self.last_frame_time = now
+        if self.last_saved_time is None and last_saved == img_idx:
+            self.last_saved_time = now
+
+    def get_bytes_written(self):
+        """
+        Size of the files written by the test in the saving directory.
+
+        :return: number of bytes
+        """
+        directory = self.test_config.saving_params['directory']
+        prefix = self.test_config.saving_params['prefix']
+        nbytes = 0
+        for filename in os.listdir(directory):
+            if filename.startswith(prefix):
+                nbytes += os.path.getsize(os.path.join(directory, filename))
+        return nbytes
+
+    def get_metrics(self):
+        """
+        Compute the throughput figures of the last acquisition.
+
+        :return: dictionary with the figures
+        """
+        frames = self.detector.frames
+
+        def elapsed(t):
+            if t is None:
+                return None
+            return t - self.start_time
+
+        def rate(value, t):
+            if not t:
+                return None
+            return value / t
+
+        first_frame = elapsed(self.first_frame_time)
+        last_frame = elapsed(self.last_frame_time)
+        last_saved = elapsed(self.last_saved_time)
+        mb_written = self.get_bytes_written() / float(1024 ** 2)
+        return {'frames': frames,
+                'acq_fps': rate(frames, last_frame),
+                'saved_fps': rate(frames, last_saved),
+                'mb_written': mb_written,
+                'mb_per_sec': rate(mb_written, last_saved),
+                'first_frame': first_frame,
+                'last_frame': last_frame,
+                }
+
+    def runTest(self):
+        self.first_frame_time = None
+        self.last_frame_time = None
+        self.last_saved_time = None
+        super(LimaCCDPerformanceTest, self).runTest()
+        metrics = self.get_metrics()
+        metrics.update(self.backlog_stats)
+        metrics.update(self.frame_stats)
+        metrics.update(self.resource_stats)
+        self.metrics = metrics
+        self.logger.debug('Performance of %s: %r' % (self.name, metrics))
+        if self.report is not None:
+            self.report.add(self.name, metrics, self.test_config.section,
+                            self.test_config.sweep)
+
+
+class LimaCCDSoakTest(LimaCCDPerformanceTest):
+    """
+    Endurance test which repeats the acquisition with the same detector for
+    soakCycles cycles or soakDuration seconds. After every cycle the memory,
+    file descriptors and threads of the process are sampled from /proc/self.
+    The test fails when their trend grows like a leak or when the
+    throughput degrades along the run.
+    """
+
+    # Default number of cycles when neither soakCycles nor soakDuration are
+    # given
+    SOAK_CYCLES = LimaEstimate.SOAK_CYCLES
+
+    # Default allowed RSS growth (MB) and relative throughput degradation
+    # over the run
+    MAX_RSS_GROWTH = 50.0
+    MAX_DEGRADATION = 0.1
+
+    # Minimum number of file descriptors or threads added along the run to
+    # be considered a leak
+    MAX_COUNT_GROWTH = 1.0
+
+    # Minimum number of cycles and mean cycle duration (s) to check the
+    # throughput trend: the figures of shorter cycles are dominated by the
+    # poll period and the scheduling noise
+    MIN_TREND_CYCLES = 10
+    MIN_CYCLE_TIME = 0.5
+
+    # Fraction of the cycles in the first and last windows compared by the
+    # throughput trend, and minimum size of the windows
+    TREND_WINDOW = 0.25
+    MIN_TREND_WINDOW = 3
+
+    CSV_KEYS = ['cycle', 't', 'rss', 'fds', 'threads', 'acq_fps',
+                'saved_fps', 'mb_per_sec']
+
+    COLUMNS = [('name', 'Test', '%s'),
+               ('cycles', 'Cycles', '%d'),
+               ('rss_start', 'RSS start (MB)', '%.1f'),
+               ('rss_growth', 'RSS growth (MB)', '%.2f'),
+               ('fds_growth', 'FD growth', '%.2f'),
+               ('threads_growth', 'Thread growth', '%.2f'),
+               ('acq_fps_change', 'Acq fps (%)', '%+.1f'),
+               ('saved_fps_change', 'Saved fps (%)', '%+.1f'),
+               ]
+
+    def __init__(self, config, debug=False, tango_mode=False, report=None,
+                 events=False, pool=None):
+        super(LimaCCDSoakTest, self).__init__(config, debug, tango_mode,
+                                              report, events, pool)
+        self.cycles = []
+
+    def run_cycle(self, t0):
+        """
+        Run one acquisition and sample the process resources. The saving
+        configuration is written again first, so the next file number the
+        detector advanced is reset and every cycle overwrites the same
+        files.
+
+        :param t0: start time of the soak test
+        :return: dictionary with the figures of the cycle
+        """
+        self.detector.configure(self.test_config)
+        self.first_frame_time = None
+        self.last_frame_time = None
+        self.last_saved_time = None
+        self.run_acquisition()
+        sample = self.get_metrics()
+        sample.update(get_process_usage())
+        sample['cycle'] = len(self.cycles)
+        sample['t'] = time.time() - t0
+        return sample
+
+    def get_bytes_written(self):
+        """
+        Size of the files written by the last cycle.
+
+        :return: number of bytes
+        """
+        saving = self.test_config.saving_params
+        verifier = LimaFileVerifier(saving, self.detector.frames)
+        nbytes = 0
+        for filename, _ in verifier.expected_files():
+            path = os.path.join(saving['directory'], filename)
+            if os.path.isfile(path):
+                nbytes += os.path.getsize(path)
+        return nbytes
+
+    def write_csv(self):
+        """
+        Write the figures of every cycle to a CSV file next to the test
+        folder.
+
+        :return: None
+        """
+        directory = self.test_config.saving_params['directory']
+        filename = directory.rstrip(os.sep) + '_soak.csv'
+        with open(filename, 'wb') as f:
+            writer = csv.writer(f)
+            writer.writerow(self.CSV_KEYS)
+            for sample in self.cycles:
+                writer.writerow([sample.get(key) for key in self.CSV_KEYS])
+
+    def get_trend(self, key):
+        """
+        Fit the values of a figure along the cycles. The first cycle is
+        left out when there are enough cycles, it includes the allocations
+        done once.
+
+        :param key: figure name
+        :return: (fitted first value, fitted growth over the run) or None
+        """
+        samples = self.cycles[1:] if len(self.cycles) > 2 else self.cycles
+        points = [(s['cycle'], s[key]) for s in samples
+                  if s.get(key) is not None]
+        if len(points) < 2:
+            return None
+        xs = [p[0] for p in points]
+        slope, intercept = linear_fit(xs, [p[1] for p in points])
+        first = intercept + slope * xs[0]
+        return first, slope * (xs[-1] - xs[0])
+
+    def get_change(self, key):
+        """
+        Relative change of a figure along the run: the median of the last
+        window of cycles against the median of the first one, leaving out
+        the first cycle. Unlike a fit, a few slow cycles do not move it.
+
+        :param key: figure name
+        :return: relative change or None if there are not enough cycles
+        """
+        values = [s[key] for s in self.cycles[1:] if s.get(key) is not None]
+        window = max(int(len(values) * self.TREND_WINDOW),
+                     self.MIN_TREND_WINDOW)
+        if len(values) < 2 * window:
+            return None
+        first = percentile(values[:window], 50)
+        if not first:
+            return None
+        return (percentile(values[-window:], 50) - first) / first
+
+    def analyse(self):
+        """
+        Compute the trends of the run and check them against the limits.
+
+        :return: (summary dictionary, list of problems, list of notes)
+        """
+        params = self.test_config.test_params
+        max_rss = params.get('maxRssGrowth', self.MAX_RSS_GROWTH)
+        max_degradation = params.get('maxDegradation', self.MAX_DEGRADATION)
+        summary = {'name': self.name, 'cycles': len(self.cycles)}
+        problems = []
+
+        trend = self.get_trend('rss')
+        if trend is not None:
+            mb = float(1024 ** 2)
+            summary['rss_start'] = trend[0] / mb
+            summary['rss_growth'] = trend[1] / mb
+            if trend[1] / mb > max_rss:
+                problems.append('RSS grew %.2f MB (max %.2f MB)' %
+                                (trend[1] / mb, max_rss))
+        for key in ('fds', 'threads'):
+            trend = self.get_trend(key)
+            if trend is None:
+                continue
+            summary['%s_growth' % key] = trend[1]
+            if trend[1] >= self.MAX_COUNT_GROWTH and \
+                    self.cycles[-1][key] > self.cycles[0][key]:
+                problems.append('%s grew %.2f along the run' % (key,
+                                                                trend[1]))
+        notes = []
+        cycle_time = self.cycles[-1]['t'] / len(self.cycles) \
+            if self.cycles else 0.0
+        if len(self.cycles) < self.MIN_TREND_CYCLES or \
+                cycle_time < self.MIN_CYCLE_TIME:
+            notes.append('Throughput trend not checked: %d cycle(s) of '
+                         '%.3f s, at least %d cycles of %.1f s are needed' %
+                         (len(self.cycles), cycle_time,
+                          self.MIN_TREND_CYCLES, self.MIN_CYCLE_TIME))
+            return summary, problems, notes
+        for key in ('acq_fps', 'saved_fps'):
+            change = self.get_change(key)
+            if change is None:
+                continue
+            summary['%s_change' % key] = 100 * change
+            if -change > max_degradation:
+                problems.append('%s degraded %.1f%% (max %.1f%%)' %
+                                (key, -100 * change, 100 * max_degradation))
+        return summary, problems, notes
+
+    def runTest(self):
+        params = self.test_config.test_params
+        max_cycles = params.get('soakCycles')
+        duration = params.get('soakDuration')
+        if not max_cycles and not duration:
+            max_cycles = self.SOAK_CYCLES
+        self.cycles = []
+        if self.events:
+            self.detector.enable_events()
+        t0 = time.time()
+        try:
+            while not (max_cycles and len(self.cycles) >= max_cycles) and \
+                    not (duration and time.time() - t0 >= duration):
+                self.cycles.append(self.run_cycle(t0))
+        finally:
+            if self.events:
+                self.detector.disable_events()
+        self.timings['acquisition'] = time.time() - t0
+
+        self.write_csv()
+        summary, problems, notes = self.analyse()
+        self.metrics = summary
+        self.logger.debug('Soak of %s: %r' % (self.name, summary))
+        for note in notes:
+            self.logger.info('Soak of %s: %s' % (self.name, note))
+        if self.report is not None:
+            self.report.add_table('Soak %s' % self.name, self.COLUMNS,
+                                  [summary], problems + notes)
+        if problems:
+            self.fail('Soak test degraded:\n%s' % '\n'.join(problems))
+
+
+class LimaCCDReadoutTest(LimaCCDAcquisitionTest):
+    """
+    Acquisition test which measures the speed of reading the acquired frames
+    back from the detector, as the live viewers and the online processing
+    do. The frames are read with each batch size in three ways:
+
+    * view: the array returned by the detector, without any extra copy.
+    * copy: the returned array is copied, as a consumer keeping the frames.
+    * copy_into: the returned array is copied into an array allocated once
+      for the batch size, as a consumer reusing its buffers. Neither
+      CtControl.ReadImage nor the Tango readImage commands can fill an
+      existing array, so it is not a zero-copy read: it compares copying
+      into a reused buffer with allocating a new copy.
+    """
+
+    # Default number of frames of each read request
+    BATCH_SIZES = [1, 4, 16, 64]
+
+    READ_MODES = ['view', 'copy', 'copy_into']
+
+    COLUMNS = [('name', 'Test', '%s'),
+               ('batch', 'Batch', '%d'),
+               ('mode', 'Mode', '%s'),
+               ('frames', 'Frames', '%d'),
+               ('fps', 'Read fps', '%.2f'),
+               ('mb_per_sec', 'MB/s', '%.2f'),
+               ('overhead', 'Overhead (%)', '%.1f'),
+               ]
+
+    def __init__(self, config, debug=False, tango_mode=False, report=None,
+                 events=False, pool=None):
+        super(LimaCCDReadoutTest, self).__init__(config, False, debug,
+                                                 tango_mode, report, events,
+                                                 pool)
+        self.readout = []
+
+    def read_frames(self, first, count, batch, mode, out=None):
+        """
+        Read the frames [first, first + count) in requests of batch frames.
+
+        :return: elapsed time in seconds
+        """
+        t0 = time.time()
+        for start in range(first, first + count, batch):
+            n = min(batch, first + count - start)
+            if mode == 'copy_into':
+                self.detector.read_images(start, n, out)
+            else:
+                data = self.detector.read_images(start, n)
+                if mode == 'copy':
+                    data.copy()
+        return time.time() - t0
+
+    def measure_readout(self):
+        """
+        Measure the read back throughput of each batch size and read mode.
+        The last readFrames frames (all by default) are read, they must still
+        be in the detector buffer.
+
+        :return: list of dictionaries, one per batch size and mode
+        """
+        import numpy
+
+        params = self.test_config.test_params
+        frames = self.detector.frames
+        count = min(params.get('readFrames', frames), frames)
+        first = frames - count
+        frame_mb = self.detector.frame_size / float(1024 ** 2)
+        rows = []
+        for batch in params.get('readBatchSizes', self.BATCH_SIZES):
+            batch = max(min(batch, count), 1)
+            # Shape and type of the reused buffer
+            sample = self.detector.read_images(first, 1)
+            out = numpy.empty((batch,) + sample.shape[1:], sample.dtype)
+            times = {}
+            for mode in self.READ_MODES:
+                times[mode] = self.read_frames(first, count, batch, mode, out)
+            for mode in self.READ_MODES:
+                t = times[mode]
+                overhead = None
+                if mode != 'view' and times['view']:
+                    overhead = 100 * (t - times['view']) / times['view']
+                rows.append({'name': self.name,
+                             'batch': batch,
+                             'mode': mode,
+                             'frames': count,
+                             'fps': count / t if t else None,
+                             'mb_per_sec': count * frame_mb / t if t else None,
+                             'overhead': overhead,
+                             })
+        return rows
+
+    def runTest(self):
+        self.readout = []
+        super(LimaCCDReadoutTest, self).runTest()
+        with self.phase('readout'):
+            try:
+                self.readout = self.measure_readout()
+            except Exception as e:
+                self.fail('Frames could not be read back: %s' % e)
+        self.metrics['readout'] = self.readout
+        self.logger.debug('Readout of %s: %r' % (self.name, self.readout))
+        if self.report is not None:
+            self.report.add_table('Readout %s' % self.name, self.COLUMNS,
+                                  self.readout)
+
+
+class LimaCCDLatencyTest(LimaCCDBaseTestCase):
+    """
+    Measures the latency of the control path: the configuration write,
+    prepare_acq, start, the time to the first acquired image and the time
+    from stop to the Ready state. The sequence is repeated many times and the
+    percentiles of each phase are added to the report.
+    """
+
+    # Default number of repetitions of the sequence
+    ITERATIONS = LimaEstimate.LATENCY_ITERATIONS
+
+    # Time between two status readings
+    POLL_TIME = 0.0005
+
+    # Minimum time to wait for a state change before failing
+    TIMEOUT = 10.0
+
+    PHASES = ['write_config', 'prepare_acq', 'start', 'first_frame',
+              'stop_to_ready']
+
+    COLUMNS = [('phase', 'Phase', '%s'),
+               ('n', 'N', '%d'),
+               ('p50', 'p50 (ms)', '%.3f'),
+               ('p90', 'p90 (ms)', '%.3f'),
+               ('p99', 'p99 (ms)', '%.3f'),
+               ('max', 'Max (ms)', '%.3f'),
+               ]
+
+    def __init__(self, config, debug=False, tango_mode=False, report=None,
+                 events=False, pool=None):
+        super(LimaCCDLatencyTest, self).__init__(config, debug, tango_mode,
+                                                 report, events, pool)
+        self.latencies = {}
+
+    def poll_until(self, condition, timeout, msg):
+        """
+        Read the detector status until the condition is true.
+
+        :param condition: function of a LimaStatus
+        :param timeout: maximum time to wait in seconds
+        :param msg: failure message on timeout
+        :return: time when the condition became true
+        """
+        t0 = time.time()
+        while True:
+            now = time.time()
+            if condition(self.detector.snapshot()):
+                return now
+            if now - t0 > timeout:
+                self.detector.stop()
+                self.fail(msg)
+            time.sleep(self.POLL_TIME)
+
+    def run_iteration(self):
+        """
+        Run the sequence once.
+
+        :return: dictionary with the duration of each phase
+        """
+        timeout = max(self.TIMEOUT, 10 * self.detector.acq_time)
+        durations = {}
+        t0 = time.time()
+        self.detector.write_config_hw(force=True)
+        t1 = time.time()
+        self.detector.prepare_acq()
+        t2 = time.time()
+        self.detector.start()
+        t3 = time.time()
+        t4 = self.poll_until(lambda s: s.last_image >= 0, timeout,
+                             'No image acquired after %s s' % timeout)
+        self.detector.stop()
+        t5 = time.time()
+        t6 = self.poll_until(lambda s: s.acq_status != Core.AcqRunning,
+                             timeout, 'Detector still running %s s after '
+                             'stop' % timeout)
+        durations['write_config'] = t1 - t0
+        durations['prepare_acq'] = t2 - t1
+        durations['start'] = t3 - t2
+        durations['first_frame'] = t4 - t3
+        durations['stop_to_ready'] = t6 - t5
+        return durations
+
+    def get_rows(self):
+        rows = []
+        for phase in self.PHASES:
+            values = [v * 1000 for v in self.latencies[phase]]
+            rows.append({'phase': phase,
+                         'n': len(values),
+                         'p50': percentile(values, 50),
+                         'p90': percentile(values, 90),
+                         'p99': percentile(values, 99),
+                         'max': max(values) if values else None,
+                         })
+        return rows
+
+    def runTest(self):
+        iterations = self.test_config.test_params.get('iterations',
+                                                      self.ITERATIONS)
+        self.latencies = dict((phase, []) for phase in self.PHASES)
+        with self.phase('acquisition'):
+            for _ in range(iterations):
+                durations = self.run_iteration()
+                for phase, value in durations.items():
+                    self.latencies[phase].append(value)
+
+        rows = self.get_rows()
+        for row in rows:
+            if row['p50'] is not None:
+                self.metrics['%s_p50' % row['phase']] = row['p50'] / 1000.0
+        self.logger.debug('Latency of %s: %r' % (self.name, rows))
+        if self.report is not None:
+            notes = []
+            for phase in self.PHASES:
+                notes.append('%s (ms):' % phase)
+                notes.extend(format_histogram(
+                    [v * 1000 for v in self.latencies[phase]]))
+            self.report.add_table('Latency %s' % self.name, self.COLUMNS,
+                                  rows, notes)
+
+
+class LimaCCDBufferTest(LimaCCDPerformanceTest):
+    """
+    Looks for the smallest buffer which sustains the target frame rate. The
+    acquisition is repeated with each value of the swept buffer parameter
+    (nbBuffers or maxMemory), from the smallest one, until an acquisition
+    finishes without errors and saves at the target rate.
+    """
+
+    # Default values of each swept buffer parameter
+    BUFFER_VALUES = LimaEstimate.BUFFER_VALUES
+
+    # Allowed shortfall of the saving rate with respect to the target
+    RATE_TOLERANCE = 0.05
+
+    COLUMNS = [('name', 'Test', '%s'),
+               ('param', 'Parameter', '%s'),
+               ('value', 'Value', '%d'),
+               ('footprint', 'Footprint (MB)', '%.1f'),
+               ('saved_fps', 'Saved fps', '%.2f'),
+               ('result', 'Result', '%s'),
+               ]
+
+    def __init__(self, config, debug=False, tango_mode=False, report=None,
+                 events=False, pool=None):
+        super(LimaCCDBufferTest, self).__init__(config, debug, tango_mode,
+                                                report, events, pool)
+        self.trials = []
+
+    def get_footprint(self, param, value):
+        """
+        Memory used by the buffers with a buffer setting. With maxMemory the
+        number of buffers is the number of frames which fit in that
+        percentage of the memory. Lima does not allocate more buffers than
+        frames acquired.
+
+        :return: footprint in MB
+        """
+        frame_size = self.detector.frame_size
+        if param == 'nbBuffers':
+            nb_buffers = value
+        else:
+            memory = self.detector.buffer_memory * value / 100.0
+            nb_buffers = max(int(memory // frame_size), 1)
+        nb_buffers = min(nb_buffers, self.detector.frames)
+        return nb_buffers * frame_size / float(1024 ** 2)
+
+    def run_trial(self, param, value, target):
+        """
+        Run one acquisition with a buffer setting.
+
+        :return: dictionary with the result of the trial
+        """
+        self.test_config.buffer_params[param] = value
+        self.detector.configure(self.test_config)
+        self.first_frame_time = None
+        self.last_frame_time = None
+        self.last_saved_time = None
+        trial = {'name': self.name, 'param': param, 'value': value,
+                 'footprint': self.get_footprint(param, value)}
+        try:
+            self.run_acquisition()
+        except AssertionError as e:
+            self.detector.stop()
+            trial['result'] = 'error'
+            self.logger.debug('%s = %d failed: %s' % (param, value, e))
+            return trial
+        trial['saved_fps'] = self.get_metrics()['saved_fps']
+        if trial['saved_fps'] >= target * (1 - self.RATE_TOLERANCE):
+            trial['result'] = 'ok'
+        else:
+            trial['result'] = 'slow'
+        return trial
+
+    def runTest(self):
+        params = self.test_config.test_params
+        param = params.get('bufferSweep', 'nbBuffers')
+        if param not in self.BUFFER_VALUES:
+            self.fail('Invalid bufferSweep %s, expected one of %s' %
+                      (param, ', '.join(sorted(self.BUFFER_VALUES))))
+        if self.tango_mode and param == 'nbBuffers':
+            self.fail('nbBuffers cannot be set through Tango, use '
+                      'bufferSweep = maxMemory')
+        values = sorted(params.get('bufferValues', self.BUFFER_VALUES[param]))
+        target = params.get('targetFps', 1.0 / self.detector.acq_time)
+        self.trials = []
+        if self.events:
+            self.detector.enable_events()
+        try:
+            with self.phase('acquisition'):
+                for value in values:
+                    trial = self.run_trial(param, value, target)
+                    self.trials.append(trial)
+                    if trial['result'] == 'ok':
+                        break
+        finally:
+            if self.events:
+                self.detector.disable_events()
+
+        best = self.trials[-1] if self.trials[-1]['result'] == 'ok' else None
+        if best is not None:
+            self.metrics = {'buffer_param': param,
+                            'buffer_value': best['value'],
+                            'buffer_footprint': best.get('footprint'),
+                            }
+            notes = ['Smallest buffer sustaining %.2f fps: %s = %d' %
+                     (target, param, best['value'])]
+        else:
+            notes = ['No buffer setting sustains %.2f fps' % target]
+        self.logger.debug('Buffer sweep of %s: %r' % (self.name, self.trials))
+        if self.report is not None:
+            self.report.add_table('Buffer %s' % self.name, self.COLUMNS,
+                                  self.trials, notes)
+        if best is None:
+            self.fail(notes[0])
+
+
+class LimaCCDModeTest(LimaCCDPerformanceTest):
+    """
+    Compares the Single, Accumulation and Concatenation acquisition modes
+    for the same total exposure. With a factor N, the acqNbFrames frames of
+    acqExpoTime of the Single mode become acqNbFrames / N images
+    accumulating N frames, or concatenating N frames. The number of images
+    saved and of files written by each mode are checked.
+    """
+
+    # Default number of frames accumulated or concatenated in one image
+    MODE_FACTOR = LimaEstimate.MODE_FACTOR
+
+    MODES = LimaEstimate.ACQ_MODES
+
+    COLUMNS = [('name', 'Test', '%s'),
+               ('mode', 'Mode', '%s'),
+               ('images', 'Images', '%d'),
+               ('image_mb', 'Image (MB)', '%.2f'),
+               ('exposure', 'Exposure (s)', '%.3f'),
+               ('frame_fps', 'Frame fps', '%.2f'),
+               ('saved_fps', 'Image fps', '%.2f'),
+               ('mb_per_sec', 'Saved MB/s', '%.2f'),
+               ]
+
+    def __init__(self, config, debug=False, tango_mode=False, report=None,
+                 events=False, pool=None):
+        super(LimaCCDModeTest, self).__init__(config, debug, tango_mode,
+                                              report, events, pool)
+        self.modes = []
+
+    def get_mode_params(self, mode, acq, factor):
+        """
+        Acquisition parameters of a mode with the same total exposure as the
+        Single mode acquisition acq.
+        """
+        params = dict(acq, acqMode=mode)
+        if mode == 'ACCUMULATION':
+            params['acqNbFrames'] = acq['acqNbFrames'] // factor
+            params['acqExpoTime'] = acq['acqExpoTime'] * factor
+            params['accMaxExpoTime'] = acq['acqExpoTime']
+        elif mode == 'CONCATENATION':
+            params['acqNbFrames'] = acq['acqNbFrames'] // factor
+            params['concatNbFrames'] = factor
+        return params
+
+    def run_mode(self, mode, acq, saving, factor):
+        """
+        Run the acquisition in one mode and check the images and files.
+
+        :return: dictionary with the figures of the mode
+        """
+        self.test_config.acq_params.update(
+            self.get_mode_params(mode, acq, factor))
+        self.test_config.saving_params['prefix'] = \
+            '%s%s_' % (saving['prefix'], mode.lower())
+        self.detector.configure(self.test_config)
+        self.first_frame_time = None
+        self.last_frame_time = None
+        self.last_saved_time = None
+        self.run_acquisition()
+
+        params = self.test_config.acq_params
+        images = params['acqNbFrames']
+        exposure = images * params['acqExpoTime']
+        if mode == 'CONCATENATION':
+            exposure *= params['concatNbFrames']
+        if self.detector.frames != images or \
+                self.detector.last_image_saved != images - 1:
+            self.fail('%s mode saved %d image(s), expected %d' %
+                      (mode, self.detector.last_image_saved + 1, images))
+        self.verify_files()
+        metrics = self.get_metrics()
+        elapsed = self.last_saved_time - self.start_time \
+            if self.last_saved_time else None
+        return {'name': self.name,
+                'mode': mode,
+                'images': images,
+                'image_mb': self.detector.frame_size / float(1024 ** 2),
+                'exposure': exposure,
+                'frame_fps': acq['acqNbFrames'] / elapsed if elapsed
+                else None,
+                'saved_fps': metrics['saved_fps'],
+                'mb_per_sec': metrics['mb_per_sec'],
+                }
+
+    def runTest(self):
+        factor = self.test_config.test_params.get('modeFactor',
+                                                  self.MODE_FACTOR)
+        acq = dict(self.test_config.acq_params)
+        saving = dict(self.test_config.saving_params)
+        if factor < 1 or acq['acqNbFrames'] % factor:
+            self.fail('acqNbFrames (%d) must be a multiple of modeFactor (%d)'
+                      % (acq['acqNbFrames'], factor))
+        self.modes = []
+        if self.events:
+            self.detector.enable_events()
+        try:
+            with self.phase('acquisition'):
+                for mode in self.MODES:
+                    self.modes.append(self.run_mode(mode, acq, saving,
+                                                    factor))
+        finally:
+            if self.events:
+                self.detector.disable_events()
+            self.test_config.acq_params.update(acq)
+            self.test_config.saving_params.update(saving)
+
+        for row in self.modes:
+            for key in ('frame_fps', 'mb_per_sec'):
+                self.metrics['%s_%s' % (row['mode'].lower(), key)] = row[key]
+        self.logger.debug('Modes of %s: %r' % (self.name, self.modes))
+        if self.report is not None:
+            self.report.add_table('Acquisition modes %s' % self.name,
+                                  self.COLUMNS, self.modes)
+
+
+class LimaCCDFormatTest(LimaCCDPerformanceTest):
+    """
+    Compares the saving formats. The same acquisition is run for each file
+    format and each number of frames per file, and the size of the files,
+    the compression ratio against the raw pixel data, the saving throughput
+    and the CPU time used are reported in a table sorted by sortBy. The
+    files of each run are removed once measured, unless keepFiles is set.
+    """
+
+    COLUMNS = [('name', 'Test', '%s'),
+               ('format', 'Format', '%s'),
+               ('frames_per_file', 'Frames/file', '%d'),
+               ('mb_written', 'MB', '%.2f'),
+               ('ratio', 'Ratio', '%.2f'),
+               ('saved_fps', 'Saved fps', '%.2f'),
+               ('mb_per_sec', 'MB/s', '%.2f'),
+               ('cpu_time', 'CPU (s)', '%.3f'),
+               ('cpu_ms_per_frame', 'CPU ms/frame', '%.3f'),
+               ]
+
+    # Figures sorted from the lowest, the others from the highest
+    ASCENDING = ('mb_written', 'cpu_time', 'cpu_ms_per_frame')
+
+    def __init__(self, config, debug=False, tango_mode=False, report=None,
+                 events=False, pool=None):
+        super(LimaCCDFormatTest, self).__init__(config, debug, tango_mode,
+                                                report, events, pool)
+        self.formats = []
+
+    def get_formats(self):
+        """
+        File formats compared by the test: the formats given in the test
+        configuration, by default all the formats known by the detector.
+
+        :return: list of format names
+        """
+        formats = self.test_config.test_params.get('formats')
+        if not formats:
+            return sorted(self.detector._fileFormat.keys())
+        formats = [f.upper() for f in formats]
+        unknown = [f for f in formats if f not in self.detector._fileFormat]
+        if unknown:
+            self.fail('Unknown file format(s): %s' % ', '.join(unknown))
+        return formats
+
+    def remove_files(self):
+        directory = self.test_config.saving_params['directory']
+        prefix = self.test_config.saving_params['prefix']
+        for filename in os.listdir(directory):
+            if filename.startswith(prefix):
+                os.remove(os.path.join(directory, filename))
+
+    def run_format(self, fmt, frames_per_file, saving):
+        """
+        Run the acquisition saving with one format and number of frames per
+        file.
+
+        :return: dictionary with the figures of the run, None if the
+                 detector does not support the format
+        """
+        params = self.test_config.saving_params
+        params.update({'fileFormat': fmt,
+                       'framesPerFile': frames_per_file,
+                       'suffix': self.test_config.FILE_SUFFIXES.get(
+                           fmt, saving.get('suffix', '')),
+                       'prefix': '%s%s_%d_' % (saving['prefix'], fmt.lower(),
+                                               frames_per_file)})
+        try:
+            self.detector.configure(self.test_config)
+        except Exception as e:
+            self.logger.warning('%s: format %s not supported: %s' %
+                                (self.name, fmt, e))
+            return None
+        row = self.measure_saving()
+        row.update({'format': fmt, 'frames_per_file': frames_per_file})
+        return row
+
+    def measure_saving(self):
+        """
+        Run the acquisition with the configuration set on the detector and
+        measure the files written and the CPU time used by the process
+        running Lima (the device server in Tango mode, when it is local).
+
+        :return: dictionary with the figures of the run
+        """
+        self.first_frame_time = None
+        self.last_frame_time = None
+        self.last_saved_time = None
+        cpu_start = self.detector.get_cpu_time()
+        self.run_acquisition()
+        cpu_end = self.detector.get_cpu_time()
+        cpu_time = None
+        if cpu_start is not None and cpu_end is not None:
+            cpu_time = cpu_end - cpu_start
+
+        if self.test_config.test_params.get('verify'):
+            self.verify_files()
+        metrics = self.get_metrics()
+        frames = self.detector.frames
+        raw_mb = frames * self.detector.frame_size / float(1024 ** 2)
+        if not self.test_config.test_params.get('keepFiles'):
+            self.remove_files()
+        return {'name': self.name,
+                'mb_written': metrics['mb_written'],
+                'ratio': raw_mb / metrics['mb_written']
+                if metrics['mb_written'] else None,
+                'saved_fps': metrics['saved_fps'],
+                'mb_per_sec': metrics['mb_per_sec'],
+                'cpu_time': cpu_time,
+                'cpu_ms_per_frame': 1000 * cpu_time / frames
+                if frames and cpu_time is not None else None,
+                }
+
+    def sort_rows(self, rows):
+        key = self.test_config.test_params.get('sortBy', 'saved_fps')
+        if key not in [k for k, _, _ in self.COLUMNS]:
+            self.fail('Unknown sortBy column: %s' % key)
+        known = [r for r in rows if r.get(key) is not None]
+        unknown = [r for r in rows if r.get(key) is None]
+        known.sort(key=lambda r: r[key], reverse=key not in self.ASCENDING)
+        return known + unknown
+
+    def runTest(self):
+        saving = dict(self.test_config.saving_params)
+        frames_per_file = self.test_config.test_params.get(
+            'framesPerFileValues') or [saving['framesPerFile']]
+        formats = self.get_formats()
+        self.formats = []
+        skipped = []
+        if self.events:
+            self.detector.enable_events()
+        try:
+            with self.phase('acquisition'):
+                for fmt in formats:
+                    for n in frames_per_file:
+                        row = self.run_format(fmt, n, saving)
+                        if row is None:
+                            skipped.append(fmt)
+                            break
+                        self.formats.append(row)
+        finally:
+            if self.events:
+                self.detector.disable_events()
+            self.test_config.saving_params.update(saving)
+
+        if not self.formats:
+            self.fail('None of the file formats is supported')
+        self.formats = self.sort_rows(self.formats)
+        self.metrics['formats'] = self.formats
+        self.logger.debug('Formats of %s: %r' % (self.name, self.formats))
+        if self.report is not None:
+            notes = ['Not supported: %s' % ', '.join(skipped)] \
+                if skipped else []
+            self.report.add_table('Saving formats %s' % self.name,
+                                  self.COLUMNS, self.formats, notes)
+
+
+class LimaCCDWriterTest(LimaCCDFormatTest):
+    """
+    Scales the number of concurrent writing tasks of the saving
+    (maxConcurrentWritingTask) for the format and directory of the test, to
+    find where the saving throughput peaks. The acquisition must be faster
+    than the saving with one task, and the buffer must hold the frames not
+    saved yet, for the saving to be the bottleneck.
+    """
+
+    # Default numbers of writing tasks
+    WRITER_TASKS = LimaEstimate.WRITER_TASKS
+
+    COLUMNS = [('name', 'Test', '%s'),
+               ('tasks', 'Tasks', '%d'),
+               ('saved_fps', 'Saved fps', '%.2f'),
+               ('mb_per_sec', 'MB/s', '%.2f'),
+               ('speedup', 'Speedup', '%.2f'),
+               ('cpu_time', 'CPU (s)', '%.3f'),
+               ('cpu_ms_per_frame', 'CPU ms/frame', '%.3f'),
+               ]
+
+    def __init__(self, config, debug=False, tango_mode=False, report=None,
+                 events=False, pool=None):
+        super(LimaCCDWriterTest, self).__init__(config, debug, tango_mode,
+                                                report, events, pool)
+        self.tasks = []
+
+    def run_tasks(self, tasks, saving):
+        """
+        Run the acquisition saving with a number of writing tasks.
+
+        :return: dictionary with the figures of the run
+        """
+        self.test_config.saving_params.update(
+            {'maxConcurrentWritingTask': tasks,
+             'prefix': '%stasks%d_' % (saving['prefix'], tasks)})
+        self.detector.configure(self.test_config)
+        row = self.measure_saving()
+        row['tasks'] = tasks
+        return row
+
+    def runTest(self):
+        saving = dict(self.test_config.saving_params)
+        values = sorted(self.test_config.test_params.get('writerTasks') or
+                        self.WRITER_TASKS)
+        self.tasks = []
+        if self.events:
+            self.detector.enable_events()
+        try:
+            with self.phase('acquisition'):
+                for tasks in values:
+                    self.tasks.append(self.run_tasks(tasks, saving))
+        finally:
+            if self.events:
+                self.detector.disable_events()
+            self.test_config.saving_params.clear()
+            self.test_config.saving_params.update(saving)
+
+        reference = self.tasks[0]['saved_fps']
+        for row in self.tasks:
+            row['speedup'] = row['saved_fps'] / reference \
+                if reference and row['saved_fps'] else None
+        peak = max(self.tasks, key=lambda r: r['saved_fps'] or 0)
+        self.metrics['writer_tasks'] = self.tasks
+        self.metrics['peak_tasks'] = peak['tasks']
+        self.metrics['peak_saved_fps'] = peak['saved_fps']
+        self.logger.debug('Writing tasks of %s: %r' % (self.name, self.tasks))
+        if self.report is not None:
+            notes = ['Peak: %d task(s), %.2f saved fps (%s)' %
+                     (peak['tasks'], peak['saved_fps'] or 0,
+                      saving['fileFormat'])]
+            if len(values) > 1 and peak is self.tasks[-1]:
+                notes.append('The throughput still grows with the largest '
+                             'number of tasks')
+            self.report.add_table('Writing tasks %s' % self.name,
+                                  self.COLUMNS, self.tasks, notes)
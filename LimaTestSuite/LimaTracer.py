@@ -0,0 +1,200 @@
+import os
+import json
+import time
+import functools
+import threading
+from collections import deque
+
+
+class _Span(object):
+    """
+    Context manager recording a complete event on exit.
+    """
+    __slots__ = ('tracer', 'name', 'args', 'start')
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.complete(self.name, self.start, self.args)
+        return False
+
+
+class _NullSpan(object):
+    """
+    Context manager used when the tracer is disabled.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class LimaTracer(object):
+    """
+    In-memory tracer of the test and detector activity. The events are
+    kept in a ring buffer, the oldest ones are dropped when it is full, and
+    exported as a Chrome trace (chrome://tracing, Perfetto). When it is
+    disabled recording an event only costs the check of the enabled flag.
+
+    :param size: maximum number of events kept
+    """
+
+    # Default maximum number of events kept
+    SIZE = 100000
+
+    def __init__(self, size=SIZE):
+        self.enabled = False
+        self._events = deque(maxlen=size)
+        self._threads = {}
+        self._pid = os.getpid()
+
+    def enable(self, size=None):
+        """
+        Start recording the events.
+
+        :param size: maximum number of events kept, None to keep the current
+                     size
+        :return: None
+        """
+        if size is not None and size != self._events.maxlen:
+            self._events = deque(self._events, maxlen=size)
+        self._pid = os.getpid()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        self._events.clear()
+
+    def __len__(self):
+        return len(self._events)
+
+    def _thread_id(self):
+        thread = threading.current_thread()
+        tid = thread.ident
+        if tid not in self._threads:
+            self._threads[tid] = thread.name
+        return tid
+
+    def complete(self, name, start, args=None):
+        """
+        Record an event which lasted from start until now.
+
+        :param name: event name
+        :param start: start time as returned by time.time()
+        :param args: dictionary shown with the event
+        :return: None
+        """
+        if self.enabled:
+            self._events.append(('X', name, start, time.time() - start,
+                                 self._thread_id(), args))
+
+    def instant(self, name, args=None):
+        """
+        Record an event without duration.
+
+        :param name: event name
+        :param args: dictionary shown with the event
+        :return: None
+        """
+        if self.enabled:
+            self._events.append(('i', name, time.time(), 0,
+                                 self._thread_id(), args))
+
+    def counter(self, name, values):
+        """
+        Record the values of a counter (e.g. the image counters).
+
+        :param name: counter name
+        :param values: dictionary {series: number}
+        :return: None
+        """
+        if self.enabled:
+            self._events.append(('C', name, time.time(), 0,
+                                 self._thread_id(), values))
+
+    def span(self, name, args=None):
+        """
+        Context manager recording the duration of a block.
+
+        :param name: event name
+        :param args: dictionary shown with the event
+        :return: context manager
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, args)
+
+    def get_trace(self):
+        """
+        Build the Chrome trace of the recorded events, with the times in
+        microseconds since the first one.
+
+        :return: dictionary
+        """
+        events = list(self._events)
+        # The spans are recorded when they end, after the nested ones
+        t0 = min(e[2] for e in events) if events else 0.0
+        trace = [{'ph': 'M', 'name': 'thread_name', 'pid': self._pid,
+                  'tid': tid, 'args': {'name': name}}
+                 for tid, name in sorted(self._threads.items())]
+        for phase, name, ts, dur, tid, args in events:
+            event = {'ph': phase, 'name': name, 'pid': self._pid, 'tid': tid,
+                     'ts': (ts - t0) * 1e6}
+            if phase == 'X':
+                event['dur'] = dur * 1e6
+            elif phase == 'i':
+                event['s'] = 't'
+            if args:
+                event['args'] = args
+            trace.append(event)
+        return {'traceEvents': trace, 'displayTimeUnit': 'ms'}
+
+    def export(self, filename):
+        """
+        Write the recorded events to a Chrome trace JSON file.
+
+        :param filename: output file
+        :return: number of events written
+        """
+        trace = self.get_trace()
+        with open(filename, 'w') as f:
+            json.dump(trace, f)
+        return len(self._events)
+
+
+# Tracer shared by the detectors and the tests of the process
+tracer = LimaTracer()
+
+
+def traced(fn):
+    """
+    Decorator recording each call of the function in the tracer.
+    """
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def _traced(*args, **kwargs):
+        if not tracer.enabled:
+            return fn(*args, **kwargs)
+        start = time.time()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            tracer.complete(name, start)
+    return _traced
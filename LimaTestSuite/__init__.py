@@ -1,6 +1,7 @@
 import datetime
 import logging
 import os
+import re
 
 # create logger
 logger = logging.getLogger(__name__)
@@ -23,6 +24,8 @@ logger.addHandler(ch)
 
 def debug(fn):
     def _decorated(*arg, **kwargs):
+        if not logger.isEnabledFor(logging.DEBUG):
+            return fn(*arg, **kwargs)
         logger.log(logging.DEBUG, "ENTERING '%s'(%r,%r)", fn.func_name, arg,
                    kwargs)
         ret = fn(*arg, **kwargs)
@@ -48,6 +51,24 @@ def _get_dict_value(d, k):
     return value
 
 
+def _str2bool(value):
+    return str(value).strip().lower() in ('1', 'yes', 'true', 'on')
+
+
+def _str2intlist(value):
+    # "1, 2", "1 2" and "1x2" are accepted
+    return [int(v) for v in re.split(r'[\s,x]+', str(value).strip()) if v]
+
+
+def _str2list(value):
+    return [v for v in re.split(r'[\s,]+', str(value).strip()) if v]
+
+
+def _str2boollist(value):
+    return [_str2bool(v) for v in re.split(r'[\s,]+', str(value).strip())
+            if v]
+
+
 def _str_date_now():
     now = datetime.datetime.now()
     return now.strftime("%Y%m%d_%H%M")
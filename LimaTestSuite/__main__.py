@@ -1,17 +1,155 @@
 import unittest
 import os
+import sys
 import logging
+import multiprocessing
+import traceback
+import fnmatch
+from collections import OrderedDict
 from LimaConfigHelper import LimaTestParser
-from LimaTestCase import LimaCCDAcquisitionTest
+from LimaReport import LimaPerformanceReport
+from LimaTestSuite.LimaResults import LimaResultsStore
+from LimaTestSuite.LimaRepeatSuite import LimaRepeatSuite
+from LimaTestSuite import LimaEstimate
 from LimaTestSuite import _str_date_now
 
-TEST_TYPES = ["acquisition", "abort"]
+# Test case class (from LimaTestCase) and extra arguments of each test type.
+# The classes are imported when the tests are built, so listing and
+# estimating the tests does not need to import Lima.
+TEST_TYPES = {'acquisition': ('LimaCCDAcquisitionTest', {'abort': False}),
+              'abort': ('LimaCCDAcquisitionTest', {'abort': True}),
+              'performance': ('LimaCCDPerformanceTest', {}),
+              'readout': ('LimaCCDReadoutTest', {}),
+              'latency': ('LimaCCDLatencyTest', {}),
+              'soak': ('LimaCCDSoakTest', {}),
+              'buffer': ('LimaCCDBufferTest', {}),
+              'modes': ('LimaCCDModeTest', {}),
+              'formats': ('LimaCCDFormatTest', {}),
+              'writers': ('LimaCCDWriterTest', {}),
+              }
 
 
-def run_test(filename, debug, tango):
+def match_test(name, pattern):
+    """
+    Check if a test name matches the -k pattern: a shell-style wildcard
+    pattern or, without wildcards, a substring of the name.
+
+    :param name: test name
+    :param pattern: pattern or None to match all the tests
+    :return: bool
+    """
+    if not pattern:
+        return True
+    if any(c in pattern for c in '*?['):
+        return fnmatch.fnmatchcase(name, pattern)
+    return pattern in name
+
+
+def get_tests(filename, pattern=None):
+    """
+    Parse a configuration file, without accessing the detector nor creating
+    any folder.
+
+    :param filename: configuration file
+    :param pattern: only return the tests matching this pattern
+    :return: generator of LimaTestConfiguration
+    """
+    for test in LimaTestParser(filename).get_tests():
+        if match_test(test.name, pattern):
+            yield test
+
+
+def get_max_runs(test):
+    """
+    Maximum number of runs of a test, warm-up runs included. With a CI target
+    the test is run until the target is reached, up to max_repeat runs.
+
+    :param test: LimaTestConfiguration
+    :return: int
+    """
+    runs = test.repeat
+    if test.ci_target:
+        runs = test.max_repeat or max(LimaRepeatSuite.MAX_REPEAT, test.repeat)
+    return test.warmup + runs
+
+
+def estimate_test(test):
+    """
+    Estimate the acquisition time and the data volume of all the runs of a
+    test, warm-up runs included, with the estimate of its test type. The
+    data volume is only known when the Detector section gives the frame size
+    (width, height and depth).
+
+    :param test: LimaTestConfiguration
+    :return: (seconds, bytes or None)
+    """
+    seconds, nbytes = LimaEstimate.estimate_test(test)
+    runs = get_max_runs(test)
+    if nbytes is not None:
+        nbytes *= runs
+    return seconds * runs, nbytes
+
+
+def list_tests(filenames, pattern=None, dry_run=False):
+    """
+    Show the planned tests. With dry_run the estimated acquisition time and
+    data volume of each test are shown too. The data volume of the tests
+    whose frame size is not known is reported as unknown.
+
+    :return: True if all the tests have a valid type
+    """
+    logger = logging.getLogger('LimaTestSuite')
+    ok = True
+    total_tests = 0
+    total_seconds = 0.0
+    total_bytes = 0
+    unknown_bytes = 0
+    for filename in filenames:
+        logger.info('%s:' % filename)
+        for test in get_tests(filename, pattern):
+            valid = test.type.lower() in TEST_TYPES
+            ok = ok and valid
+            line = '  %s [r%d] [%s]' % (test.name, test.repeat, test.type)
+            if test.warmup:
+                line += ' [w%d]' % test.warmup
+            if not valid:
+                line += ' INVALID TYPE'
+            if dry_run and valid:
+                seconds, nbytes = estimate_test(test)
+                # With a CI target the estimate is the one of max_repeat runs
+                approx = '<=' if test.ci_target else '~'
+                total_seconds += seconds
+                line += ' %s%.1f s' % (approx, seconds)
+                if nbytes is not None:
+                    total_bytes += nbytes
+                    line += ', %s%.1f MB' % (approx,
+                                            nbytes / float(1024 ** 2))
+                else:
+                    unknown_bytes += 1
+                    line += ', data volume unknown'
+            logger.info(line)
+            total_tests += get_max_runs(test)
+    logger.info('%d test run(s) planned at most' % total_tests)
+    if dry_run:
+        volume = '%.1f MB' % (total_bytes / float(1024 ** 2))
+        if unknown_bytes:
+            volume += ' (unknown for %d test(s), the Detector section ' \
+                      'gives no width, height and depth)' % unknown_bytes
+        logger.info('Estimated acquisition time: %.1f s, data volume: %s' %
+                    (total_seconds, volume))
+    return ok
+
+
+def build_suite(filename, debug, tango, events, report, pool, pattern=None):
+    """
+    Create the test cases defined in a configuration file.
+
+    :return: (unittest.TestSuite, maximum number of test runs)
+    """
+    import LimaTestCase
 
     # Load configuration file and return tests list
-    tests = LimaTestParser(filename).get_tests()
+    tests = get_tests(filename, pattern)
     logger = logging.getLogger('LimaTestSuite')
 
     # Create test suite
@@ -25,28 +163,182 @@ def run_test(filename, debug, tango):
                                    'instance name.')
 
         if test.type.lower() in TEST_TYPES:
-            if test.type.lower() == TEST_TYPES[0]:
-                case = LimaCCDAcquisitionTest(test, abort=False, debug=debug,
-                                              tango_mode=tango)
-            elif test.type.lower() == TEST_TYPES[1]:
-                case = LimaCCDAcquisitionTest(test, abort=True, debug=debug,
-                                              tango_mode=tango)
+            class_name, kwargs = TEST_TYPES[test.type.lower()]
+            test_class = getattr(LimaTestCase, class_name)
+            case = test_class(test, debug=debug, tango_mode=tango,
+                              report=report, events=events, pool=pool,
+                              **kwargs)
             logger.info("Adding test --> %s [r%d] [%s]" % (
                     test.name, test.repeat, test.type))
-            for i in range(test.repeat):
+            if test.repeat > 1 or test.warmup or test.ci_target:
+                test_suite.addTest(LimaRepeatSuite(
+                    case, test.repeat, test.warmup, test.ci_target,
+                    test.ci_metric, test.max_repeat))
+            else:
                 test_suite.addTest(case)
-                ntests += 1
+            ntests += get_max_runs(test)
         else:
             logger.error("Type %s is not a valid test type." % test.type)
+    return test_suite, ntests
+
+
+def _test_name(test):
+    return getattr(test, 'name', str(test))
+
+
+def run_suite(filenames, debug, tango, events=False, fresh=False,
+              pattern=None, trace=False):
+    """
+    Run sequentially in the current process the tests of the configuration
+    files. All the files are expected to target the same detector.
+
+    :param trace: write the Chrome trace of each test run next to its folder
+    :return: dictionary with the results of the suite
+    """
+    from LimaTestSuite.LimaDetector import LimaDetector
+    from LimaTestSuite.LimaDetectorPool import LimaDetectorPool
+    from LimaTestSuite.LimaTracer import tracer
 
-    logger.info('Starting %s test(s)' % ntests)
+    if trace:
+        tracer.enable()
+
+    logger = logging.getLogger('LimaTestSuite')
+    report = LimaPerformanceReport()
+    pool = LimaDetectorPool(tango, fresh)
+    LimaDetector.write_stats.update({'sent': 0, 'saved': 0})
+
+    test_suite = unittest.TestSuite()
+    ntests = 0
+    for filename in filenames:
+        suite, n = build_suite(filename, debug, tango, events, report, pool,
+                               pattern)
+        test_suite.addTest(suite)
+        ntests += n
+
+    logger.info('Starting %s test run(s) at most' % ntests)
     result = unittest.TextTestRunner(verbosity=1).run(test_suite)
-    errors = len(result.errors)
-    failures = len(result.failures)
+    pool.close()
+
+    return {'tests': ntests,
+            'errors': [(_test_name(t), tb) for t, tb in result.errors],
+            'failures': [(_test_name(t), tb) for t, tb in result.failures],
+            'records': report.records,
+            'runs': report.runs,
+            'tables': report.tables,
+            'write_stats': dict(LimaDetector.write_stats),
+            }
+
+
+def _run_suite_worker(args):
+    """
+    Entry point of the worker processes. The exceptions are reported as
+    errors of the suite so the other workers are not interrupted.
+    """
+    filenames = args[0]
+    try:
+        return run_suite(*args)
+    except Exception:
+        return {'tests': 0,
+                'errors': [(', '.join(filenames), traceback.format_exc())],
+                'failures': [],
+                'records': [],
+                'runs': [],
+                'tables': [],
+                'write_stats': {'sent': 0, 'saved': 0},
+                }
+
+
+def group_by_detector(filenames, tango=False):
+    """
+    Group the configuration files by the detector they target, keeping the
+    order of the files.
 
-    logger.info('Results: Error(s) = %d, Failure(s) = %d' % ( errors, failures))
-    for fail in result.failures:
-        logger.info(fail[-1].split("\n")[-2])
+    :param filenames: list of configuration files
+    :param tango: True to identify the detectors by their Tango device
+    :return: list of lists of configuration files
+    """
+    groups = OrderedDict()
+    for filename in filenames:
+        key = LimaTestParser(filename).get_detector_key(tango)
+        groups.setdefault(key, []).append(filename)
+    return groups.values()
+
+
+def run_test(filenames, debug, tango, events=False, fresh=False, jobs=None,
+             results=None, baseline=False, tolerance=0.1, pattern=None,
+             trace=False):
+    """
+    Run the tests of the configuration files. The suites of different
+    detectors run in parallel worker processes, the tests of the same
+    detector are always run sequentially.
+
+    :param filenames: configuration file or list of configuration files
+    :param jobs: maximum number of worker processes, by default one per
+                 detector
+    :param results: JSON lines file where the record of each test run is
+                    stored, None to not store them
+    :param baseline: compare the run with the stored history
+    :param tolerance: allowed relative degradation of the metrics
+    :param pattern: only run the tests matching this pattern
+    :param trace: write the Chrome trace of each test run
+    :return: True if all the tests passed without performance regressions
+    """
+    if isinstance(filenames, basestring):
+        filenames = [filenames]
+    logger = logging.getLogger('LimaTestSuite')
+
+    groups = group_by_detector(filenames, tango)
+    args = [(group, debug, tango, events, fresh, pattern, trace)
+            for group in groups]
+    if jobs is None:
+        jobs = len(groups)
+    if len(groups) > 1 and jobs > 1:
+        logger.info('Running %d detector suite(s) with %d worker(s)' %
+                    (len(groups), jobs))
+        workers = multiprocessing.Pool(jobs)
+        try:
+            summaries = workers.map(_run_suite_worker, args)
+        finally:
+            workers.close()
+            workers.join()
+    else:
+        summaries = [run_suite(*a) for a in args]
+
+    # Merge the results of all the suites
+    report = LimaPerformanceReport()
+    errors = []
+    failures = []
+    write_stats = {'sent': 0, 'saved': 0}
+    for summary in summaries:
+        errors.extend(summary['errors'])
+        failures.extend(summary['failures'])
+        report.records.extend(summary['records'])
+        report.runs.extend(summary['runs'])
+        report.tables.extend(summary['tables'])
+        for key, value in summary['write_stats'].items():
+            write_stats[key] += value
+
+    logger.info('Results: Error(s) = %d, Failure(s) = %d' % (len(errors),
+                                                             len(failures)))
+    for name, fail in failures:
+        logger.info(fail.split("\n")[-2])
+    logger.info('Configuration writes: %(sent)d sent, %(saved)d saved' %
+                write_stats)
+    report.log_summary()
+
+    regressions = []
+    if results:
+        store = LimaResultsStore(results)
+        if baseline:
+            regressions = store.compare(report.runs, tolerance)
+            logger.info('Baseline: %d performance regression(s)' %
+                        len(regressions))
+            for regression in regressions:
+                logger.info(regression)
+        store.append(report.runs)
+        logger.info('Results stored in %s' % results)
+
+    return not (errors or failures or regressions)
 
 
 def run():
@@ -55,7 +347,8 @@ def run():
     epilog = 'ctbeamlines@cells.es'
 
     parser = argparse.ArgumentParser(description=description, epilog=epilog)
-    parser.add_argument("config_file", type=str, help="Test configuration file")
+    parser.add_argument("config_file", type=str, nargs='+',
+                        help="Test configuration file(s)")
     parser.add_argument("--log-level", type=str, help="Activate debug")
     parser.add_argument("--path", "-p", type=str, help="Output log folder",
                         default="")
@@ -64,16 +357,58 @@ def run():
     parser.add_argument("--debug-core", "-d", dest='debug_core',
                         action="store_true",
                         help="Active the tango testing layer")
+    parser.add_argument("--events", "-e", action="store_true",
+                        help="Wait for the detector notifications instead "
+                             "of polling the status every acquisition time")
+    parser.add_argument("--fresh-detector", dest='fresh_detector',
+                        action="store_true",
+                        help="Create the detector again for every test "
+                             "instead of reusing it during the whole suite")
+    parser.add_argument("--jobs", "-j", type=int, default=None,
+                        help="Maximum number of detectors tested in parallel "
+                             "(default: one worker per detector)")
+    parser.add_argument("--results", "-r", type=str, default=None,
+                        help="JSON lines file where the results of each test "
+                             "run are stored (default: "
+                             "lima_ts_results.jsonl in the log folder)")
+    parser.add_argument("--baseline", "-b", action="store_true",
+                        help="Compare the run with the stored results and "
+                             "fail if a metric degrades more than the "
+                             "tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.1,
+                        help="Allowed relative degradation of a metric "
+                             "(default: 0.1)")
+    parser.add_argument("--list", "-l", dest='list_tests', action="store_true",
+                        help="List the planned tests and exit")
+    parser.add_argument("--dry-run", "-n", dest='dry_run', action="store_true",
+                        help="List the planned tests with the estimated "
+                             "acquisition time and data volume and exit")
+    parser.add_argument("-k", dest='pattern', type=str, default=None,
+                        help="Only run the tests whose name matches the "
+                             "pattern (substring or shell wildcards)")
+    parser.add_argument("--trace", action="store_true",
+                        help="Trace the test and detector calls and write a "
+                             "Chrome trace (<test folder>_trace.json) for "
+                             "each test run")
 
     args = parser.parse_args()
     if args.log_level == 'debug':
         logger = logging.getLogger('LimaTestSuite')
         logger.setLevel(logging.DEBUG)
+    if args.list_tests or args.dry_run:
+        ok = list_tests(args.config_file, args.pattern, args.dry_run)
+        sys.exit(0 if ok else 1)
     path = args.path
     filename = "lima_ts_{0}.log".format(_str_date_now())
     filename = os.path.join(path, filename)
     logging.basicConfig(filename=filename)
-    run_test(args.config_file, args.debug_core, args.tango)
+    results = args.results
+    if results is None:
+        results = os.path.join(path, 'lima_ts_results.jsonl')
+    ok = run_test(args.config_file, args.debug_core, args.tango, args.events,
+                  args.fresh_detector, args.jobs, results, args.baseline,
+                  args.tolerance, args.pattern, args.trace)
+    sys.exit(0 if ok else 1)
 
 if __name__ == "__main__":
     run()
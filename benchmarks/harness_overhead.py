@@ -0,0 +1,149 @@
+"""
+Measure the overhead added by the test suite itself, using the in-process
+Fake detector so no Lima installation nor hardware is needed.
+
+* Per-test overhead: wall-clock time of a whole acquisition test (setUp,
+  runTest and tearDown) minus the ideal acquisition time of the frames.
+* Per-poll overhead: cost of one status reading (LimaDetector.snapshot)
+  and number of polls done by the acquisition monitor loop.
+
+Usage: python benchmarks/harness_overhead.py [--frames N] [--expo T] ...
+
+It can be run from a source checkout without installing the suite.
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+import tempfile
+import unittest
+
+# Use the suite of the checkout this script belongs to
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from LimaTestSuite.LimaConfigHelper import LimaTestConfiguration
+from LimaTestSuite.LimaDetectorPool import LimaDetectorPool
+from LimaTestSuite.LimaTestCase import LimaCCDAcquisitionTest
+
+
+class _PollCountingTest(LimaCCDAcquisitionTest):
+    def run_acquisition(self):
+        self.polls = 0
+        super(_PollCountingTest, self).run_acquisition()
+
+    def on_poll(self, now, last_acq, last_saved):
+        self.polls += 1
+
+
+def _mean(values):
+    return sum(values) / float(len(values))
+
+
+def get_config(name, base_dir, frames, expo, write_files):
+    acq = {'acqExpoTime': expo,
+           'acqNbFrames': frames,
+           'acqMode': 'Single',
+           'accMaxExpoTime': 1.0,
+           'concatNbFrames': 0,
+           'triggerMode': 'Internal',
+           'latencyTime': 0.0,
+           }
+    saving = {'prefix': 'img_',
+              'suffix': '.raw',
+              'nextNumber': 1,
+              'fileFormat': 'raw',
+              'savingMode': 'auto_frame',
+              'overwritePolicy': 'overwrite',
+              'framesPerFile': 1,
+              'nbframes': 0,
+              }
+    det_params = {'width': 64, 'height': 64, 'depth': 2,
+                  'writeFiles': write_files}
+    return LimaTestConfiguration(name, 'acquisition', 1, 'FakeDetector', None,
+                                 None, acq, saving, None, base_dir=base_dir,
+                                 det_params=det_params)
+
+
+def measure_tests(args, base_dir):
+    pool = LimaDetectorPool(fresh=args.fresh)
+    result = unittest.TestResult()
+    walls = []
+    polls = []
+    phases = {}
+    for i in range(args.tests):
+        config = get_config('overhead%d' % i, base_dir, args.frames,
+                            args.expo, args.write_files)
+        test = _PollCountingTest(config, events=args.events, pool=pool)
+        t0 = time.time()
+        test.run(result)
+        walls.append(time.time() - t0)
+        polls.append(test.polls)
+        for phase, duration in test.timings.items():
+            phases.setdefault(phase, []).append(duration)
+    pool.close()
+    if result.errors or result.failures:
+        for _, tb in result.errors + result.failures:
+            print(tb)
+        raise RuntimeError('The benchmark tests did not pass')
+    return walls, polls, phases
+
+
+def measure_polls(args, base_dir):
+    pool = LimaDetectorPool()
+    detector = pool.get(get_config('polls', base_dir, 1, args.expo, False))
+    t0 = time.time()
+    for i in range(args.polls):
+        detector.snapshot()
+    elapsed = time.time() - t0
+    pool.close()
+    return elapsed / args.polls
+
+
+def run():
+    description = __doc__.strip().split('\n')[0]
+    parser = argparse.ArgumentParser(description=description)
+    parser.add_argument('--frames', type=int, default=100,
+                        help='Frames per test (default: 100)')
+    parser.add_argument('--expo', type=float, default=0.001,
+                        help='Exposure time in seconds (default: 0.001)')
+    parser.add_argument('--tests', type=int, default=10,
+                        help='Number of tests (default: 10)')
+    parser.add_argument('--polls', type=int, default=10000,
+                        help='Number of status readings (default: 10000)')
+    parser.add_argument('--events', action='store_true',
+                        help='Use the event-driven monitoring')
+    parser.add_argument('--fresh', action='store_true',
+                        help='Create the detector for every test')
+    parser.add_argument('--write-files', dest='write_files',
+                        action='store_true',
+                        help='Let the Fake detector write the files')
+    args = parser.parse_args()
+    logging.getLogger('LimaTestSuite').setLevel(logging.WARNING)
+
+    base_dir = tempfile.mkdtemp(prefix='lima_overhead_')
+    try:
+        walls, polls, phases = measure_tests(args, base_dir)
+        poll_cost = measure_polls(args, base_dir)
+    finally:
+        shutil.rmtree(base_dir)
+
+    ideal = args.frames * args.expo
+    overheads = [w - ideal for w in walls]
+    print('Tests: %d x %d frames of %g s (ideal %.4f s per test)' %
+          (args.tests, args.frames, args.expo, ideal))
+    print('Per-test wall time:  mean %.4f s, max %.4f s' %
+          (_mean(walls), max(walls)))
+    print('Per-test overhead:   mean %.4f s, max %.4f s' %
+          (_mean(overheads), max(overheads)))
+    for phase in ('setup', 'prepare_acq', 'start', 'acquisition', 'teardown'):
+        if phase in phases:
+            print('  %-12s mean %.4f s' % (phase, _mean(phases[phase])))
+    print('Polls per test:      mean %.1f' % _mean(polls))
+    print('Per-poll cost:       %.2f us (snapshot)' % (poll_cost * 1e6))
+
+
+if __name__ == '__main__':
+    run()
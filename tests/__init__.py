@@ -0,0 +1,6 @@
+"""
+Unit tests of the test suite itself. They only need the Fake detector
+(NumPy for the statistics and the image decoding):
+
+    python -m unittest discover -s tests
+"""
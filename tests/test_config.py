@@ -0,0 +1,65 @@
+import os
+import unittest
+from LimaTestSuite.LimaConfigHelper import LimaTestParser, parse_sweep, \
+    _convert
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'examples')
+
+
+class ParseSweepTest(unittest.TestCase):
+
+    def test_not_a_sweep(self):
+        self.assertIsNone(parse_sweep('0.1'))
+
+    def test_list(self):
+        self.assertEqual(parse_sweep('[1x1, 2x2 , 4x4]'),
+                         ['1x1', '2x2', '4x4'])
+
+    def test_linear(self):
+        self.assertEqual(parse_sweep('sweep(1, 3, 3)'), [1.0, 2.0, 3.0])
+
+    def test_log(self):
+        values = parse_sweep('sweep(0.001, 0.1, 3, log)')
+        for value, expected in zip(values, [0.001, 0.01, 0.1]):
+            self.assertAlmostEqual(value, expected)
+
+    def test_single_point(self):
+        self.assertEqual(parse_sweep('sweep(5, 10, 1)'), [5.0])
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, parse_sweep, 'sweep(1, 2)')
+        self.assertRaises(ValueError, parse_sweep, 'sweep(0, 1, 3, log)')
+        self.assertRaises(ValueError, parse_sweep, 'sweep(1, 2, 3, cubic)')
+
+
+class ConvertTest(unittest.TestCase):
+
+    def test_int_from_float(self):
+        self.assertEqual(_convert(int, 2.6), 3)
+
+    def test_other(self):
+        self.assertEqual(_convert(float, '0.5'), 0.5)
+        self.assertEqual(_convert(str, 1), '1')
+
+
+class ParserTest(unittest.TestCase):
+
+    def test_fake_example(self):
+        parser = LimaTestParser(os.path.join(EXAMPLES, 'test_fake.cfg'))
+        tests = list(parser.get_tests())
+        names = [t.name for t in tests]
+        self.assertIn('Performance', names)
+        # The ImageSweep section is expanded to 3 binnings x 2 ROIs
+        sweep = [t for t in tests if t.section == 'ImageSweep']
+        self.assertEqual(len(sweep), 6)
+        performance = tests[names.index('Performance')]
+        self.assertEqual(performance.warmup, 1)
+        self.assertEqual(performance.ci_target, 0.05)
+
+    def test_detector_key(self):
+        parser = LimaTestParser(os.path.join(EXAMPLES, 'test_fake.cfg'))
+        det_type, host, port, device_name = parser.get_detector()
+        self.assertEqual(parser.get_detector_key(), (det_type, host, port))
+        self.assertEqual(parser.get_detector_key(tango_mode=True),
+                         (device_name,))
@@ -0,0 +1,32 @@
+import os
+import unittest
+from LimaTestSuite.LimaConfigHelper import LimaTestParser
+from LimaTestSuite import LimaEstimate
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), 'examples')
+
+
+class EstimateTest(unittest.TestCase):
+
+    def setUp(self):
+        parser = LimaTestParser(os.path.join(EXAMPLES, 'test_fake.cfg'))
+        self.tests = dict((t.name, t) for t in parser.get_tests())
+
+    def test_all_types(self):
+        for test in self.tests.values():
+            seconds, nbytes = LimaEstimate.estimate_test(test)
+            self.assertTrue(seconds >= 0, test.name)
+
+    def test_soak(self):
+        test = self.tests['Soak']
+        frames = test.acq_params['acqNbFrames']
+        seconds, nbytes = LimaEstimate.estimate_soak(test)
+        self.assertAlmostEqual(seconds, frames * test.test_params[
+            'soakCycles'] * LimaEstimate.get_frame_time(test))
+
+    def test_unknown_frame_size(self):
+        test = self.tests['Soak']
+        for key in ('width', 'height', 'depth'):
+            test.det_params.pop(key, None)
+        self.assertIsNone(LimaEstimate.estimate_test(test)[1])
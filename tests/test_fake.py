@@ -0,0 +1,145 @@
+import shutil
+import tempfile
+import unittest
+from LimaTestSuite import LimaFakeCore
+from LimaTestSuite.LimaConfigHelper import LimaTestConfiguration
+from LimaTestSuite.LimaDetectorPool import LimaDetectorPool
+# The module is imported, not its classes, so that the test loader does
+# not collect the suite test cases
+from LimaTestSuite import LimaTestCase
+
+
+def get_config(name, base_dir, ttype='acquisition', test_params=None):
+    acq = {'acqExpoTime': 0.001,
+           'acqNbFrames': 20,
+           'acqMode': 'Single',
+           'accMaxExpoTime': 1.0,
+           'concatNbFrames': 0,
+           'triggerMode': 'Internal',
+           'latencyTime': 0.0,
+           }
+    saving = {'prefix': 'img_',
+              'suffix': '.edf',
+              'nextNumber': 1,
+              'fileFormat': 'edf',
+              'savingMode': 'auto_frame',
+              'overwritePolicy': 'overwrite',
+              'framesPerFile': 5,
+              'nbframes': 0,
+              }
+    det_params = {'width': 64, 'height': 64, 'depth': 2}
+    return LimaTestConfiguration(name, ttype, 1, 'FakeDetector', None, None,
+                                 acq, saving, None, test_params,
+                                 base_dir=base_dir, det_params=det_params)
+
+
+class FakeSmokeTest(unittest.TestCase):
+    """
+    Runs the suite test cases against the Fake detector.
+    """
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.pool = LimaDetectorPool()
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.base_dir)
+
+    def run_case(self, case):
+        result = unittest.TestResult()
+        case.run(result)
+        problems = result.errors + result.failures
+        self.assertEqual(problems, [], '\n'.join(tb for _, tb in problems))
+        return case
+
+    def test_acquisition(self):
+        config = get_config('acquisition', self.base_dir,
+                            test_params={'verify': True})
+        self.run_case(LimaTestCase.LimaCCDAcquisitionTest(config,
+                                                          pool=self.pool))
+
+    def test_events(self):
+        config = get_config('events', self.base_dir)
+        self.run_case(LimaTestCase.LimaCCDAcquisitionTest(
+            config, events=True, pool=self.pool))
+
+    def test_abort(self):
+        config = get_config('abort', self.base_dir, 'abort',
+                            {'abortAfterFrames': 5, 'iterations': 3})
+        case = self.run_case(LimaTestCase.LimaCCDAcquisitionTest(
+            config, abort=True, pool=self.pool))
+        self.assertIn('stop_to_ready_p50', case.metrics)
+
+    def test_performance(self):
+        config = get_config('performance', self.base_dir, 'performance')
+        case = self.run_case(LimaTestCase.LimaCCDPerformanceTest(
+            config, pool=self.pool))
+        self.assertEqual(case.metrics['frames'], 20)
+        self.assertTrue(case.metrics['saved_fps'] > 0)
+        # 4 EDF files of 5 frames of 64x64 pixels, plus the headers
+        self.assertTrue(case.metrics['mb_written'] * 1024 ** 2 >
+                        20 * 64 * 64 * 2)
+
+    def test_next_number(self):
+        # Like Lima, the next file number advances after an acquisition, the
+        # pooled detector must write it again for the next test
+        for _ in range(2):
+            config = get_config('next_number', self.base_dir,
+                                test_params={'verify': True})
+            config.saving_params['directory'] = self.base_dir
+            self.run_case(LimaTestCase.LimaCCDAcquisitionTest(
+                config, pool=self.pool))
+
+
+class FakeImageTest(unittest.TestCase):
+
+    def setUp(self):
+        hwi = LimaFakeCore.FakeInterface(1024, 1024, 2)
+        self.image = LimaFakeCore.CtControl(hwi).image()
+
+    def test_roi_in_binned_image(self):
+        self.image.setBin(LimaFakeCore.Bin(4, 4))
+        self.image.setRoi(LimaFakeCore.Roi(0, 0, 256, 256))
+        self.assertEqual(self.image.getImageDim().getSize(), (256, 256))
+
+    def test_roi_out_of_bounds(self):
+        self.image.setBin(LimaFakeCore.Bin(4, 4))
+        self.assertRaises(ValueError, self.image.setRoi,
+                          LimaFakeCore.Roi(0, 0, 512, 512))
+
+
+class SoakAnalyseTest(unittest.TestCase):
+
+    def setUp(self):
+        config = get_config('soak', tempfile.gettempdir(), 'soak')
+        self.case = LimaTestCase.LimaCCDSoakTest(config,
+                                                 pool=LimaDetectorPool())
+
+    def set_cycles(self, fps, cycle_time=1.0):
+        self.case.cycles = [{'cycle': i, 't': (i + 1) * cycle_time,
+                             'rss': 1024 ** 2, 'fds': 10, 'threads': 4,
+                             'acq_fps': 500.0, 'saved_fps': value}
+                            for i, value in enumerate(fps)]
+
+    def test_slow_cycles_ignored(self):
+        # A few slow cycles do not move the medians of the windows
+        self.set_cycles([400.0, 500.0, 250.0, 500.0, 500.0, 500.0, 500.0,
+                         260.0, 500.0, 500.0, 500.0, 300.0, 500.0])
+        summary, problems, notes = self.case.analyse()
+        self.assertEqual(problems, [])
+        self.assertEqual(notes, [])
+        self.assertAlmostEqual(summary['saved_fps_change'], 0.0)
+
+    def test_degradation(self):
+        self.set_cycles([500.0 - 20 * i for i in range(13)])
+        summary, problems, notes = self.case.analyse()
+        self.assertEqual(len(problems), 1)
+        self.assertTrue(summary['saved_fps_change'] < -10)
+
+    def test_short_cycles_not_checked(self):
+        self.set_cycles([500.0 - 20 * i for i in range(13)], 0.05)
+        summary, problems, notes = self.case.analyse()
+        self.assertEqual(problems, [])
+        self.assertEqual(len(notes), 1)
+        self.assertNotIn('saved_fps_change', summary)
@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+from LimaTestSuite.LimaFileVerifier import LimaFileVerifier
+
+
+def _edf_frame(size):
+    header = '{\nHeaderID = EH:000001:000000:000000 ;\nSize = %d ;\n' % size
+    return header + '}\n' + '\0' * size
+
+
+class FileVerifierTest(unittest.TestCase):
+
+    FRAME_SIZE = 64
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_verifier(self, fmt, suffix, frames, frames_per_file):
+        saving = {'directory': self.directory, 'prefix': 'img_',
+                  'suffix': suffix, 'nextNumber': 1,
+                  'framesPerFile': frames_per_file, 'fileFormat': fmt}
+        return LimaFileVerifier(saving, frames, self.FRAME_SIZE)
+
+    def write(self, filename, data):
+        with open(os.path.join(self.directory, filename), 'wb') as f:
+            f.write(data)
+
+    def test_expected_files(self):
+        verifier = self.get_verifier('EDF', '.edf', 25, 10)
+        self.assertEqual(verifier.expected_files(),
+                         [('img_0001.edf', 10), ('img_0002.edf', 10),
+                          ('img_0003.edf', 5)])
+
+    def test_edf(self):
+        self.write('img_0001.edf', _edf_frame(self.FRAME_SIZE) * 2)
+        self.write('img_0002.edf', _edf_frame(self.FRAME_SIZE))
+        verifier = self.get_verifier('EDF', '.edf', 3, 2)
+        self.assertEqual(verifier.verify(), [])
+
+    def test_edf_errors(self):
+        # Truncated frame, missing file and unexpected file
+        self.write('img_0001.edf', _edf_frame(self.FRAME_SIZE)[:-1])
+        self.write('img_0003.edf', _edf_frame(self.FRAME_SIZE))
+        errors = self.get_verifier('EDF', '.edf', 2, 1).verify()
+        self.assertEqual(sorted(errors),
+                         ['img_0001.edf: EDF frame 0 is truncated',
+                          'img_0002.edf: file not found',
+                          'img_0003.edf: unexpected file'])
+
+    def test_raw(self):
+        self.write('img_0001.raw', '\0' * self.FRAME_SIZE * 2)
+        self.write('img_0002.raw', '\0' * (self.FRAME_SIZE - 1))
+        errors = self.get_verifier('RAW', '.raw', 3, 2).verify()
+        self.assertEqual(errors, ['img_0002.raw: size %d, expected %d' %
+                                  (self.FRAME_SIZE - 1, self.FRAME_SIZE)])
+
+    def test_magic(self):
+        self.write('img_0001.edf.gz', '\x1f\x8b\x08')
+        self.write('img_0002.edf.gz', 'not gzip')
+        errors = self.get_verifier('EDF_GZ', '.edf.gz', 2, 1).verify()
+        self.assertEqual(errors, ['img_0002.edf.gz: not a valid gzip file'])
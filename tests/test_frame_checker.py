@@ -0,0 +1,48 @@
+import unittest
+import numpy
+from LimaTestSuite.LimaFrameChecker import LimaFrameChecker
+
+
+class _Detector(object):
+    """
+    Detector whose frame n has all its pixels equal to n + 1, except the
+    first pixel which is 0 (dead) and the last one which is saturated.
+    """
+
+    def read_images(self, first, count):
+        data = numpy.empty((count, 4, 4), 'uint16')
+        for i in range(count):
+            data[i] = first + i + 1
+        data[:, 0, 0] = 0
+        data[:, -1, -1] = 0xffff
+        return data
+
+
+class FrameCheckerTest(unittest.TestCase):
+
+    def test_stats(self):
+        checker = LimaFrameChecker(_Detector(), batch=3)
+        checker.update(4)
+        self.assertEqual(checker.check(10), [])
+        stats = checker.get_stats()
+        self.assertEqual(stats['frames_checked'], 10)
+        means = [(14 * (n + 1) + 0xffff) / 16.0 for n in range(10)]
+        self.assertAlmostEqual(stats['avg_mean'], sum(means) / 10)
+        self.assertEqual(stats['min_value'], 0)
+        self.assertEqual(stats['max_value'], 0xffff)
+        self.assertEqual(stats['saturated_pixels'], 10)
+        self.assertEqual(stats['dead_pixels'], 10)
+
+    def test_limits(self):
+        checker = LimaFrameChecker(_Detector(), max_saturated=0, max_dead=0)
+        errors = checker.check(2)
+        self.assertEqual(len(errors), 4)
+
+    def test_repeated_frame(self):
+        checker = LimaFrameChecker(_Detector())
+        checker.check_batch(0, _Detector().read_images(0, 1))
+        checker.check_batch(1, _Detector().read_images(0, 1))
+        self.assertEqual(checker.errors, ['frame 1: same content as frame 0'])
+
+    def test_no_frames(self):
+        self.assertEqual(LimaFrameChecker(_Detector()).get_stats(), {})
@@ -0,0 +1,44 @@
+import os
+import shutil
+import tempfile
+import unittest
+from LimaTestSuite.LimaResults import LimaResultsStore
+
+
+def _record(saved_fps, passed=True, name='Performance'):
+    return {'name': name, 'config_hash': 'abc', 'det_type': 'FakeDetector',
+            'tango': False, 'passed': passed,
+            'metrics': {'saved_fps': saved_fps}}
+
+
+class ResultsStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.store = LimaResultsStore(os.path.join(self.directory,
+                                                   'results.jsonl'))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_load(self):
+        self.assertEqual(self.store.load(), [])
+        self.store.append([_record(100.0), _record(110.0)])
+        self.assertEqual(len(self.store.load()), 2)
+
+    def test_baseline_median_of_passed_runs(self):
+        history = [_record(100.0), _record(120.0), _record(110.0),
+                   _record(1.0, passed=False)]
+        baselines = self.store.get_baselines(history)
+        key = ('Performance', 'abc', 'FakeDetector', False)
+        self.assertEqual(baselines[key], {'saved_fps': 110.0})
+
+    def test_compare(self):
+        self.store.append([_record(100.0), _record(100.0)])
+        self.assertEqual(self.store.compare([_record(95.0)], 0.1), [])
+        regressions = self.store.compare([_record(80.0)], 0.1)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('saved_fps', regressions[0])
+        # A test without history is not compared
+        self.assertEqual(self.store.compare([_record(1.0, name='New')], 0.1),
+                         [])
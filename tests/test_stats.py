@@ -0,0 +1,75 @@
+import unittest
+from LimaTestSuite.LimaStats import percentile, linear_fit, repeat_stats, \
+    t_quantile_95
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertIsNone(percentile([], 50))
+
+    def test_interpolation(self):
+        values = [4, 1, 3, 2]
+        self.assertEqual(percentile(values, 0), 1)
+        self.assertEqual(percentile(values, 100), 4)
+        self.assertAlmostEqual(percentile(values, 50), 2.5)
+        self.assertAlmostEqual(percentile(values, 90), 3.7)
+
+
+class LinearFitTest(unittest.TestCase):
+
+    def test_line(self):
+        slope, intercept = linear_fit([0, 1, 2, 3], [1, 3, 5, 7])
+        self.assertAlmostEqual(slope, 2.0)
+        self.assertAlmostEqual(intercept, 1.0)
+
+    def test_constant_x(self):
+        self.assertEqual(linear_fit([1, 1], [2, 4]), (0.0, 3.0))
+
+
+class RepeatStatsTest(unittest.TestCase):
+
+    def test_stats(self):
+        stats = repeat_stats([10.0, 12.0, 11.0])
+        self.assertEqual(stats['n'], 3)
+        self.assertAlmostEqual(stats['mean'], 11.0)
+        self.assertAlmostEqual(stats['std'], 1.0)
+        self.assertAlmostEqual(stats['ci95'], 4.303 / 3 ** 0.5)
+        self.assertAlmostEqual(stats['rel_ci'], stats['ci95'] / 11.0)
+        self.assertEqual(stats['outliers'], [])
+
+    def test_outlier(self):
+        stats = repeat_stats([100, 101, 99, 100, 102, 10])
+        self.assertEqual(stats['outliers'], [5])
+        self.assertEqual(stats['n'], 5)
+        self.assertEqual(stats['min'], 99)
+
+    def test_mad_floor(self):
+        # The MAD of almost equal values does not reject a run 2% apart
+        stats = repeat_stats([100.0, 100.0, 100.0, 100.1, 100.0, 102.0])
+        self.assertEqual(stats['outliers'], [])
+
+    def test_rejection_cap(self):
+        stats = repeat_stats([100.0, 100.0, 100.0, 100.0, 100.0, 50.0, 60.0,
+                              70.0])
+        self.assertEqual(stats['outliers'], [5, 6, 7])
+        # Only the 3 furthest of 8 values may be rejected
+        stats = repeat_stats(range(1, 9), threshold=0.1)
+        self.assertEqual(stats['outliers'], [0, 1, 7])
+        self.assertEqual(stats['n'], 5)
+
+    def test_no_threshold(self):
+        stats = repeat_stats([100, 101, 99, 100, 102, 10], threshold=None)
+        self.assertEqual(stats['outliers'], [])
+        self.assertEqual(stats['n'], 6)
+
+    def test_single_value(self):
+        stats = repeat_stats([5])
+        self.assertIsNone(stats['std'])
+        self.assertIsNone(stats['ci95'])
+
+    def test_t_quantile(self):
+        self.assertEqual(t_quantile_95(1), 12.706)
+        self.assertEqual(t_quantile_95(35), 2.042)
+        self.assertEqual(t_quantile_95(1000), 1.960)
+        self.assertIsNone(t_quantile_95(0))
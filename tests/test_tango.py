@@ -0,0 +1,97 @@
+import struct
+import logging
+import unittest
+try:
+    import numpy
+    import PyTango
+    from LimaTestSuite.LimaTangoDetector import decode_data_array, \
+        DATA_ARRAY_HEADER, DATA_ARRAY_MAGIC, LimaTangoDetector
+except ImportError:
+    decode_data_array = None
+
+
+def _encode(image, big_endian=False):
+    """
+    Encode a (frames, height, width) uint16 array like the LimaCCDs image
+    commands.
+    """
+    frames, height, width = image.shape
+    dims = [width, height, frames] if frames > 1 else [width, height]
+    nb_dim = len(dims)
+    dims += [0] * (6 - nb_dim)
+    header_size = struct.calcsize(DATA_ARRAY_HEADER)
+    header = struct.pack(DATA_ARRAY_HEADER, DATA_ARRAY_MAGIC, 2, header_size,
+                         0, 2, int(big_endian), nb_dim, *(dims + [0] * 6))
+    data = image.astype('>u2' if big_endian else '<u2').tostring()
+    return 'DATA_ARRAY', header + data
+
+
+@unittest.skipIf(decode_data_array is None, 'PyTango and NumPy are needed')
+class DecodeDataArrayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.image = numpy.arange(2 * 3 * 4, dtype='uint16').reshape(2, 3, 4)
+
+    def test_sequence(self):
+        decoded = decode_data_array(_encode(self.image))
+        self.assertEqual(decoded.shape, (2, 3, 4))
+        self.assertTrue((decoded == self.image).all())
+
+    def test_single_frame_big_endian(self):
+        decoded = decode_data_array(_encode(self.image[:1], True))
+        self.assertEqual(decoded.shape, (1, 3, 4))
+        self.assertTrue((decoded == self.image[:1]).all())
+
+    def test_out(self):
+        out = numpy.zeros((4, 3, 4), 'uint16')
+        decoded = decode_data_array(_encode(self.image), out)
+        self.assertEqual(decoded.shape, (2, 3, 4))
+        self.assertTrue((out[:2] == self.image).all())
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, decode_data_array,
+                          ('VIDEO_IMAGE', _encode(self.image)[1]))
+
+
+class _EventDevice(object):
+    """
+    Device which pushes the change events of the given attributes only.
+    """
+
+    def __init__(self, attrs):
+        self.attrs = attrs
+        self.subscribed = set()
+
+    def subscribe_event(self, attr, event_type, callback):
+        if attr not in self.attrs:
+            raise PyTango.DevFailed()
+        self.subscribed.add(attr)
+        return attr
+
+    def unsubscribe_event(self, event_id):
+        self.subscribed.remove(event_id)
+
+
+@unittest.skipIf(decode_data_array is None, 'PyTango and NumPy are needed')
+class EventsTest(unittest.TestCase):
+
+    def get_detector(self, attrs):
+        # The device is not created, only the event handling is used
+        detector = LimaTangoDetector.__new__(LimaTangoDetector)
+        detector.logger = logging.getLogger('LimaTestSuite')
+        detector.device = _EventDevice(attrs)
+        detector._event_ids = []
+        return detector
+
+    def test_enable(self):
+        detector = self.get_detector(LimaTangoDetector._event_attrs)
+        self.assertTrue(detector.enable_events())
+        self.assertEqual(detector.device.subscribed,
+                         set(LimaTangoDetector._event_attrs))
+
+    def test_no_events(self):
+        # The events already subscribed are released
+        detector = self.get_detector(LimaTangoDetector._event_attrs[:1])
+        self.assertFalse(detector.enable_events())
+        self.assertEqual(detector.device.subscribed, set())
+        self.assertEqual(detector._event_ids, [])